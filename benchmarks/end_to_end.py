@@ -0,0 +1,229 @@
+"""
+End-to-end benchmark against the local mock provider server.
+
+Starts benchmarks.mock_providers.MockProviderServer, points the OpenAI, Anthropic, Gemini,
+Perplexity, OpenAI-compatible and Vimeo clients of core_logic.handlers at it and times
+
+- clean_vtt_or_srt on generated WebVTT and SRT transcripts of --minutes,
+- fetch_vimeo_transcript through the API (with a token) and the player config, cache bypassed,
+- prompt building + execute_llm_completions per model family, with --history-turns of chat
+  history and the completion cache bypassed,
+
+and prints p50/p95/p99 latency and throughput per scenario. For the network scenarios the mean
+time the mock server spent per call is subtracted from the mean latency to give the app's own
+overhead; --latency 0 --tokens-per-second 0 leaves the overhead alone. Runs offline; with the
+same arguments (and --seed) runs see the same payloads and delays and can be compared.
+
+Outside `streamlit run` st.session_state is always empty, so the app gets a plain dict as its
+session. The Gemini SDK talks gRPC, so its handler is given MockGeminiClient, which sends the
+SDK's requests to the mock as Gemini REST calls.
+
+Usage:
+    python -m benchmarks.end_to_end --iterations 50 --concurrency 4 --latency 0.2 --json results.json
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import httpx
+from google.ai import generativelanguage as glm
+
+from benchmarks.mock_providers import MockProviderServer, synthetic_srt, synthetic_vtt, completion_text
+from core_logic import handlers, main as app
+from core_logic.batch import load_app_config, default_field_values, DEFAULT_APP, DEFAULT_PHASE
+from core_logic.tokens import trim_to_tokens
+
+DEFAULT_MODELS = {
+    "openai": "gpt-4o-mini",
+    "claude": "claude-haiku",
+    "gemini": "gemini-1.5-flash",
+    "perplexity": "sonar",
+    "openai_compatible": "local-llama-3.1-8b",
+}
+MOCK_API_KEY = "mock-key"
+MOCK_VIMEO_URL = "https://vimeo.com/76979871"
+
+
+class MockGeminiClient:
+    """Stand-in for glm.GenerativeServiceAsyncClient sending generate_content as a REST call."""
+
+    def __init__(self, base_url, api_key):
+        self._http = httpx.AsyncClient(base_url=base_url, headers={"x-goog-api-key": api_key}, timeout=600)
+
+    async def generate_content(self, request, **kwargs):
+        response = await self._http.post(f"/v1beta/{request.model}:generateContent",
+                                         content=type(request).to_json(request),
+                                         headers={"content-type": "application/json"})
+        response.raise_for_status()
+        return glm.GenerateContentResponse.from_json(response.text, ignore_unknown_fields=True)
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+@contextlib.contextmanager
+def mock_environment(server, session):
+    """Point every provider and Vimeo client at the mock server and use `session` as st.session_state."""
+    keys = {f"{service.upper()}_API_KEY": MOCK_API_KEY for service in ("openai", "claude", "google", "perplexity")}
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(mock.patch.dict(os.environ, {**keys, "OPENAI_BASE_URL": f"{server.url}/v1",
+                                                         "ANTHROPIC_BASE_URL": server.url}))
+        stack.enter_context(mock.patch.object(handlers, "PERPLEXITY_URL", f"{server.url}/chat/completions"))
+        stack.enter_context(mock.patch.object(handlers, "new_gemini_client",
+                                              lambda api_key: MockGeminiClient(server.url, api_key)))
+        stack.enter_context(mock.patch.object(handlers, "VIMEO_API_URL", server.url))
+        stack.enter_context(mock.patch.object(handlers, "VIMEO_PLAYER_URL", server.url))
+        stack.enter_context(mock.patch.object(app.st, "session_state", session))
+        yield
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of a list of samples."""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_scenario(name, call, iterations, concurrency=1, warmup=0, server=None):
+    """Time `iterations` calls of call() on `concurrency` threads and return the result dict."""
+    for _ in range(warmup):
+        with contextlib.suppress(Exception):
+            call()
+    served_before = len(server.served()) if server else 0
+    latencies = []
+    errors = []
+
+    def timed(_):
+        started = time.perf_counter()
+        try:
+            call()
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+            return
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        list(executor.map(timed, range(iterations)))
+    elapsed = time.perf_counter() - started
+
+    result = {"scenario": name, "calls": len(latencies), "errors": len(errors),
+              "throughput": len(latencies) / elapsed if elapsed else 0.0}
+    if errors:
+        result["first_error"] = errors[0]
+    if latencies:
+        result.update(p50=percentile(latencies, 50), p95=percentile(latencies, 95), p99=percentile(latencies, 99),
+                      mean=statistics.fmean(latencies))
+        if server:
+            server_time = sum(seconds for _, seconds in server.served()[served_before:])
+            result["server_mean"] = server_time / len(latencies)
+            result["overhead_mean"] = result["mean"] - result["server_mean"]
+    return result
+
+
+def completion_call(app_config, phase_name, model, session, transcript, history_turns, server):
+    """Select `model` in the session and return a call building the phase prompt and running
+    execute_llm_completions."""
+    phase = app_config["PHASES"][phase_name]
+    user_input = {**default_field_values(phase["fields"]), "topic_content": transcript}
+    overrides = {"base_url": f"{server.url}/v1"} if app.LLM_CONFIG[model]["family"] == "openai_compatible" else {}
+    session.update(selected_llm=model, llm_config=overrides, chat_history=[
+        {"user": transcript, "assistant": completion_text(server.output_tokens)} for _ in range(history_turns)])
+
+    def call():
+        user_prompt = app.format_user_prompt(phase.get("user_prompt", ""), user_input, phase_name,
+                                             app_config["PHASES"])
+        return app.execute_llm_completions(app_config.get("SYSTEM_PROMPT", ""), model,
+                                           phase.get("phase_instructions", ""), user_prompt, use_cache=False)
+
+    return call
+
+
+def print_report(results):
+    print(f"{'scenario':<42} {'calls':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'calls/s':>9} {'overhead ms':>12}")
+    for r in results:
+        if not r["calls"]:
+            print(f"{r['scenario']:<42} {0:>6} {r['errors']:>4}  {r.get('first_error', '')}")
+            continue
+        overhead = f"{r['overhead_mean'] * 1e3:12.2f}" if "overhead_mean" in r else f"{'':>12}"
+        print(f"{r['scenario']:<42} {r['calls']:>6} {r['errors']:>4} {r['p50'] * 1e3:9.2f} {r['p95'] * 1e3:9.2f} "
+              f"{r['p99'] * 1e3:9.2f} {r['throughput']:9.2f} {overhead}")
+        if r["errors"]:
+            print(f"{'':<42} first error: {r['first_error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app end to end against a mock provider server.")
+    parser.add_argument("--app", default=DEFAULT_APP, help="App config file providing PHASES and SYSTEM_PROMPT")
+    parser.add_argument("--phase", default=DEFAULT_PHASE, help="Phase whose fields and prompt are used")
+    parser.add_argument("--families", default=",".join(DEFAULT_MODELS),
+                        help="Comma-separated model families to benchmark")
+    parser.add_argument("--iterations", type=int, default=50, help="Timed calls per scenario")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed calls per scenario before timing")
+    parser.add_argument("--concurrency", type=int, default=1, help="Calls in flight at once")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock time to first byte in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative +- variation of the mock latencies")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Mock generation speed (0: instant)")
+    parser.add_argument("--output-tokens", type=int, default=400, help="Tokens in every mock completion")
+    parser.add_argument("--prompt-tokens", type=int, default=3000, help="Transcript tokens put into the prompt")
+    parser.add_argument("--history-turns", type=int, default=2, help="Chat history turns sent with each prompt")
+    parser.add_argument("--minutes", type=int, default=60, help="Length of the generated transcripts")
+    parser.add_argument("--vimeo-latency", type=float, default=0.05, help="Mock Vimeo latency in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the mock delays and transcripts")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+    families = [name.strip() for name in args.families.split(",") if name.strip()]
+    unknown = set(families) - set(DEFAULT_MODELS)
+    if unknown:
+        parser.error(f"unknown model families: {', '.join(sorted(unknown))}")
+
+    # bare-mode warnings of streamlit ("missing ScriptRunContext") would drown the report
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    app_config = load_app_config(args.app)
+    vtt, srt = synthetic_vtt(args.minutes, args.seed), synthetic_srt(args.minutes, args.seed)
+    session = {"chat_history": [], "openai_api_key": MOCK_API_KEY}
+    results = []
+
+    server = MockProviderServer(args.latency, args.jitter, args.tokens_per_second, args.output_tokens,
+                                args.vimeo_latency, args.minutes, args.seed)
+    with server, mock_environment(server, session), open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        # the handlers' [DEBUG] prints are part of the timed work but not of the report
+        results.append(run_scenario(f"clean_vtt_or_srt vtt {len(vtt) // 1024}KiB",
+                                    lambda: handlers.clean_vtt_or_srt(vtt), args.iterations, warmup=args.warmup))
+        results.append(run_scenario(f"clean_vtt_or_srt srt {len(srt) // 1024}KiB",
+                                    lambda: handlers.clean_vtt_or_srt(srt), args.iterations, warmup=args.warmup))
+        results.append(run_scenario(
+            "fetch_vimeo_transcript api",
+            lambda: handlers.fetch_vimeo_transcript(MOCK_VIMEO_URL, MOCK_API_KEY, use_cache=False),
+            args.iterations, args.concurrency, args.warmup, server))
+        results.append(run_scenario(
+            "fetch_vimeo_transcript player",
+            lambda: handlers.fetch_vimeo_transcript(MOCK_VIMEO_URL, use_cache=False),
+            args.iterations, args.concurrency, args.warmup, server))
+
+        transcript = trim_to_tokens(handlers.fetch_vimeo_transcript(MOCK_VIMEO_URL, use_cache=False),
+                                    args.prompt_tokens)
+        for family in families:
+            call = completion_call(app_config, args.phase, DEFAULT_MODELS[family], session, transcript,
+                                   args.history_turns, server)
+            results.append(run_scenario(f"execute_llm_completions {family}", call, args.iterations,
+                                        args.concurrency, args.warmup, server))
+
+    print(f"mock latency {args.latency}s +-{args.jitter:.0%}, {args.output_tokens} output tokens at "
+          f"{args.tokens_per_second or 'unlimited'} tokens/s, concurrency {args.concurrency}, seed {args.seed}")
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"arguments": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Local mock of the provider and Vimeo APIs for offline benchmarks.
+
+MockProviderServer answers on 127.0.0.1 with the response shapes of
+
+- OpenAI and Perplexity chat completions (POST /v1/chat/completions, /chat/completions),
+- Anthropic messages (POST /v1/messages),
+- Gemini generateContent (POST /v1beta/models/{model}:generateContent),
+- Vimeo text tracks (GET /videos/{id}/texttracks), the player config (GET /video/{id}/config)
+  and the caption files they link to (GET /texttracks/{id}.vtt).
+
+Every completion takes `latency` seconds (varied by +-`jitter`) to the first byte plus
+`output_tokens` / `tokens_per_second` to generate, and reports the prompt's estimated tokens and
+`output_tokens` as its usage. Delays are drawn from a seeded random generator and caption files
+are generated from the seed, so two runs with the same settings see the same responses and the
+same set of delays. Streaming requests are not emulated and answered with 501.
+
+served() lists (route, seconds) for every answered request, the time the server spent on it.
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core_logic.tokens import estimate_tokens
+
+CAPTION_WORDS = (
+    "the", "model", "gradient", "loss", "function", "we", "minimize", "over", "training", "data", "so",
+    "each", "step", "moves", "weights", "towards", "a", "lower", "error", "and", "then", "you", "can",
+    "see", "how", "learning", "rate", "changes", "convergence", "of", "this", "network", "layer",
+    "activation", "is", "important", "because", "it", "adds", "nonlinearity", "to", "our", "example",
+)
+
+
+def _timestamp(seconds, separator):
+    hours, rest = divmod(seconds, 3600)
+    minutes, rest = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{int(rest):02d}{separator}{int(rest % 1 * 1000):03d}"
+
+
+def synthetic_cues(minutes, seed=0, cue_seconds=3.0, words_per_line=8):
+    """Yield (start, end, text) of rolling auto-captions: each cue repeats the previous line."""
+    rng = random.Random(seed)
+    previous = ""
+    start = 0.0
+    while start < minutes * 60:
+        line = " ".join(rng.choice(CAPTION_WORDS) for _ in range(words_per_line))
+        if rng.random() < 0.3:
+            line += "."
+        yield start, start + cue_seconds, f"{previous}\n{line}" if previous else line
+        previous = line
+        start += cue_seconds
+
+
+def synthetic_vtt(minutes, seed=0):
+    """A WebVTT file of `minutes` of rolling captions."""
+    blocks = [f"{_timestamp(start, '.')} --> {_timestamp(end, '.')}\n{text}"
+              for start, end, text in synthetic_cues(minutes, seed)]
+    return "WEBVTT\n\n" + "\n\n".join(blocks) + "\n"
+
+
+def synthetic_srt(minutes, seed=0):
+    """An SRT file of `minutes` of rolling captions."""
+    blocks = [f"{index}\n{_timestamp(start, ',')} --> {_timestamp(end, ',')}\n{text}"
+              for index, (start, end, text) in enumerate(synthetic_cues(minutes, seed), 1)]
+    return "\n\n".join(blocks) + "\n"
+
+
+def completion_text(tokens):
+    """Deterministic response text of `tokens` words."""
+    return " ".join(CAPTION_WORDS[index % len(CAPTION_WORDS)] for index in range(tokens))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the provider APIs
+
+    def do_GET(self):
+        self.server.mock.handle(self, None)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.server.mock.handle(self, self.rfile.read(length) if length else b"")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class MockProviderServer:
+    """Threaded HTTP server emulating the provider and Vimeo APIs; usable as a context manager."""
+
+    def __init__(self, latency=0.5, jitter=0.2, tokens_per_second=100.0, output_tokens=400, vimeo_latency=0.05,
+                 transcript_minutes=60, seed=0, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.vimeo_latency = vimeo_latency
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._served = []
+        self._vtt = synthetic_vtt(transcript_minutes, seed).encode("utf-8")
+        self._server = _Server((host, port), _Handler)
+        self._server.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-providers", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def served(self):
+        """(route, seconds) of every request answered so far."""
+        with self._lock:
+            return list(self._served)
+
+    def _delay(self, base):
+        with self._lock:
+            return max(0.0, base * (1 + self.jitter * self._rng.uniform(-1, 1)))
+
+    def _completion_delay(self):
+        generation = self.output_tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+        return self._delay(self.latency) + generation
+
+    def handle(self, request, body):
+        started = time.perf_counter()
+        path = request.path.split("?")[0]
+        route, status, payload, content_type = self._route(path, body)
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(data)))
+        if route == "vimeo_texttracks":
+            request.send_header("ETag", f'"mock-{self.seed}"')
+        request.end_headers()
+        request.wfile.write(data)
+        with self._lock:
+            self._served.append((route, time.perf_counter() - started))
+
+    def _route(self, path, body):
+        """Return (route, status, payload, content type) for a request, after the emulated delay."""
+        if body is None:
+            match = re.fullmatch(r"/videos/(\d+)/texttracks", path)
+            if match:
+                time.sleep(self._delay(self.vimeo_latency))
+                return "vimeo_texttracks", 200, self._vimeo_tracks(match.group(1)), "application/json"
+            match = re.fullmatch(r"/video/(\d+)/config", path)
+            if match:
+                time.sleep(self._delay(self.vimeo_latency))
+                return "vimeo_config", 200, self._player_config(match.group(1)), "application/json"
+            if re.fullmatch(r"/texttracks/\d+\.vtt", path):
+                time.sleep(self._delay(self.vimeo_latency))
+                return "vimeo_track", 200, self._vtt, "text/vtt; charset=utf-8"
+            return "unknown", 404, {"error": {"message": f"No mock for GET {path}"}}, "application/json"
+
+        request = json.loads(body or b"{}")
+        if request.get("stream"):
+            return "unsupported", 501, {"error": {"message": "Streaming is not emulated"}}, "application/json"
+        input_tokens = estimate_tokens(body.decode("utf-8"))
+        if path in ("/v1/chat/completions", "/chat/completions"):
+            time.sleep(self._completion_delay())
+            return "chat_completions", 200, self._chat_completion(request, input_tokens), "application/json"
+        if path == "/v1/messages":
+            time.sleep(self._completion_delay())
+            return "messages", 200, self._message(request, input_tokens), "application/json"
+        match = re.fullmatch(r"/v1beta/(models/[^:]+):generateContent", path)
+        if match:
+            time.sleep(self._completion_delay())
+            return "generate_content", 200, self._generate_content(input_tokens), "application/json"
+        return "unknown", 404, {"error": {"message": f"No mock for POST {path}"}}, "application/json"
+
+    def _chat_completion(self, request, input_tokens):
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": 0,
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": completion_text(self.output_tokens)}}],
+            "usage": {"prompt_tokens": input_tokens, "completion_tokens": self.output_tokens,
+                      "total_tokens": input_tokens + self.output_tokens},
+        }
+
+    def _message(self, request, input_tokens):
+        return {
+            "id": "msg_mock",
+            "type": "message",
+            "role": "assistant",
+            "model": request.get("model", "mock"),
+            "content": [{"type": "text", "text": completion_text(self.output_tokens)}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": self.output_tokens},
+        }
+
+    def _generate_content(self, input_tokens):
+        return {
+            "candidates": [{"index": 0, "finishReason": "STOP",
+                            "content": {"role": "model", "parts": [{"text": completion_text(self.output_tokens)}]}}],
+            "usageMetadata": {"promptTokenCount": input_tokens, "candidatesTokenCount": self.output_tokens,
+                              "totalTokenCount": input_tokens + self.output_tokens},
+        }
+
+    def _vimeo_tracks(self, video_id):
+        return {"total": 1, "data": [{"type": "captions", "language": "en", "active": True,
+                                      "link": f"{self.url}/texttracks/{video_id}.vtt"}]}
+
+    def _player_config(self, video_id):
+        return {"video": {"id": int(video_id)},
+                "request": {"text_tracks": [{"lang": "en", "kind": "captions",
+                                             "url": f"{self.url}/texttracks/{video_id}.vtt"}]}}
@@ -0,0 +1,81 @@
+"""
+Micro-benchmark: precompiled prompt renderers vs. the condition interpreter.
+
+Renders the user_prompt of every phase of an app config for a set of field values, once with
+the interpreter (prompt_conditionals + evaluate_conditions + re.findall, the code path used
+before core_logic.prompt_templates existed) and once with the precompiled renderer, checks
+that both produce the same prompts and prints the time per render.
+
+Usage:
+    python -m benchmarks.prompt_templates --app mcq-generator-app.py --iterations 20000
+"""
+import argparse
+import itertools
+import re
+import time
+
+from core_logic.batch import load_app_config, default_field_values, DEFAULT_APP
+from core_logic.main import prompt_conditionals
+from core_logic.prompt_templates import compile_phase_prompts, get_prompt_renderer
+
+
+def interpreted_prompt(user_input, phase_name, phases):
+    prompt = prompt_conditionals(user_input, phase_name, phases)
+    return prompt.format(**{k: user_input.get(k, '') for k in re.findall(r'{(\w+)}', prompt)})
+
+
+def compiled_prompt(user_input, phase_name, phases):
+    return get_prompt_renderer(phases[phase_name]["user_prompt"]).render(user_input)
+
+
+def sample_inputs(fields, limit=64):
+    """Field values covering the combinations of checkbox and selectbox values, up to limit."""
+    base = default_field_values(fields)
+    base.update({key: f"sample {key}" for key, field in fields.items()
+                 if field.get("type") in ("text_input", "text_area")})
+    choices = []
+    for key, field in fields.items():
+        if field.get("type") == "checkbox":
+            choices.append([(key, False), (key, True)])
+        elif field.get("type") in ("selectbox", "radio") and field.get("options"):
+            choices.append([(key, option) for option in field["options"]])
+    return [{**base, **dict(combination)}
+            for combination in itertools.islice(itertools.product(*choices), limit)]
+
+
+def time_per_call(render, cases, iterations):
+    start = time.perf_counter()
+    for index in range(iterations):
+        user_input, phase_name, phases = cases[index % len(cases)]
+        render(user_input, phase_name, phases)
+    return (time.perf_counter() - start) / iterations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark precompiled prompt renderers.")
+    parser.add_argument("--app", default=DEFAULT_APP, help="App config file providing PHASES")
+    parser.add_argument("--iterations", type=int, default=20000, help="Renders timed per implementation")
+    args = parser.parse_args(argv)
+
+    phases = load_app_config(args.app)["PHASES"]
+    compile_start = time.perf_counter()
+    compile_phase_prompts(phases)
+    compile_time = time.perf_counter() - compile_start
+
+    cases = [(user_input, phase_name, phases)
+             for phase_name, phase in phases.items()
+             for user_input in sample_inputs(phase.get("fields", {}))]
+    for case in cases:
+        if interpreted_prompt(*case) != compiled_prompt(*case):
+            raise SystemExit(f"Compiled prompt of phase '{case[1]}' differs for {case[0]}")
+
+    interpreted = time_per_call(interpreted_prompt, cases, args.iterations)
+    compiled = time_per_call(compiled_prompt, cases, args.iterations)
+    print(f"{len(cases)} input combinations, {args.iterations} renders each")
+    print(f"compile (once):  {compile_time * 1e3:8.3f} ms")
+    print(f"interpreter:     {interpreted * 1e6:8.2f} us/render")
+    print(f"precompiled:     {compiled * 1e6:8.2f} us/render ({interpreted / compiled:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
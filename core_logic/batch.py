@@ -0,0 +1,236 @@
+"""
+Headless batch runner for the MCQ generator.
+
+Runs the phase1 prompt of an app config (e.g. mcq-generator-app.py) over a manifest of
+Vimeo URLs without going through the Streamlit form and writes one quiz file per video.
+
+Usage:
+    python -m core_logic.batch manifest.txt --app mcq-generator-app.py --model gpt-4o \
+        --out quizzes --concurrency 4 --set questions_num=3 --set output_format=OLX
+
+The manifest is either a text file with one Vimeo URL per line (lines starting with '#'
+are ignored) or a .json/.jsonl file of objects with a "vimeo_url" key plus optional
+per-video field values overriding the --set values. Provider calls use the retry, rate limit
+and telemetry settings of the app config, like the app itself.
+"""
+import argparse
+import asyncio
+import json
+import os
+import runpy
+import sys
+import time
+
+from core_logic.handlers import fetch_vimeo_transcript, extract_vimeo_id, build_llm_context
+from core_logic.handlers import dispatch_completion, run_sync, configure_provider_calls
+from core_logic.handlers import format_quiz_for_download, generate_download_filename
+from core_logic.llm_config import LLM_CONFIG
+from core_logic.map_reduce import map_reduce_questions, DEFAULT_CHUNK_TOKENS
+from core_logic.main import format_user_prompt
+from core_logic.quiz import structured_request
+from core_logic.quiz_validation import repair_quiz
+from core_logic.per_question import generate_per_question
+
+DEFAULT_APP = "mcq-generator-app.py"
+DEFAULT_PHASE = "phase1"
+
+
+def load_app_config(app_path):
+    """Load the globals of an app config file without starting the Streamlit app."""
+    return runpy.run_path(app_path, run_name="__batch__")
+
+
+def load_manifest(manifest_path):
+    """Load a manifest into a list of dicts that contain at least a "vimeo_url" key."""
+    with open(manifest_path, encoding="utf-8") as f:
+        raw = f.read()
+
+    if manifest_path.endswith(".json"):
+        entries = json.loads(raw)
+    elif manifest_path.endswith(".jsonl"):
+        entries = [json.loads(line) for line in raw.splitlines() if line.strip()]
+    else:
+        entries = [{"vimeo_url": line.strip()} for line in raw.splitlines()
+                   if line.strip() and not line.strip().startswith("#")]
+
+    for entry in entries:
+        if not entry.get("vimeo_url"):
+            raise ValueError(f"Manifest entry without vimeo_url: {entry}")
+    return entries
+
+
+def default_field_values(fields):
+    """Return the values the Streamlit form would show for untouched fields."""
+    values = {}
+    for field_key, field in fields.items():
+        field_type = field.get("type", "")
+        if field_type == "checkbox":
+            values[field_key] = bool(field.get("value", False))
+        elif field_type in ("selectbox", "radio"):
+            options = field.get("options", [])
+            values[field_key] = options[field.get("index") or 0] if options else None
+        elif field_type in ("text_input", "text_area"):
+            values[field_key] = field.get("value", "")
+    return values
+
+
+def coerce_field_value(field, value):
+    """Convert a command-line string to the type expected by a phase field."""
+    if not isinstance(value, str):
+        return value
+    field_type = field.get("type", "")
+    if field_type == "checkbox":
+        return value.strip().lower() in ("1", "true", "yes", "y", "on")
+    if field_type in ("selectbox", "radio"):
+        for option in field.get("options", []):
+            if str(option) == value:
+                return option
+        raise ValueError(f"'{value}' is not one of the options {field.get('options', [])}")
+    return value
+
+
+def parse_field_overrides(pairs, fields):
+    """Parse repeated --set key=value arguments into typed field values."""
+    overrides = {}
+    for pair in pairs or []:
+        if "=" not in pair:
+            raise ValueError(f"Expected key=value, got '{pair}'")
+        key, value = pair.split("=", 1)
+        if key not in fields:
+            raise ValueError(f"Unknown field '{key}'. Known fields: {', '.join(fields)}")
+        overrides[key] = coerce_field_value(fields[key], value)
+    return overrides
+
+
+async def generate_quiz(entry, app_config, selected_llm, base_input, out_dir, vimeo_token=None,
+                        phase_name=DEFAULT_PHASE, use_cache=True):
+    """Fetch the transcript of one manifest entry, generate its quiz and write it to out_dir.
+
+    Returns a result dict describing the outcome.
+    """
+    phases = app_config["PHASES"]
+    phase = phases[phase_name]
+    vimeo_url = entry["vimeo_url"].strip()
+    video_id = extract_vimeo_id(vimeo_url)
+    started = time.time()
+
+    user_input = {**base_input}
+    for key, value in entry.items():
+        if key in phase["fields"]:
+            user_input[key] = coerce_field_value(phase["fields"][key], value)
+
+    transcript = await asyncio.to_thread(fetch_vimeo_transcript, vimeo_url, vimeo_token, parallel=True)
+    if not transcript:
+        return {"vimeo_url": vimeo_url, "status": "no_transcript", "seconds": round(time.time() - started, 2)}
+    user_input["topic_content"] = transcript
+
+    user_prompt = format_user_prompt(phase.get("user_prompt", ""), user_input, phase_name, phases)
+    model_config = LLM_CONFIG[selected_llm]
+    phase_instructions, response_format = structured_request(phase.get("phase_instructions", ""), user_input)
+    context = build_llm_context(app_config.get("SYSTEM_PROMPT", ""), model_config, phase_instructions, user_prompt,
+                                response_format=response_format)
+    cost = 0.0
+    segments = 1
+
+    def render_prompt(values):
+        return format_user_prompt(phase.get("user_prompt", ""), values, phase_name, phases)
+
+    if phase.get("per_question_generation", False) and int(user_input.get("questions_num") or 1) > 1:
+        quiz, report = await generate_per_question(context, model_config["family"], render_prompt, user_input,
+                                                   use_cache)
+        cost, segments = report["cost"], report["requests"]
+    elif phase.get("chunked_generation", False):
+        quiz, report = await map_reduce_questions(context, model_config["family"], render_prompt, user_input,
+                                                  phase.get("chunk_tokens", DEFAULT_CHUNK_TOKENS), use_cache)
+        cost, segments = report["cost"], report["segments"]
+    else:
+        quiz = await dispatch_completion(context, model_config["family"], use_cache=use_cache)
+        cost = context["TOTAL_PRICE"]
+    regenerated = 0
+    if phase.get("validate_output", False):
+        quiz, repair_report = await repair_quiz(quiz, context, model_config["family"], render_prompt, user_input)
+        cost += repair_report["cost"]
+        regenerated = repair_report["regenerated"]
+
+    is_olx = "olx" in str(user_input.get("output_format", "")).lower()
+    filename = generate_download_filename("olx" if is_olx else "txt", suffix=video_id)
+    path = os.path.join(out_dir, filename)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(format_quiz_for_download(quiz, "olx" if is_olx else "plain_text"))
+
+    return {
+        "vimeo_url": vimeo_url,
+        "status": "ok",
+        "file": path,
+        "transcript_chars": len(transcript),
+        "segments": segments,
+        "regenerated": regenerated,
+        "cost": cost,
+        "cached": context.get("cache_hit", False),
+        "seconds": round(time.time() - started, 2),
+    }
+
+
+async def run_batch_async(entries, app_config, selected_llm, base_input, out_dir, concurrency=4, vimeo_token=None,
+                          phase_name=DEFAULT_PHASE, use_cache=True):
+    """Generate quizzes for all manifest entries with at most `concurrency` in flight.
+
+    Returns the list of result dicts in manifest order.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _run(entry):
+        async with semaphore:
+            try:
+                result = await generate_quiz(entry, app_config, selected_llm, base_input, out_dir, vimeo_token,
+                                             phase_name, use_cache)
+            except Exception as e:
+                result = {"vimeo_url": entry["vimeo_url"], "status": "error", "error": f"{type(e).__name__}: {e}"}
+        print(json.dumps(result), flush=True)
+        return result
+
+    return await asyncio.gather(*(_run(entry) for entry in entries))
+
+
+def run_batch(entries, app_config, selected_llm, base_input, out_dir, concurrency=4, vimeo_token=None,
+              phase_name=DEFAULT_PHASE, use_cache=True):
+    """Blocking wrapper around run_batch_async."""
+    return run_sync(run_batch_async(entries, app_config, selected_llm, base_input, out_dir, concurrency,
+                                    vimeo_token, phase_name, use_cache))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate MCQ quizzes for a manifest of Vimeo URLs.")
+    parser.add_argument("manifest", help="Text file with one Vimeo URL per line, or a .json/.jsonl manifest")
+    parser.add_argument("--app", default=DEFAULT_APP, help="App config file providing PHASES and SYSTEM_PROMPT")
+    parser.add_argument("--phase", default=DEFAULT_PHASE, help="Phase whose fields and prompt are used")
+    parser.add_argument("--model", default=None, help="Key of LLM_CONFIG (defaults to the app's PREFERRED_LLM)")
+    parser.add_argument("--out", default="quizzes", help="Output directory for the quiz files")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum number of videos processed at once")
+    parser.add_argument("--vimeo-token", default=os.getenv("VIMEO_API_TOKEN"), help="Optional Vimeo API token")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the provider, bypassing the completion cache")
+    parser.add_argument("--set", dest="fields", action="append", metavar="FIELD=VALUE",
+                        help="Phase field value, e.g. --set questions_num=3 (repeatable)")
+    args = parser.parse_args(argv)
+
+    app_config = load_app_config(args.app)
+    # the same retry, rate limit and telemetry settings as the app; batch runs are the biggest bursts
+    configure_provider_calls(app_config)
+    fields = app_config["PHASES"][args.phase]["fields"]
+    selected_llm = args.model or app_config.get("PREFERRED_LLM")
+    if selected_llm not in LLM_CONFIG:
+        parser.error(f"Selected model '{selected_llm}' not found in configuration.")
+
+    base_input = {**default_field_values(fields), **parse_field_overrides(args.fields, fields)}
+    entries = load_manifest(args.manifest)
+    results = run_batch(entries, app_config, selected_llm, base_input, args.out, args.concurrency,
+                        args.vimeo_token, args.phase, not args.no_cache)
+
+    succeeded = sum(1 for result in results if result["status"] == "ok")
+    print(f"Generated {succeeded}/{len(results)} quizzes in {args.out}", file=sys.stderr)
+    return 0 if succeeded == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
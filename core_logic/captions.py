@@ -0,0 +1,265 @@
+"""
+Single-pass streaming parser for WebVTT and SRT caption files.
+
+iter_cues() reads lines one at a time (from a string, bytes, an iterable of lines or a
+text/byte stream) and yields Cue(start, end, text) tuples with times in seconds, so
+multi-hour transcripts never have to be held in memory twice. Transcript wraps the cues
+and offers the cleaned plain text that clean_vtt_or_srt() used to produce as a view.
+
+Lines that are not part of a timed cue (plain-text transcripts, stray text) are yielded as
+cues with start and end set to None. WEBVTT headers, NOTE/STYLE/REGION blocks, SRT sequence
+numbers and VTT cue identifiers are skipped.
+
+normalize_transcript() is the normalization stage after cleaning: it collapses the repeated
+words of rolling auto-captions, regroups the text into sentences across cue boundaries and
+reports how many prompt tokens that saved.
+"""
+import re
+from typing import Iterable, Iterator, NamedTuple, Optional, Union
+
+from core_logic.tokens import estimate_tokens
+
+# hh:mm:ss.mmm --> hh:mm:ss.mmm (hours optional, ',' or '.' before the fraction, cue settings ignored)
+_TIMING_RE = re.compile(
+    r"^\s*(?:(\d+):)?(\d{1,2}):(\d{2})(?:[.,](\d{1,3}))?\s*-->\s*(?:(\d+):)?(\d{1,2}):(\d{2})(?:[.,](\d{1,3}))?"
+)
+# VTT tags (<c>, <v Speaker>, <00:00:01.000>), bracketed timestamps and inline timestamps
+_NOISE_RE = re.compile(r"<[^>]*>|\[\d{1,2}:\d{2}(?::\d{2})?\]|\b\d{1,2}:\d{2}(?::\d{2})?\b")
+_SKIPPED_BLOCKS = ("NOTE", "STYLE", "REGION")
+
+
+class Cue(NamedTuple):
+    start: Optional[float]
+    end: Optional[float]
+    text: str
+
+
+def _seconds(hours, minutes, seconds, fraction):
+    value = int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+    if fraction:
+        value += int(fraction) / (10 ** len(fraction))
+    return value
+
+
+def clean_caption_text(line):
+    """Strip tags and timestamps from one caption text line and collapse whitespace."""
+    if "<" in line or ":" in line:
+        line = _NOISE_RE.sub("", line)
+    return " ".join(line.split())
+
+
+def _iter_lines(source):
+    """Yield str lines without line endings from any supported caption source."""
+    if isinstance(source, bytes):
+        source = source.decode("utf-8", errors="replace")
+    if isinstance(source, str):
+        yield from source.splitlines()
+        return
+    first = True
+    for line in source:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        if first:
+            line = line.lstrip("\ufeff")
+            first = False
+        yield line.rstrip("\r\n")
+
+
+def iter_cues(source: Union[str, bytes, Iterable]) -> Iterator[Cue]:
+    """Parse WebVTT/SRT captions in a single pass and yield Cue tuples as soon as each cue ends.
+
+    >>> [cue.text for cue in iter_cues("WEBVTT\\n00:00:01.000 --> 00:00:02.000\\nfirst cue\\n\\n"
+    ...                                "00:00:02.000 --> 00:00:03.000\\nsecond cue")]
+    ['first cue', 'second cue']
+    """
+    start = end = None
+    in_cue = False
+    skipping = False
+    text_parts = []
+    pending = []  # untimed lines; the last one may turn out to be a cue identifier
+    first = True
+    is_vtt = False
+
+    for raw_line in _iter_lines(source):
+        line = raw_line.strip()
+        if first:
+            first = False
+            line = line.lstrip("\ufeff")
+            if line.upper().startswith("WEBVTT"):
+                is_vtt = True
+                skipping = True  # the header block runs until the first blank line
+                continue
+
+        if not line:
+            # blank line ends the current block
+            if in_cue:
+                if text_parts:
+                    yield Cue(start, end, " ".join(text_parts))
+                in_cue = False
+                text_parts = []
+            elif pending:
+                yield Cue(None, None, " ".join(pending))
+                pending = []
+            skipping = False
+            continue
+
+        if "-->" in line:
+            # a timing line also ends a header or NOTE block that had no blank line after it
+            skipping = False
+            match = _TIMING_RE.match(line)
+            if in_cue and text_parts:
+                yield Cue(start, end, " ".join(text_parts))
+            # the line right before a timing line is an SRT number or VTT cue identifier
+            if len(pending) > 1:
+                yield Cue(None, None, " ".join(pending[:-1]))
+            pending = []
+            text_parts = []
+            in_cue = True
+            if match:
+                start = _seconds(*match.group(1, 2, 3, 4))
+                end = _seconds(*match.group(5, 6, 7, 8))
+            else:
+                start = end = None
+            continue
+
+        if skipping:
+            continue
+
+        if line.isdigit():
+            # SRT sequence number
+            continue
+        if is_vtt and not in_cue and not pending and line.split(" ", 1)[0] in _SKIPPED_BLOCKS:
+            skipping = True
+            continue
+
+        text = clean_caption_text(line)
+        if not text:
+            continue
+        if in_cue:
+            text_parts.append(text)
+        else:
+            pending.append(text)
+
+    if in_cue and text_parts:
+        yield Cue(start, end, " ".join(text_parts))
+    elif pending:
+        yield Cue(None, None, " ".join(pending))
+
+
+def cues_to_text(cues: Iterable[Cue]) -> str:
+    """Join cue texts into one cleaned transcript string."""
+    return " ".join(cue.text for cue in cues if cue.text)
+
+
+class Transcript:
+    """Parsed captions: the list of timed cues plus the cleaned plain-text view over them."""
+
+    def __init__(self, cues: Iterable[Cue]):
+        self.cues = list(cues)
+        self._text = None
+
+    @classmethod
+    def parse(cls, source):
+        return cls(iter_cues(source))
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = cues_to_text(self.cues)
+        return self._text
+
+    @property
+    def duration(self):
+        ends = [cue.end for cue in self.cues if cue.end is not None]
+        return max(ends) if ends else None
+
+    def __iter__(self):
+        return iter(self.cues)
+
+    def __len__(self):
+        return len(self.cues)
+
+
+# --- transcript normalization ---
+DEDUP_WINDOW = 40
+MIN_OVERLAP_WORDS = 2
+MAX_SENTENCE_WORDS = 60
+_SENTENCE_END_RE = re.compile(r"[.!?][\"')\]]*$")
+_WORD_PUNCTUATION = ".,;:!?\"'()[]-"
+
+
+def _word_key(word):
+    return word.strip(_WORD_PUNCTUATION).lower()
+
+
+def _overlap(tail, keys):
+    """Length of the longest suffix of tail that is a prefix of keys."""
+    for k in range(min(len(tail), len(keys)), 0, -1):
+        if tail[-k:] == keys[:k]:
+            if k >= MIN_OVERLAP_WORDS or k == len(keys):
+                return k
+            return 0
+    return 0
+
+
+def dedupe_cues(cues: Iterable[Cue], window: int = DEDUP_WINDOW) -> Iterator[Cue]:
+    """Drop words a cue repeats from the end of the previous cues (rolling auto-captions).
+
+    Cues that only repeat earlier text are dropped entirely.
+    """
+    tail = []
+    for cue in cues:
+        words = cue.text.split()
+        keys = [_word_key(word) for word in words]
+        k = _overlap(tail, keys)
+        if k:
+            words = words[k:]
+            keys = keys[k:]
+        if not words:
+            continue
+        tail = (tail + keys)[-window:]
+        yield Cue(cue.start, cue.end, " ".join(words))
+
+
+def reassemble_sentences(cues: Iterable[Cue], max_words: int = MAX_SENTENCE_WORDS) -> Iterator[Cue]:
+    """Regroup cue text into sentences that span cue boundaries.
+
+    Each sentence starts at the start of the cue its first word came from and ends at the end
+    of the cue of its last word. Unpunctuated captions are split every max_words words.
+    """
+    words = []
+    start = end = None
+    for cue in cues:
+        for word in cue.text.split():
+            if not words:
+                start = cue.start
+            words.append(word)
+            end = cue.end
+            if len(words) >= max_words or _SENTENCE_END_RE.search(word):
+                yield Cue(start, end, " ".join(words))
+                words = []
+    if words:
+        yield Cue(start, end, " ".join(words))
+
+
+def normalize_transcript(cues: Iterable[Cue]):
+    """Deduplicate rolling captions and reassemble sentences.
+
+    Returns (Transcript, report) where report is a dict with the cue counts and the
+    character and estimated token counts before and after normalization.
+    """
+    cues = list(cues)
+    normalized = Transcript(reassemble_sentences(dedupe_cues(cues)))
+    before = cues_to_text(cues)
+    tokens_before = estimate_tokens(before)
+    tokens_after = estimate_tokens(normalized.text)
+    report = {
+        "cues_before": len(cues),
+        "sentences_after": len(normalized),
+        "chars_before": len(before),
+        "chars_after": len(normalized.text),
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+    }
+    return normalized, report
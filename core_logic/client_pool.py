@@ -0,0 +1,148 @@
+"""
+Keyed pool of provider clients.
+
+Provider SDK clients (and the HTTP connection pools inside them) are expensive to build:
+each new client means a new TLS handshake on the first request. The pool keeps one client
+per provider + API key + event loop and hands it out again on later calls, so connections
+stay alive across quizzes, Streamlit reruns and sessions. Clients that were not used for
+`idle_timeout` seconds are closed, as is the least recently used client once `max_clients`
+is exceeded.
+
+Clients are keyed by event loop because async HTTP connections cannot be shared between loops.
+Sync callers all go through the background loop in core_logic.handlers, so in practice there
+is one client per provider + key.
+"""
+import asyncio
+import contextlib
+import hashlib
+import inspect
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_IDLE_TIMEOUT = 300
+DEFAULT_MAX_CLIENTS = 64
+
+
+class _PooledClient:
+    __slots__ = ("client", "loop", "last_used", "in_use")
+
+    def __init__(self, client, loop):
+        self.client = client
+        self.loop = loop
+        self.last_used = time.monotonic()
+        self.in_use = 0
+
+
+def hash_api_key(api_key):
+    """Return a short stable fingerprint of an API key, so keys never appear in pool keys or logs."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+async def close_client(client):
+    """Close a provider client, whatever flavour of close method it offers."""
+    for method_name in ("aclose", "close"):
+        method = getattr(client, method_name, None)
+        if method is None:
+            continue
+        result = method()
+        if inspect.isawaitable(result):
+            await result
+        return
+    # google.ai.generativelanguage clients only expose their transport
+    transport = getattr(client, "transport", None)
+    if transport is not None:
+        await close_client(transport)
+
+
+class ClientPool:
+    """Thread-safe pool of provider clients keyed by (provider, API key, event loop)."""
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, max_clients=DEFAULT_MAX_CLIENTS):
+        self.idle_timeout = idle_timeout
+        self.max_clients = max_clients
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextlib.asynccontextmanager
+    async def lease(self, provider, api_key, factory):
+        """Lend out the pooled client for provider + api_key on the running loop.
+
+        The client is created with factory(api_key) on first use. A leased client is never
+        evicted, so long-running requests are not cut off by the idle timeout.
+
+        Usage:
+            async with CLIENT_POOL.lease("openai", api_key, make_client) as client:
+                ...
+        """
+        loop = asyncio.get_running_loop()
+        key = (provider, hash_api_key(api_key), id(loop))
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None and entry.loop is not loop:
+                # id() of a closed loop got reused; the old client is unusable
+                del self._clients[key]
+                entry = None
+            if entry is None:
+                entry = _PooledClient(factory(api_key), loop)
+                self._clients[key] = entry
+            entry.in_use += 1
+            self._clients.move_to_end(key)
+            evicted = self._pop_evictable(time.monotonic())
+        for stale in evicted:
+            await self._close_entry(stale, loop)
+        try:
+            yield entry.client
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+
+    def _pop_evictable(self, now):
+        """Remove idle, orphaned and over-capacity entries. Must be called with the lock held."""
+        evicted = []
+        for key, entry in list(self._clients.items()):
+            if entry.in_use:
+                continue
+            if entry.loop.is_closed() or now - entry.last_used > self.idle_timeout:
+                evicted.append(self._clients.pop(key))
+        for key, entry in list(self._clients.items()):
+            if len(self._clients) <= self.max_clients:
+                break
+            if not entry.in_use:
+                evicted.append(self._clients.pop(key))
+        return evicted
+
+    @staticmethod
+    async def _close_entry(entry, current_loop):
+        try:
+            if entry.loop is current_loop:
+                await close_client(entry.client)
+            elif entry.loop.is_running():
+                asyncio.run_coroutine_threadsafe(close_client(entry.client), entry.loop)
+            # clients of closed loops cannot be closed anymore and are simply dropped
+        except Exception as e:
+            print(f"[DEBUG] Failed to close pooled client: {type(e).__name__}: {e}")
+
+    async def evict_idle(self):
+        """Close all clients that have been idle for longer than idle_timeout."""
+        with self._lock:
+            evicted = self._pop_evictable(time.monotonic())
+        for entry in evicted:
+            await self._close_entry(entry, asyncio.get_running_loop())
+
+    async def close_all(self):
+        """Close and forget every pooled client, including ones currently leased."""
+        with self._lock:
+            evicted = list(self._clients.values())
+            self._clients.clear()
+        for entry in evicted:
+            await self._close_entry(entry, asyncio.get_running_loop())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+
+
+# Process-wide pool shared by all handlers and Streamlit sessions
+CLIENT_POOL = ClientPool()
@@ -0,0 +1,165 @@
+"""
+Two-tier cache for LLM completions.
+
+Completions are keyed by a stable hash of everything that determines the model output:
+family, model, sampling parameters, system prompt, phase instructions, formatted user prompt,
+image URLs, response format, server base URL and chat history. API keys and prices are not
+part of the key.
+
+The memory tier is a per-process LRU. The optional disk tier (one JSON file per entry,
+written atomically) is shared by every Streamlit worker process pointing at the same
+directory; it is enabled by passing `directory` or setting COMPLETION_CACHE_DIR.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+# context keys that determine the completion
+CACHE_KEY_FIELDS = (
+    "model", "max_tokens", "temperature", "top_p", "frequency_penalty", "presence_penalty",
+    "SYSTEM_PROMPT", "phase_instructions", "user_prompt", "image_urls", "response_format", "base_url",
+)
+
+
+def completion_cache_key(context, family):
+    """Return a stable sha256 hex digest of the request context built for a handler."""
+    payload = {field: context.get(field) for field in CACHE_KEY_FIELDS}
+    payload["family"] = family
+    payload["chat_history"] = [
+        {"user": entry.get("user"), "assistant": entry.get("assistant")}
+        for entry in context.get("chat_history") or []
+    ]
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class CompletionCache:
+    """LRU memory tier plus optional shared disk tier for completion responses."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, directory=None, ttl=DEFAULT_TTL,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """Return the cached entry dict ({"response", "cost", "created"}) or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry["created"] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                del self._memory[key]
+
+        entry = self._read_disk(key) if self.directory else None
+        with self._lock:
+            if entry is not None and now - entry["created"] < self.ttl:
+                self._remember(key, entry)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        return None
+
+    def put(self, key, response, cost=0.0):
+        """Store a completion in both tiers."""
+        entry = {"response": response, "cost": cost, "created": time.time()}
+        with self._lock:
+            self._remember(key, entry)
+        if self.directory:
+            try:
+                self._write_disk(key, entry)
+                self._prune_disk()
+            except OSError as e:
+                print(f"[DEBUG] Failed to write completion cache entry: {type(e).__name__}: {e}")
+
+    def _remember(self, key, entry):
+        """Insert into the memory tier. Must be called with the lock held."""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def _write_disk(self, key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _prune_disk(self):
+        """Delete expired entries, then the least recently used ones over max_bytes."""
+        files = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+                if now - stat.st_mtime > self.ttl:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        """Forget every cached completion in both tiers."""
+        with self._lock:
+            self._memory.clear()
+        if self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+
+
+# Process-wide cache used by dispatch_completion
+COMPLETION_CACHE = CompletionCache(directory=os.getenv("COMPLETION_CACHE_DIR") or None)
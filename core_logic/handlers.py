@@ -1,11 +1,29 @@
 import openai
 import anthropic
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
 #from core_logic import rag_pipeline
 import requests
+import httpx
+import asyncio
+import threading
 import os
+import json
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import re
+from core_logic.client_pool import CLIENT_POOL, DEFAULT_IDLE_TIMEOUT
+from core_logic.transcript_cache import TRANSCRIPT_CACHE
+from core_logic.captions import iter_cues, cues_to_text, normalize_transcript
+from core_logic.completion_cache import COMPLETION_CACHE, completion_cache_key
+from core_logic.tokens import ContextWindowExceeded, preflight
+from core_logic.quiz import try_parse_quiz, render_quiz
+from core_logic.rate_limit import RATE_LIMITER
+from core_logic.single_flight import SINGLE_FLIGHT
+from core_logic.telemetry import TELEMETRY, start_metrics_server
+from core_logic.resilience import call_with_resilience, stream_with_resilience, ProviderError, InvalidRequestError
+from core_logic.resilience import configure_resilience
 
 load_dotenv()
 
@@ -14,51 +32,186 @@ load_dotenv()
 def clean_vtt_or_srt(text: str) -> str:
     """Clean VTT/SRT style transcript text by removing timestamps, cue numbers and headers.
 
-    Returns a cleaned single string containing transcript sentences.
+    Returns a cleaned single string containing transcript sentences. Use
+    core_logic.captions.iter_cues / Transcript to keep the cue timings.
     """
-    lines = text.splitlines()
-    cleaned_lines = []
+    return cues_to_text(iter_cues(text))
 
-    for line in lines:
-        line_strip = line.strip()
-        if not line_strip:
-            continue
-        # skip WEBVTT header
-        if line_strip.upper().startswith("WEBVTT"):
-            continue
-        # skip sequence numbers in SRT
-        if line_strip.isdigit():
-            continue
-        # skip lines that are timestamps or contain the arrow separator
-        if "-->" in line_strip:
+
+def extract_vimeo_id(vimeo_url: str) -> str:
+    """Extract the numeric Vimeo video id from a Vimeo URL.
+
+    Raises ValueError if the URL does not contain a video id.
+    """
+    m = re.search(r"vimeo\.com/(?:.*?/)?(\d+)", vimeo_url)
+    if not m:
+        raise ValueError(f"Could not extract Vimeo video id from URL: {vimeo_url}")
+    return m.group(1)
+
+
+# Shared keep-alive session and worker threads for Vimeo requests
+VIMEO_API_URL = "https://api.vimeo.com"
+VIMEO_PLAYER_URL = "https://player.vimeo.com"
+VIMEO_SESSION = requests.Session()
+VIMEO_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32))
+VIMEO_SESSION.mount("http://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32))
+_vimeo_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="vimeo-fetch")
+
+
+def _select_track(tracks, language, language_key):
+    """Return the first track whose language starts with `language`, else the first track."""
+    for t in tracks:
+        lang = t.get(language_key, "").lower()
+        if lang and lang.startswith(language):
+            return t
+    return tracks[0]
+
+
+def _fetch_track_via_api(vid, vimeo_token, timeout, language, cache_entry=None):
+    """Download the preferred text track through the authenticated Vimeo API.
+
+    Returns a dict with "raw", "source", "track_language", "etag" and "last_modified",
+    {"not_modified": True} if the stale cache entry was revalidated, or None if the video has no track.
+    """
+    print(f"[DEBUG] Attempting to fetch transcript with API token for video {vid}")
+    api_url = f"{VIMEO_API_URL}/videos/{vid}/texttracks"
+    headers = {
+        "Authorization": f"Bearer {vimeo_token}",
+        "Accept": "application/vnd.vimeo.*+json;version=3.4"
+    }
+    # Revalidate a stale cache entry instead of downloading everything again
+    if cache_entry and cache_entry.get("source") == "api":
+        if cache_entry.get("etag"):
+            headers["If-None-Match"] = cache_entry["etag"]
+        if cache_entry.get("last_modified"):
+            headers["If-Modified-Since"] = cache_entry["last_modified"]
+    resp = VIMEO_SESSION.get(api_url, headers=headers, timeout=timeout)
+    if resp.status_code == 304:
+        print(f"[DEBUG] Cached transcript for video {vid} is still valid")
+        return {"not_modified": True}
+    resp.raise_for_status()
+    data = resp.json()
+
+    print(f"[DEBUG] API response: {data}")
+
+    if not data.get("data"):
+        return None
+    track = _select_track(data["data"], language, "language")
+    print(f"[DEBUG] Selected track: {track}")
+
+    track_url = track.get("link")
+    if not track_url:
+        return None
+    print(f"[DEBUG] Downloading transcript from: {track_url}")
+    tt_resp = VIMEO_SESSION.get(track_url, timeout=timeout)
+    tt_resp.raise_for_status()
+    return {
+        "raw": tt_resp.text,
+        "source": "api",
+        "track_language": track.get("language"),
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+    }
+
+
+def _fetch_track_via_player_config(vid, timeout, language):
+    """Download the preferred text track listed in the public player config.
+
+    Returns a dict with "raw", "source" and "track_language", or None if the video has no track.
+    """
+    print(f"[DEBUG] Attempting to fetch transcript from player config for video {vid}")
+    config_url = f"{VIMEO_PLAYER_URL}/video/{vid}/config"
+    resp = VIMEO_SESSION.get(config_url, timeout=timeout)
+    resp.raise_for_status()
+    data = resp.json()
+
+    print(f"[DEBUG] Player config response keys: {data.keys()}")
+
+    # locate text tracks
+    text_tracks = []
+    # common places where text tracks appear in the config
+    if isinstance(data.get("request"), dict):
+        files = data["request"].get("files", {})
+        text_tracks = files.get("text_tracks") or data["request"].get("text_tracks") or []
+    text_tracks = text_tracks or data.get("text_tracks") or []
+
+    print(f"[DEBUG] Found {len(text_tracks)} text tracks")
+
+    if not text_tracks:
+        print("[DEBUG] No text tracks found in player config")
+        return None
+
+    track = _select_track(text_tracks, language, "lang")
+    print(f"[DEBUG] Selected track: {track}")
+
+    track_url = track.get("url")
+    if not track_url:
+        print("[DEBUG] No URL in track")
+        return None
+
+    print(f"[DEBUG] Downloading transcript from: {track_url}")
+    tt_resp = VIMEO_SESSION.get(track_url, timeout=timeout)
+    tt_resp.raise_for_status()
+    return {"raw": tt_resp.text, "source": "player_config", "track_language": track.get("lang")}
+
+
+def _race_track_strategies(strategies):
+    """Run (name, fn) strategies concurrently and return the first usable result, or None.
+
+    Slower strategies keep running in the background and their results are discarded.
+    """
+    futures = {_vimeo_executor.submit(fn): name for name, fn in strategies}
+    for future in as_completed(futures):
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"[DEBUG] {futures[future]} method failed: {type(e).__name__}: {e}")
             continue
-        # remove bracketed timestamps like [00:01:23]
-        line_strip = re.sub(r"\[\d{1,2}:\d{2}(?::\d{2})?\]", "", line_strip)
-        # remove inline timestamps mm:ss or hh:mm:ss patterns
-        line_strip = re.sub(r"\b\d{1,2}:\d{2}(?::\d{2})?\b", "", line_strip)
-        # collapse whitespace
-        line_strip = re.sub(r"\s+", " ", line_strip).strip()
-        if line_strip:
-            cleaned_lines.append(line_strip)
+        if result:
+            print(f"[DEBUG] {futures[future]} method won the race")
+            return result
+    return None
+
 
-    cleaned = " ".join(cleaned_lines)
-    cleaned = re.sub(r"\s+", " ", cleaned).strip()
-    return cleaned
+def _transcript_text(entry, normalize, stats=None):
+    """Return the cleaned or normalized text of a transcript cache entry, filling stats with the normalization report."""
+    if not normalize:
+        return entry["cleaned"]
+    if entry.get("normalized") is None:
+        normalized, report = normalize_transcript(iter_cues(entry["raw"]))
+        entry["normalized"], entry["normalization_report"] = normalized.text, report
+    if stats is not None and entry.get("normalization_report"):
+        stats.update(entry["normalization_report"])
+    return entry["normalized"]
 
 
-def fetch_vimeo_transcript(vimeo_url: str, vimeo_token: str = None, timeout: int = 10) -> str:
+def fetch_vimeo_transcript(vimeo_url: str, vimeo_token: str = None, timeout: int = 10, language: str = "en",
+                           use_cache: bool = True, parallel: bool = False, normalize: bool = True,
+                           stats: dict = None) -> str:
     """Fetch the transcript for a Vimeo video URL.
 
     Strategy:
-    - If vimeo_token is provided, use the Vimeo API v3 to get transcripts with auth
+    - Return the transcript from TRANSCRIPT_CACHE if a fresh entry exists
+    - If vimeo_token is provided, use the Vimeo API v3 to get transcripts with auth,
+      revalidating a stale cache entry with its ETag/Last-Modified validators
     - Otherwise, extract Vimeo numeric id from the URL and query the player config
-    - Download the first suitable text track (prefer English)
-    - Clean timestamps and return plain text
+    - Download the first suitable text track (prefer `language`)
+    - Clean timestamps, collapse repeated rolling-caption text and reassemble sentences
+    - Cache raw, cleaned and normalized text and return plain text
+
+    With `parallel=True` the API and player config strategies are raced against each other
+    and the first usable track wins, so a slow or failing strategy costs at most one timeout.
+    All requests go through the shared keep-alive VIMEO_SESSION.
 
     Args:
         vimeo_url: URL of the Vimeo video
         vimeo_token: Optional Vimeo API token for authenticated requests
         timeout: Request timeout in seconds
+        language: Preferred track language prefix
+        use_cache: Set to False to bypass the transcript cache
+        parallel: Race the API and player config strategies instead of trying them in turn
+        normalize: Deduplicate rolling captions and reassemble sentences (see captions.normalize_transcript)
+        stats: Optional dict that is filled with the normalization report (token savings)
 
     Returns cleaned transcript string or empty string if not found.
     """
@@ -70,110 +223,58 @@ def fetch_vimeo_transcript(vimeo_url: str, vimeo_token: str = None, timeout: int
         return ""
     
     # Extract numeric id from URL
-    m = re.search(r"vimeo\.com/(?:.*?/)?(\d+)", vimeo_url)
-    if not m:
-        raise ValueError(f"Could not extract Vimeo video id from URL: {vimeo_url}")
-    vid = m.group(1)
+    vid = extract_vimeo_id(vimeo_url)
     print(f"[DEBUG] Extracted Vimeo video ID: {vid}")
+    language = (language or "").lower()
+
+    cache_entry = TRANSCRIPT_CACHE.get(vid, language) if use_cache else None
+    if cache_entry and TRANSCRIPT_CACHE.is_fresh(cache_entry):
+        print(f"[DEBUG] Transcript cache hit for video {vid} ({language})")
+        return _transcript_text(cache_entry, normalize, stats)
 
-    # If token is provided, try the authenticated API endpoint
+    strategies = []
     if vimeo_token:
-        try:
-            print(f"[DEBUG] Attempting to fetch transcript with API token for video {vid}")
-            api_url = f"https://api.vimeo.com/videos/{vid}/texttracks"
-            headers = {
-                "Authorization": f"Bearer {vimeo_token}",
-                "Accept": "application/vnd.vimeo.*+json;version=3.4"
-            }
-            resp = requests.get(api_url, headers=headers, timeout=timeout)
-            resp.raise_for_status()
-            data = resp.json()
-            
-            print(f"[DEBUG] API response: {data}")
-            
-            if "data" in data and data["data"]:
-                # Find English track or use first available
-                track = None
-                for t in data["data"]:
-                    lang = t.get("language", "").lower()
-                    if lang and lang.startswith("en"):
-                        track = t
-                        break
-                if not track:
-                    track = data["data"][0]
-                
-                print(f"[DEBUG] Selected track: {track}")
-                
-                # Download the transcript file
-                track_url = track.get("link")
-                if track_url:
-                    print(f"[DEBUG] Downloading transcript from: {track_url}")
-                    tt_resp = requests.get(track_url, timeout=timeout)
-                    tt_resp.raise_for_status()
-                    raw_text = tt_resp.text
-                    print(f"[DEBUG] Downloaded transcript, size: {len(raw_text)} bytes")
-                    cleaned = clean_vtt_or_srt(raw_text)
-                    print(f"[DEBUG] Cleaned transcript, size: {len(cleaned)} characters")
-                    return cleaned
-        except Exception as e:
-            print(f"[DEBUG] API method failed: {type(e).__name__}: {e}")
-            # Fall back to player config method if API fails
+        strategies.append(("API", lambda: _fetch_track_via_api(vid, vimeo_token, timeout, language, cache_entry)))
+    # player config works for public videos
+    strategies.append(("Player config", lambda: _fetch_track_via_player_config(vid, timeout, language)))
 
-    # Fallback: use player config (works for public videos)
-    try:
-        print(f"[DEBUG] Attempting to fetch transcript from player config for video {vid}")
-        config_url = f"https://player.vimeo.com/video/{vid}/config"
-        resp = requests.get(config_url, timeout=timeout)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        print(f"[DEBUG] Player config response keys: {data.keys()}")
-
-        # locate text tracks
-        text_tracks = []
-        # common places where text tracks appear in the config
-        if isinstance(data.get("request"), dict):
-            files = data["request"].get("files", {})
-            text_tracks = files.get("text_tracks") or data["request"].get("text_tracks") or []
-        text_tracks = text_tracks or data.get("text_tracks") or []
-
-        print(f"[DEBUG] Found {len(text_tracks)} text tracks")
-        
-        if not text_tracks:
-            print(f"[DEBUG] No text tracks found in player config")
-            return ""
-
-        # prefer english track
-        track = None
-        for t in text_tracks:
-            lang = t.get("lang", "").lower()
-            if lang and lang.startswith("en"):
-                track = t
+    result = None
+    if parallel and len(strategies) > 1:
+        result = _race_track_strategies(strategies)
+    else:
+        for name, strategy in strategies:
+            try:
+                result = strategy()
+            except Exception as e:
+                print(f"[DEBUG] {name} method failed: {type(e).__name__}: {e}")
+                continue
+            if result:
                 break
-        if not track:
-            track = text_tracks[0]
-
-        print(f"[DEBUG] Selected track: {track}")
-        
-        track_url = track.get("url")
-        if not track_url:
-            print(f"[DEBUG] No URL in track")
-            return ""
-
-        print(f"[DEBUG] Downloading transcript from: {track_url}")
-        tt_resp = requests.get(track_url, timeout=timeout)
-        tt_resp.raise_for_status()
-        raw_text = tt_resp.text
-        print(f"[DEBUG] Downloaded transcript, size: {len(raw_text)} bytes")
-        cleaned = clean_vtt_or_srt(raw_text)
-        print(f"[DEBUG] Cleaned transcript, size: {len(cleaned)} characters")
-        return cleaned
-    except Exception as e:
-        print(f"[DEBUG] Player config method failed: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
+
+    if result and result.get("not_modified"):
+        return _transcript_text(TRANSCRIPT_CACHE.touch(vid, language, cache_entry), normalize, stats)
+    if not result:
+        if cache_entry:
+            print(f"[DEBUG] Serving stale cached transcript for video {vid}")
+            return _transcript_text(cache_entry, normalize, stats)
         return ""
 
+    raw_text = result["raw"]
+    print(f"[DEBUG] Downloaded transcript, size: {len(raw_text)} bytes")
+    cues = list(iter_cues(raw_text))
+    cleaned = cues_to_text(cues)
+    print(f"[DEBUG] Cleaned transcript, size: {len(cleaned)} characters")
+    normalized, report = normalize_transcript(cues)
+    print(f"[DEBUG] Normalized transcript, size: {len(normalized.text)} characters, "
+          f"~{report['tokens_saved']} tokens saved")
+    if use_cache:
+        TRANSCRIPT_CACHE.put(vid, language, raw_text, cleaned, result["source"],
+                             track_language=result.get("track_language"),
+                             etag=result.get("etag"), last_modified=result.get("last_modified"),
+                             normalized=normalized.text, normalization_report=report)
+    entry = {"raw": raw_text, "cleaned": cleaned, "normalized": normalized.text, "normalization_report": report}
+    return _transcript_text(entry, normalize, stats)
+
 # fetching api key for LLM interactions
 def get_api_key(service_name, context=None):
     """Retrieve API key from context (preferred) or environment variables."""
@@ -192,6 +293,51 @@ def get_api_key(service_name, context=None):
 
     return api_key
 
+# building the request context shared by all handlers
+def build_llm_context(SYSTEM_PROMPT, model_config, phase_instructions, user_prompt, image_urls=None,
+                      chat_history=None, api_keys=None, response_format=None):
+    """Build the context dict consumed by the functions in HANDLERS.
+
+    Args:
+        SYSTEM_PROMPT: System prompt of the app
+        model_config: Entry of LLM_CONFIG, optionally merged with user overrides
+        phase_instructions: Instructions of the current phase
+        user_prompt: Fully formatted user prompt
+        image_urls: Optional list of image (data) URLs
+        chat_history: Optional list of {"user": ..., "assistant": ...} entries
+        api_keys: Optional mapping of service name to API key; missing keys fall back to the environment
+        response_format: None for free text, or "json" to request a JSON object where the provider supports it
+
+    Returns the context dict.
+    """
+    return {
+        "SYSTEM_PROMPT": SYSTEM_PROMPT,
+        "phase_instructions": phase_instructions,
+        "user_prompt": user_prompt,
+        "supports_image": model_config["supports_image"],
+        "image_urls": image_urls,
+        "model": model_config["model"],
+        "max_tokens": model_config["max_tokens"],
+        "context_window": model_config.get("context_window"),
+        "temperature": model_config["temperature"],
+        "top_p": model_config["top_p"],
+        "frequency_penalty": model_config["frequency_penalty"],
+        "presence_penalty": model_config["presence_penalty"],
+        "price_input_token_1M": model_config["price_input_token_1M"],
+        "price_output_token_1M": model_config["price_output_token_1M"],
+        "TOTAL_PRICE": 0,
+        "chat_history": chat_history or [],
+        "api_keys": {k: v for k, v in (api_keys or {}).items() if v},
+        "response_format": response_format,
+        "base_url": model_config.get("base_url"),
+    }
+
+# rejecting requests a model cannot serve
+def check_image_support(context):
+    """Raise InvalidRequestError if the request has images and the model does not support them."""
+    if not context["supports_image"] and context.get("image_urls"):
+        raise InvalidRequestError("Images are not supported by selected model.")
+
 # chat history formatting for different LLMs
 def format_chat_history(chat_history, family):
     """Format chat history based on LLM family."""
@@ -213,126 +359,371 @@ def format_chat_history(chat_history, family):
                 ])
     return formatted_history
 
+# --- asyncio runtime shared by the sync handler wrappers ---
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop():
+    """Return the process-wide event loop on which sync callers run the async handlers.
+
+    The loop runs forever in a daemon thread, so objects bound to it (HTTP clients,
+    connections) survive across Streamlit reruns and sessions.
+    """
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None or _background_loop.is_closed():
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(target=_background_loop.run_forever, name="llm-handlers-loop", daemon=True).start()
+    return _background_loop
+
+
+def submit_sync(awaitable):
+    """Start an awaitable on the background loop and return a concurrent.futures.Future for its result.
+
+    Lets sync code keep working (e.g. render a stream) while the awaitable runs.
+    """
+    loop = get_background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("run_sync() and submit_sync() cannot be called from the background handler loop; "
+                           "await instead.")
+
+    async def _await():
+        return await awaitable
+
+    return asyncio.run_coroutine_threadsafe(_await(), loop)
+
+
+SYNC_POLL_INTERVAL = 0.25
+
+
+def wait_future(future, poll=None):
+    """Block until a concurrent future finishes, calling poll() on this thread every SYNC_POLL_INTERVAL."""
+    if poll is None:
+        return future.result()
+    while True:
+        try:
+            return future.result(timeout=SYNC_POLL_INTERVAL)
+        except concurrent.futures.TimeoutError:
+            poll()
+
+
+def run_sync(awaitable, poll=None):
+    """Run an awaitable on the background loop and block until it finishes.
+
+    poll, if given, is called on the calling thread while waiting (e.g. to update the page).
+    Must not be called from a coroutine running on the background loop itself.
+    """
+    return wait_future(submit_sync(awaitable), poll)
+
+
+def gather_sync(*awaitables, poll=None):
+    """Run several awaitables concurrently on the background loop and return their results in order."""
+    async def _gather():
+        return await asyncio.gather(*awaitables)
+
+    return run_sync(_gather(), poll)
+
+
+def iter_sync(async_iterable, poll=None):
+    """Iterate an async iterable from sync code, running each step on the background loop.
+
+    poll is called while waiting for an item, as in run_sync().
+    """
+    loop = get_background_loop()
+    iterator = async_iterable.__aiter__()
+
+    async def _next():
+        return await iterator.__anext__()
+
+    finished = False
+    try:
+        while True:
+            try:
+                item = wait_future(asyncio.run_coroutine_threadsafe(_next(), loop), poll)
+            except StopAsyncIteration:
+                finished = True
+                return
+            yield item
+    finally:
+        # release the provider stream if the consumer stopped early (e.g. a Streamlit rerun)
+        if not finished and hasattr(iterator, "aclose"):
+            asyncio.run_coroutine_threadsafe(iterator.aclose(), loop)
+
+
+# --- provider client factories, pooled per API key in CLIENT_POOL ---
+PERPLEXITY_URL = "https://api.perplexity.ai/chat/completions"
+PERPLEXITY_TIMEOUT = 600
+
+
+def new_openai_client(api_key, base_url=None):
+    return openai.AsyncOpenAI(api_key=api_key, base_url=base_url)
+
+
+def new_claude_client(api_key):
+    return anthropic.AsyncAnthropic(api_key=api_key)
+
+
+def new_gemini_client(api_key):
+    return glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key})
+
+
+def new_perplexity_client(api_key):
+    return httpx.AsyncClient(
+        timeout=PERPLEXITY_TIMEOUT,
+        limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=DEFAULT_IDLE_TIMEOUT),
+        headers={
+            "accept": "application/json",
+            "content-type": "application/json",
+            "authorization": f"Bearer {api_key}"
+        },
+    )
+
+
+# recording token usage and cost
+def record_usage(context, input_tokens, output_tokens):
+    """Add the cost of a call to context['TOTAL_PRICE'] and keep its token counts in context['usage']."""
+    input_price = int(input_tokens) * context["price_input_token_1M"] / 1000000
+    output_price = int(output_tokens) * context["price_output_token_1M"] / 1000000
+    total_price = input_price + output_price
+    context['TOTAL_PRICE'] += total_price
+    context["usage"] = {"input_tokens": int(input_tokens), "output_tokens": int(output_tokens)}
+
 # openai llm handler
-def handle_openai(context):
+def build_openai_messages(context):
+    """Build the OpenAI chat messages for a request context."""
+    messages = format_chat_history(context["chat_history"], "openai") + [
+        {"role": "system", "content": context["SYSTEM_PROMPT"]},
+        {"role": "assistant", "content": context["phase_instructions"]},
+        {"role": "user", "content": context["user_prompt"]}
+    ]
+
+    if context["supports_image"] and context["image_urls"]:
+        messages.insert(2, {"role": "user", "content": [{"type": "image_url", "image_url": {"url": url}} for url in
+                                                        context["image_urls"]]})
+    return messages
+
+
+def openai_request_params(context):
+    params = dict(
+        model=context["model"],
+        messages=build_openai_messages(context),
+        temperature=context["temperature"],
+        max_tokens=context["max_tokens"],
+        top_p=context["top_p"],
+        frequency_penalty=context["frequency_penalty"],
+        presence_penalty=context["presence_penalty"]
+    )
+    if context.get("response_format") == "json":
+        params["response_format"] = {"type": "json_object"}
+    return params
+
+
+async def handle_openai_async(context):
     """Handle requests for OpenAI models."""
-    if not context["supports_image"] and context.get("image_urls"):
-        return "Images are not supported by selected model."
+    check_image_support(context)
+    api_key = get_api_key("openai", context)
+    async with CLIENT_POOL.lease("openai", api_key, new_openai_client) as client:
+        response = await client.chat.completions.create(**openai_request_params(context))
+    record_usage(context, response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response.choices[0].message.content
+
+
+async def stream_openai(context):
+    """Stream the response of an OpenAI model, yielding text deltas as they arrive."""
+    check_image_support(context)
+    api_key = get_api_key("openai", context)
+    async with CLIENT_POOL.lease("openai", api_key, new_openai_client) as client:
+        stream = await client.chat.completions.create(**openai_request_params(context), stream=True,
+                                                      stream_options={"include_usage": True})
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage:
+                record_usage(context, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+
+# openai-compatible llm handler (self-hosted and local inference servers)
+OPENAI_COMPATIBLE_BASE_URL = "http://localhost:8000/v1"
+OPENAI_COMPATIBLE_PLACEHOLDER_KEY = "not-needed"
+
+
+def openai_compatible_endpoint(context):
+    """Return (base_url, api_key) of an OpenAI-compatible server.
+
+    The base URL comes from the model's "base_url", then OPENAI_COMPATIBLE_BASE_URL in the environment.
+    Most servers need no key; OPENAI_COMPATIBLE_API_KEY is sent if set.
+    """
+    base_url = context.get("base_url") or os.getenv("OPENAI_COMPATIBLE_BASE_URL", OPENAI_COMPATIBLE_BASE_URL)
     try:
-        openai.api_key = get_api_key("openai", context)
-
-        messages = format_chat_history(context["chat_history"], "openai") + [
-            {"role": "system", "content": context["SYSTEM_PROMPT"]},
-            {"role": "assistant", "content": context["phase_instructions"]},
-            {"role": "user", "content": context["user_prompt"]}
-        ]
-
-        if context["supports_image"] and context["image_urls"]:
-            messages.insert(2, {"role": "user", "content": [{"type": "image_url", "image_url": {"url": url}} for url in
-                                                            context["image_urls"]]})
-
-        response = openai.chat.completions.create(
-            model=context["model"],
-            messages=messages,
-            temperature=context["temperature"],
-            max_tokens=context["max_tokens"],
-            top_p=context["top_p"],
-            frequency_penalty=context["frequency_penalty"],
-            presence_penalty=context["presence_penalty"]
-        )
-        input_price = int(response.usage.prompt_tokens) * context["price_input_token_1M"] / 1000000
-        output_price = int(response.usage.completion_tokens) * context["price_output_token_1M"] / 1000000
-        total_price = input_price + output_price
-        context['TOTAL_PRICE'] += total_price
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Unexpected error while handling OpenAI request: {e}"
+        api_key = get_api_key("openai_compatible", context)
+    except ValueError:
+        api_key = OPENAI_COMPATIBLE_PLACEHOLDER_KEY
+    return base_url, api_key
+
+
+def lease_openai_compatible_client(context):
+    """Lease the pooled client of the context's OpenAI-compatible server (one per base URL and key)."""
+    base_url, api_key = openai_compatible_endpoint(context)
+    return CLIENT_POOL.lease("openai_compatible", f"{base_url} {api_key}",
+                             lambda _: new_openai_client(api_key, base_url))
+
+
+async def handle_openai_compatible_async(context):
+    """Handle requests for models served by an OpenAI-compatible endpoint."""
+    check_image_support(context)
+    async with lease_openai_compatible_client(context) as client:
+        response = await client.chat.completions.create(**openai_request_params(context))
+    if response.usage:
+        record_usage(context, response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response.choices[0].message.content
+
+
+async def stream_openai_compatible(context):
+    """Stream the response of a model served by an OpenAI-compatible endpoint."""
+    check_image_support(context)
+    async with lease_openai_compatible_client(context) as client:
+        stream = await client.chat.completions.create(**openai_request_params(context), stream=True,
+                                                      stream_options={"include_usage": True})
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None):
+                record_usage(context, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
 
 # claude llm handler
-def handle_claude(context):
+def build_claude_messages(context):
+    """Build the Anthropic messages for a request context."""
+    messages = format_chat_history(context["chat_history"], "claude") + [
+        {"role": "user", "content": [{"type": "text", "text": context["user_prompt"]}]},
+        {"role": "assistant", "content": [{"type": "text", "text": context["phase_instructions"]}]}
+    ]
+
+    if context["supports_image"] and context["image_urls"]:
+        for image_url in context["image_urls"]:
+            # Extract base64 data from the image URL
+            base64_data = image_url.split(",")[1]
+            mime_type = re.search(r"data:(.*?);base64,", image_url).group(1) if re.search(r"data:(.*?);base64,",
+                                                                                          image_url) else None
+            # Add image to the messages
+            messages.append({
+                "role": "user",
+                "content": [{
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": mime_type,
+                        "data": base64_data
+                    }
+                }]
+            })
+    return messages
+
+
+def claude_request_params(context):
+    return dict(
+        model=context["model"],
+        max_tokens=context["max_tokens"],
+        temperature=context["temperature"],
+        system=f"{context['SYSTEM_PROMPT']}",
+        messages=build_claude_messages(context)
+    )
+
+
+async def handle_claude_async(context):
     """Handle requests for Claude models."""
-    if not context["supports_image"] and context.get("image_urls"):
-        return "Images are not supported by selected model."
-    try:
-        client = anthropic.Anthropic(api_key=get_api_key("claude", context))
-
-        messages = format_chat_history(context["chat_history"], "claude") + [
-            {"role": "user", "content": [{"type": "text", "text": context["user_prompt"]}]},
-            {"role": "assistant", "content": [{"type": "text", "text": context["phase_instructions"]}]}
-        ]
-
-        if context["supports_image"] and context["image_urls"]:
-            for image_url in context["image_urls"]:
-                # Extract base64 data from the image URL
-                base64_data = image_url.split(",")[1]
-                mime_type = re.search(r"data:(.*?);base64,", image_url).group(1) if re.search(r"data:(.*?);base64,",
-                                                                                              image_url) else None
-                # Add image to the messages
-                messages.append({
-                    "role": "user",
-                    "content": [{
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": mime_type,
-                            "data": base64_data
-                        }
-                    }]
-                })
-        response = client.messages.create(
-            model=context["model"],
-            max_tokens=context["max_tokens"],
-            temperature=context["temperature"],
-            system=f"{context['SYSTEM_PROMPT']}",
-            messages=messages
-        )
-        input_price = int(response.usage.input_tokens) * context["price_input_token_1M"] / 1000000
-        output_price = int(response.usage.output_tokens) * context["price_output_token_1M"] / 1000000
-        total_price = input_price + output_price
-        context['TOTAL_PRICE'] += total_price
-        return '\n'.join([block.text for block in response.content if block.type == 'text'])
-    except Exception as e:
-        return f"Unexpected error while handling Claude request: {e}"
+    check_image_support(context)
+    api_key = get_api_key("claude", context)
+    async with CLIENT_POOL.lease("claude", api_key, new_claude_client) as client:
+        response = await client.messages.create(**claude_request_params(context))
+    record_usage(context, response.usage.input_tokens, response.usage.output_tokens)
+    return '\n'.join([block.text for block in response.content if block.type == 'text'])
+
+
+async def stream_claude(context):
+    """Stream the response of a Claude model, yielding text deltas as they arrive."""
+    check_image_support(context)
+    api_key = get_api_key("claude", context)
+    input_tokens = output_tokens = 0
+    async with CLIENT_POOL.lease("claude", api_key, new_claude_client) as client:
+        stream = await client.messages.create(**claude_request_params(context), stream=True)
+        async for event in stream:
+            if event.type == "message_start":
+                input_tokens = event.message.usage.input_tokens
+            elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                yield event.delta.text
+            elif event.type == "message_delta":
+                output_tokens = event.usage.output_tokens
+    record_usage(context, input_tokens, output_tokens)
 
 # gemini llm handler
-def handle_gemini(context):
+def build_gemini_messages(context):
+    """Build the Gemini chat history for a request context."""
+    messages = format_chat_history(context["chat_history"], "gemini") + [
+        {"role": "user", "parts": [context["user_prompt"]]},
+        {"role": "model", "parts": [context["phase_instructions"]]}
+    ]
+
+    if context["supports_image"] and context["image_urls"]:
+        for image_url in context["image_urls"]:
+            # Add image to the messages
+            messages.append({
+                "role": "user",
+                "parts": [image_url]
+            })
+    return messages
+
+
+def start_gemini_chat(context, client):
+    """Start a Gemini chat session for a request context on a pooled client."""
+    model = genai.GenerativeModel(
+        model_name=context["model"],
+        generation_config= {"temperature": context["temperature"],"top_p": context["top_p"],"max_output_tokens": context["max_tokens"],"response_mime_type":"application/json" if context.get("response_format") == "json" else "text/plain"},
+        system_instruction=f"{context['SYSTEM_PROMPT']}"
+    )
+    # google-generativeai has no public way to give GenerativeModel a client; it uses the private
+    # _async_client, if set, instead of the process-global one of genai.configure. The SDK is pinned
+    # in requirements.txt for this, and a version without the attribute fails loudly here.
+    if not hasattr(model, "_async_client"):
+        raise RuntimeError("This google-generativeai version cannot use pooled clients; "
+                           "install the version pinned in requirements.txt.")
+    model._async_client = client
+    return model.start_chat(history=build_gemini_messages(context))
+
+
+async def handle_gemini_async(context):
     """Handle requests for Gemini models."""
-    if not context["supports_image"] and context.get("image_urls"):
-        return "Images are not supported by selected model."
-    try:
-        genai.configure(api_key=get_api_key("google", context))
-
-        messages = format_chat_history(context["chat_history"], "gemini") + [
-            {"role": "user", "parts": [context["user_prompt"]]},
-            {"role": "model", "parts": [context["phase_instructions"]]}
-        ]
-
-        if context["supports_image"] and context["image_urls"]:
-            for image_url in context["image_urls"]:
-                # Add image to the messages
-                messages.append({
-                    "role": "user",
-                    "parts": [image_url]
-                })
-
-        chat_session = genai.GenerativeModel(
-            model_name=context["model"],
-            generation_config= {"temperature": context["temperature"],"top_p": context["top_p"],"max_output_tokens": context["max_tokens"],"response_mime_type":"text/plain"},
-            system_instruction=f"{context['SYSTEM_PROMPT']}"
-        ).start_chat(history=messages)
-        response = chat_session.send_message(context["user_prompt"])
-        return response.text
-    except Exception as e:
-        return f"Unexpected error while handling Gemini request: {e}"
+    check_image_support(context)
+    api_key = get_api_key("google", context)
+    async with CLIENT_POOL.lease("gemini", api_key, new_gemini_client) as client:
+        chat_session = start_gemini_chat(context, client)
+        response = await chat_session.send_message_async(context["user_prompt"])
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        record_usage(context, usage.prompt_token_count, usage.candidates_token_count)
+    return response.text
 
-# perplexity handler
-def handle_perplexity(context):
-    """Handle requests for Perplexity models."""
-    if not context["supports_image"] and context.get("image_urls"):
-        return "Images are not supported by selected model."
-    api_key = get_api_key("perplexity", context)
-    url = "https://api.perplexity.ai/chat/completions"
 
+async def stream_gemini(context):
+    """Stream the response of a Gemini model, yielding text chunks as they arrive."""
+    check_image_support(context)
+    api_key = get_api_key("google", context)
+    async with CLIENT_POOL.lease("gemini", api_key, new_gemini_client) as client:
+        chat_session = start_gemini_chat(context, client)
+        response = await chat_session.send_message_async(context["user_prompt"], stream=True)
+        async for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        record_usage(context, usage.prompt_token_count, usage.candidates_token_count)
+
+# perplexity handler
+def build_perplexity_payload(context):
+    """Build the Perplexity chat completions payload for a request context."""
     # Prepare messages
     messages = [
                    {"role": "system", "content": context["SYSTEM_PROMPT"] + context["phase_instructions"]}
@@ -351,34 +742,57 @@ def handle_perplexity(context):
                 }
             })
 
-    # Prepare payload
-    payload = {
+    return {
         "model": context["model"],
         "messages": messages
     }
 
-    # Prepare headers
-    headers = {
-        "accept": "application/json",
-        "content-type": "application/json",
-        "authorization": f"Bearer {api_key}"
-    }
 
-    # Make the API request
-    try:
-        response = requests.post(url, json=payload, headers=headers)
-        response.raise_for_status()  # Raise an error for bad status codes
+async def handle_perplexity_async(context):
+    """Handle requests for Perplexity models."""
+    check_image_support(context)
+    api_key = get_api_key("perplexity", context)
+    payload = build_perplexity_payload(context)
+
+    # Make the API request over the pooled keep-alive client (headers are set per key)
+    async with CLIENT_POOL.lease("perplexity", api_key, new_perplexity_client) as client:
+        response = await client.post(PERPLEXITY_URL, json=payload)
+    response.raise_for_status()  # Raise an error for bad status codes
+
+    response_json = response.json()
+    usage = response_json.get("usage")
+    if usage:
+        record_usage(context, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+    if "choices" in response_json and len(response_json["choices"]) > 0:
+        return response_json["choices"][0]["message"]["content"]
+    else:
+        raise ProviderError("Unexpected response format from Perplexity API.", "perplexity")
 
-        response_json = response.json()
-        if "choices" in response_json and len(response_json["choices"]) > 0:
-            return response_json["choices"][0]["message"]["content"]
-        else:
-            return "Unexpected response format from Perplexity API."
 
-    except requests.exceptions.HTTPError as http_err:
-        return f"HTTP error occurred while handling Perplexity request: {http_err}"
-    except requests.exceptions.RequestException as req_err:
-        return f"Error occurred while making the Perplexity request: {req_err}"
+async def stream_perplexity(context):
+    """Stream the response of a Perplexity model from its server-sent events."""
+    check_image_support(context)
+    api_key = get_api_key("perplexity", context)
+    payload = {**build_perplexity_payload(context), "stream": True}
+
+    async with CLIENT_POOL.lease("perplexity", api_key, new_perplexity_client) as client:
+        async with client.stream("POST", PERPLEXITY_URL, json=payload) as response:
+            response.raise_for_status()
+            usage = None
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                usage = chunk.get("usage") or usage
+                choices = chunk.get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if delta:
+                    yield delta
+    if usage:
+        record_usage(context, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
 
 
 def rag_handler(context):
@@ -405,18 +819,47 @@ def rag_handler(context):
     rag_pipeline.check_and_store_metadata_and_embeddings(file_path)
 
     # Step 4: Retrieve relevant documents based on the user's query and generate a response
-    try:
-        # Call the retrieval and response generation pipeline
-        rag_response, cost = rag_pipeline.retrieve_and_generate_response(
-            question= user_prompt,
-            template_text= str(context["phase_instructions"])+" User answer is "+ user_prompt
-        )
-        print(rag_response,cost)
-        # Step 5: Update the context with the cost (if applicable)
-        context["TOTAL_PRICE"] = context.get("TOTAL_PRICE", 0) + (cost if cost else 0)
-        return rag_response
-    except Exception as e:
-        return f"Error during RAG processing: {e}"
+    # Call the retrieval and response generation pipeline
+    rag_response, cost = rag_pipeline.retrieve_and_generate_response(
+        question= user_prompt,
+        template_text= str(context["phase_instructions"])+" User answer is "+ user_prompt
+    )
+    print(rag_response,cost)
+    # Step 5: Update the context with the cost (if applicable)
+    context["TOTAL_PRICE"] = context.get("TOTAL_PRICE", 0) + (cost if cost else 0)
+    return rag_response
+
+
+async def rag_handler_async(context):
+    """Run the blocking RAG pipeline in a worker thread so it can be awaited like the other handlers."""
+    return await asyncio.to_thread(rag_handler, context)
+
+
+# Sync handlers are thin wrappers that run dispatch_completion on the background loop, so they get the
+# same completion cache, context-window check, rate limiting, retries and telemetry as async callers
+def handle_openai(context):
+    """Handle requests for OpenAI models."""
+    return run_sync(dispatch_completion(context, "openai"))
+
+
+def handle_claude(context):
+    """Handle requests for Claude models."""
+    return run_sync(dispatch_completion(context, "claude"))
+
+
+def handle_gemini(context):
+    """Handle requests for Gemini models."""
+    return run_sync(dispatch_completion(context, "gemini"))
+
+
+def handle_perplexity(context):
+    """Handle requests for Perplexity models."""
+    return run_sync(dispatch_completion(context, "perplexity"))
+
+
+def handle_openai_compatible(context):
+    """Handle requests for models served by an OpenAI-compatible endpoint."""
+    return run_sync(dispatch_completion(context, "openai_compatible"))
 
 
 # Mapping of model families to handler functions
@@ -425,14 +868,181 @@ HANDLERS = {
     "claude": handle_claude,
     "gemini": handle_gemini,
     "perplexity": handle_perplexity,
+    "openai_compatible": handle_openai_compatible,
     "rag":rag_handler
 }
 
+# Mapping of model families to async handler functions
+ASYNC_HANDLERS = {
+    "openai": handle_openai_async,
+    "claude": handle_claude_async,
+    "gemini": handle_gemini_async,
+    "perplexity": handle_perplexity_async,
+    "openai_compatible": handle_openai_compatible_async,
+    "rag": rag_handler_async
+}
+
+
+# Mapping of model families to streaming handlers (async generators of text chunks)
+STREAM_HANDLERS = {
+    "openai": stream_openai,
+    "claude": stream_claude,
+    "gemini": stream_gemini,
+    "perplexity": stream_perplexity,
+    "openai_compatible": stream_openai_compatible,
+}
+
+
+def configure_provider_calls(config):
+    """Apply the provider call settings of an app config; shared by the app and the batch runner.
+
+    Reads RETRY_POLICY and CIRCUIT_BREAKER (core_logic.resilience), RATE_LIMITS and RATE_LIMIT_DB
+    (core_logic.rate_limit), TELEMETRY_LOG and METRICS_PORT (core_logic.telemetry).
+    """
+    configure_resilience(config.get('RETRY_POLICY'), config.get('CIRCUIT_BREAKER'))
+    RATE_LIMITER.configure(config.get('RATE_LIMITS'), config.get('RATE_LIMIT_DB'))
+    TELEMETRY.configure(config.get('TELEMETRY_LOG'))
+    if config.get('METRICS_PORT'):
+        start_metrics_server(config['METRICS_PORT'])
+
+
+# services whose API key a model family uses, where the names differ
+API_KEY_SERVICES = {"gemini": "google"}
+
+
+async def wait_for_rate_limit(context, family):
+    """Wait for RATE_LIMITER to admit a call of the request's estimated prompt tokens + max_tokens.
+
+    context["on_queue"], if set, is called with the queue position while waiting.
+    """
+    try:
+        api_key = get_api_key(API_KEY_SERVICES.get(family, family), context)
+    except ValueError:
+        api_key = None  # the handler reports the missing key
+    report = context.get("preflight") or preflight(context)
+    await RATE_LIMITER.acquire(family, api_key, report["prompt_tokens"] + report["max_output_tokens"],
+                               context.get("on_queue"))
+
+
+def check_context_window(context):
+    """Run the token-budget preflight, store it in context["preflight"] and raise if the prompt cannot fit."""
+    report = preflight(context)
+    context["preflight"] = report
+    if not report["fits"]:
+        raise ContextWindowExceeded(report)
+    return report
+
+
+async def _complete_call(context, family, handler, cache_key, publish):
+    """Send one completion request and store its response; the start function of a SINGLE_FLIGHT flight."""
+    async def attempt():
+        # every attempt, retries included, waits for the rate limiter and is timed on its own
+        await wait_for_rate_limit(context, family)
+        async with TELEMETRY.call(context, family):
+            return await handler(context)
+
+    try:
+        result = await call_with_resilience(family, attempt)
+    except ProviderError as e:
+        context["error"] = str(e)
+        raise
+    COMPLETION_CACHE.put(cache_key, result, context["TOTAL_PRICE"])
+    return result
+
+
+async def _stream_call(context, family, stream_handler, cache_key, publish):
+    """Stream one completion request to publish() and store the full response."""
+    async def open_stream():
+        await wait_for_rate_limit(context, family)
+        async with TELEMETRY.call(context, family, stream=True) as call:
+            async for chunk in stream_handler(context):
+                call.first_byte()
+                yield chunk
+
+    chunks = []
+    try:
+        async for chunk in stream_with_resilience(family, open_stream):
+            chunks.append(chunk)
+            publish(chunk)
+    except ProviderError as e:
+        context["error"] = str(e)
+        raise
+    result = "".join(chunks)
+    COMPLETION_CACHE.put(cache_key, result, context["TOTAL_PRICE"])
+    return result
+
+
+async def dispatch_completion(context, family, use_cache=True):
+    """Await the async handler of the given model family with the given context.
+
+    Responses are served from and stored in COMPLETION_CACHE unless use_cache is False
+    (e.g. for revisions, where a different answer is wanted). Cache hits cost nothing and
+    set context["cache_hit"]. Other requests are checked against the model's context window
+    first and raise ContextWindowExceeded without a network call if they cannot fit.
+    Identical requests that are already running are joined instead of sent again (see
+    core_logic.single_flight), unless use_cache is False. Every attempt of a request that is
+    sent, retries included, waits for the rate limiter of its provider and API key; failed
+    calls are retried per core_logic.resilience and raise a ProviderError, with the message
+    also stored in context["error"].
+    """
+    handler = ASYNC_HANDLERS.get(family)
+    if not handler:
+        raise NotImplementedError(f"No handler implemented for model family '{family}'")
+
+    cache_key = completion_cache_key(context, family)
+    if use_cache:
+        cached = COMPLETION_CACHE.get(cache_key)
+        if cached is not None:
+            context["cache_hit"] = True
+            return cached["response"]
+
+    check_context_window(context)
+    return await SINGLE_FLIGHT.run(cache_key if use_cache else None, context,
+                                   lambda flight_context, publish: _complete_call(flight_context, family, handler,
+                                                                                  cache_key, publish))
+
+
+async def stream_completion(context, family, use_cache=True):
+    """Async generator yielding the response of the given model family chunk by chunk.
+
+    Uses the same completion cache and request coalescing as dispatch_completion: a cache hit
+    is yielded as a single chunk, a joined stream replays the chunks produced so far, and a
+    fully streamed successful response is stored afterwards. Families without a streaming
+    handler yield their complete response once. A stream that fails before its first chunk is
+    retried; later failures raise a ProviderError.
+    """
+    stream_handler = STREAM_HANDLERS.get(family)
+    if not stream_handler:
+        yield await dispatch_completion(context, family, use_cache=use_cache)
+        return
+
+    cache_key = completion_cache_key(context, family)
+    if use_cache:
+        cached = COMPLETION_CACHE.get(cache_key)
+        if cached is not None:
+            context["cache_hit"] = True
+            yield cached["response"]
+            return
+
+    check_context_window(context)
+    chunks = SINGLE_FLIGHT.stream(cache_key if use_cache else None, context,
+                                  lambda flight_context, publish: _stream_call(flight_context, family, stream_handler,
+                                                                               cache_key, publish))
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        # leave the flight right away if the consumer stopped early
+        await chunks.aclose()
+
 
 # --- Quiz Export Functions ---
 def format_quiz_for_download(quiz_content: str, format_type: str = "plain_text") -> str:
     """
     Format quiz content for download.
+
+    Structured (JSON) quizzes are rendered locally into the requested format; other content
+    is returned as written by the LLM.
     
     Args:
         quiz_content: The raw quiz content from the LLM
@@ -441,21 +1051,29 @@ def format_quiz_for_download(quiz_content: str, format_type: str = "plain_text")
     Returns:
         Formatted quiz content as string
     """
+    quiz = try_parse_quiz(quiz_content) if quiz_content.lstrip().startswith(("{", "[", "```")) else None
+    if quiz is not None:
+        return render_quiz(quiz, format_type)
     if format_type.lower() == "olx":
         return quiz_content  # OLX format should already be formatted by the LLM
     else:  # plain_text
         return quiz_content  # Plain text should already be formatted by the LLM
 
 
-def generate_download_filename(output_format: str = "txt") -> str:
+def generate_download_filename(output_format: str = "txt", suffix: str = None) -> str:
     """Generate a filename for the quiz download.
 
     The `output_format` may be values like 'plain_text', 'txt', 'olx', or 'xml'.
     We normalize accepted values so that both 'olx' and 'xml' produce an .xml filename,
     and everything else produces a .txt filename.
+
+    An optional `suffix` (e.g. a Vimeo video id) is appended to the timestamp so that
+    several quizzes generated within the same second get distinct names.
     """
     from datetime import datetime
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if suffix:
+        timestamp = f"{timestamp}_{re.sub(r'[^A-Za-z0-9_-]+', '_', str(suffix))}"
     fmt = (output_format or "").lower()
     if fmt in ("olx", "xml") or "olx" in fmt:
         return f"quiz_{timestamp}.xml"
@@ -0,0 +1,203 @@
+"""
+Hedged requests for tail-latency control.
+
+A hedged request is sent to the primary model first. If the primary has not answered within a
+deadline, the same request is also sent to a secondary model (possibly of another family) and
+whichever finishes first wins; the other request is cancelled. The deadline is a percentile of
+the primary's recent latencies (time to the complete response, or to the first chunk when
+streaming), clamped to [min_delay, max_delay], so only the slowest few percent of requests
+ever pay for a second call.
+
+HEDGE_STATS counts how often each model won.
+"""
+import asyncio
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+from core_logic.handlers import dispatch_completion, stream_completion
+
+DEFAULT_HEDGE_POLICY = {
+    "secondary": None,       # key of LLM_CONFIG; hedging is off without it
+    "percentile": 95,
+    "min_samples": 20,       # below this many samples default_delay is used
+    "default_delay": 30.0,
+    "min_delay": 2.0,
+    "max_delay": 120.0,
+}
+
+
+class LatencyTracker:
+    """Sliding windows of recent latencies per (kind, family, model)."""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    def percentile(self, key, percentile):
+        """Return the percentile of the recorded latencies and the number of samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if not samples:
+            return None, 0
+        index = min(len(samples) - 1, max(0, round(percentile / 100 * len(samples)) - 1))
+        return samples[index], len(samples)
+
+
+LATENCIES = LatencyTracker()
+HEDGE_STATS = Counter()
+
+
+def hedge_delay(kind, family, model, policy):
+    """Seconds to wait for the primary before the secondary request is sent."""
+    value, samples = LATENCIES.percentile((kind, family, model), policy["percentile"])
+    if value is None or samples < policy["min_samples"]:
+        value = policy["default_delay"]
+    return min(policy["max_delay"], max(policy["min_delay"], value))
+
+
+async def _timed_completion(context, family, use_cache):
+    started = time.monotonic()
+    result = await dispatch_completion(context, family, use_cache=use_cache)
+    if not context.get("error") and not context.get("cache_hit"):
+        LATENCIES.record(("complete", family, context["model"]), time.monotonic() - started)
+    return result
+
+
+def _record_winner(primary_context, winner, family, model, delay, hedged):
+    primary_context["hedge"] = {"winner": winner, "family": family, "model": model, "delay": delay,
+                                "hedged": hedged}
+    HEDGE_STATS[(winner, model)] += 1
+
+
+async def hedged_completion(primary, secondary, policy=None, use_cache=True):
+    """Run a completion, hedging it with a secondary request after the percentile deadline.
+
+    Args:
+        primary: (context, family) of the primary model
+        secondary: (context, family) of the secondary model, or None to disable hedging
+        policy: Overrides of DEFAULT_HEDGE_POLICY
+        use_cache: Whether the completion cache may be used
+
+    Returns the winning response. The cost of both requests is added to the primary context's
+    TOTAL_PRICE and the outcome is recorded in primary_context["hedge"].
+    """
+    policy = {**DEFAULT_HEDGE_POLICY, **(policy or {})}
+    primary_context, primary_family = primary
+    primary_task = asyncio.ensure_future(_timed_completion(primary_context, primary_family, use_cache))
+    tasks = {primary_task: ("primary", primary_context, primary_family)}
+    secondary_context = None
+    # the finally also covers a cancellation while waiting for the primary, before any hedge
+    try:
+        if secondary is None:
+            return await primary_task
+
+        delay = hedge_delay("complete", primary_family, primary_context["model"], policy)
+        done, _ = await asyncio.wait({primary_task}, timeout=delay)
+        # a failed primary (e.g. an open circuit breaker) is hedged right away
+        if done and primary_task.exception() is None:
+            _record_winner(primary_context, "primary", primary_family, primary_context["model"], delay, False)
+            return primary_task.result()
+
+        secondary_context, secondary_family = secondary
+        secondary_task = asyncio.ensure_future(_timed_completion(secondary_context, secondary_family, use_cache))
+        tasks[secondary_task] = ("secondary", secondary_context, secondary_family)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                winner, context, family = tasks[task]
+                if task.exception() is None:
+                    primary_context.pop("error", None)
+                    _record_winner(primary_context, winner, family, context["model"], delay, True)
+                    return task.result()
+        # both failed
+        return primary_task.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        if secondary_context is not None and secondary_context.get("TOTAL_PRICE"):
+            primary_context["TOTAL_PRICE"] = primary_context.get("TOTAL_PRICE", 0) + secondary_context["TOTAL_PRICE"]
+
+
+async def _first_chunk(iterator):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def hedged_stream(primary, secondary, policy=None, use_cache=True):
+    """Async generator streaming a completion, hedged on the time to the first chunk.
+
+    The stream whose first chunk arrives first is passed through; the other one is cancelled.
+    Arguments are those of hedged_completion().
+    """
+    policy = {**DEFAULT_HEDGE_POLICY, **(policy or {})}
+    primary_context, primary_family = primary
+    streams = {"primary": (primary_context, primary_family, stream_completion(primary_context, primary_family,
+                                                                               use_cache=use_cache))}
+    started = time.monotonic()
+    tasks = {asyncio.ensure_future(_first_chunk(streams["primary"][2])): "primary"}
+    delay = None
+    try:
+        if secondary is not None:
+            delay = hedge_delay("first_chunk", primary_family, primary_context["model"], policy)
+            done, _ = await asyncio.wait(set(tasks), timeout=delay)
+            if not done or next(iter(done)).exception() is not None:
+                secondary_context, secondary_family = secondary
+                streams["secondary"] = (secondary_context, secondary_family,
+                                        stream_completion(secondary_context, secondary_family, use_cache=use_cache))
+                tasks[asyncio.ensure_future(_first_chunk(streams["secondary"][2]))] = "secondary"
+
+        pending = set(tasks)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # prefer a stream that started; if all failed, the primary's error is raised below
+            winner_task = next((task for task in done if task.exception() is None), None)
+            if winner_task is not None or not pending:
+                break
+    except BaseException:
+        # cancelled before a stream was chosen: stop and close every stream started so far
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for _, _, stream in streams.values():
+            await stream.aclose()
+        raise
+    if winner_task is None:
+        winner_task = next(task for task, name in tasks.items() if name == "primary")
+    winner = tasks[winner_task]
+    for task in pending:
+        task.cancel()
+        loser = streams[tasks[task]][2]
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+        await loser.aclose()
+
+    context, family, stream = streams[winner]
+    if winner == "primary" and not context.get("cache_hit"):
+        LATENCIES.record(("first_chunk", family, context["model"]), time.monotonic() - started)
+    if secondary is not None:
+        _record_winner(primary_context, winner, family, context["model"], delay, len(streams) > 1)
+
+    try:
+        first = winner_task.result()
+        if first is None:
+            return
+        yield first
+        async for chunk in stream:
+            yield chunk
+    finally:
+        # also when the consumer stops reading early, so the provider connection is released now
+        await stream.aclose()
+        if context is not primary_context:
+            primary_context["TOTAL_PRICE"] = primary_context.get("TOTAL_PRICE", 0) + context.get("TOTAL_PRICE", 0)
@@ -0,0 +1,129 @@
+"""
+Chat history policies applied to a handler context before it is sent.
+
+Every chat history entry holds the full formatted prompt of an earlier turn, often including
+a whole transcript, so resending the complete history makes revisions on long videos grow
+quadratically in input tokens. A policy bounds what is resent:
+
+- "full": the complete history (the old behaviour)
+- "last_n": the last `max_turns` turns
+- "token_budget": the newest turns that fit into `max_tokens` estimated tokens
+- "summary": like "token_budget", with the evicted older turns replaced by a rolling summary
+
+In every mode but "full", the user side of each resent turn (the formatted prompt, with its
+transcript) is first cut to `max_entry_tokens`; the model's answers are resent whole, so a quiz
+being revised is never cut off. The token budget is further limited to what the model's context
+window leaves after the current prompt, but the newest turn is always kept.
+"""
+from core_logic.handlers import dispatch_completion
+from core_logic.tokens import MESSAGE_OVERHEAD_TOKENS, estimate_tokens, preflight, trim_to_tokens
+
+HISTORY_MODES = ("full", "last_n", "token_budget", "summary")
+DEFAULT_HISTORY_POLICY = {
+    "mode": "token_budget",
+    "max_turns": 6,
+    "max_tokens": 6000,
+    "max_entry_tokens": 2000,
+    "summary_tokens": 500,
+}
+
+SUMMARY_INSTRUCTIONS = (
+    "Summarize the conversation below for your own later reference in at most {summary_tokens} tokens. "
+    "Keep the topic, the user's requirements and preferences, and what was already generated; "
+    "drop transcript text and verbatim questions.\n\n"
+)
+SUMMARY_USER_PROMPT = "Summary of the earlier conversation:"
+
+
+def entry_tokens(entry):
+    """Estimated tokens of one chat history entry."""
+    return estimate_tokens(entry.get("user")) + estimate_tokens(entry.get("assistant")) + \
+        2 * MESSAGE_OVERHEAD_TOKENS
+
+
+def compact_entry(entry, max_entry_tokens):
+    """Return a copy of a history entry with the user text cut to max_entry_tokens; the answer is kept whole."""
+    if not max_entry_tokens:
+        return entry
+    return {**entry, "user": trim_to_tokens(entry.get("user") or "", max_entry_tokens)}
+
+
+def history_token_budget(context, policy):
+    """Tokens available for history: the policy budget, limited by what the context window leaves."""
+    report = preflight({**context, "chat_history": []})
+    return max(0, min(policy.get("max_tokens", DEFAULT_HISTORY_POLICY["max_tokens"]),
+                      report["available_prompt_tokens"] - report["prompt_tokens"]))
+
+
+def window_history(chat_history, policy, budget=None):
+    """Split a chat history into (evicted, kept) turns according to the policy.
+
+    Kept turns are compacted and in their original order; evicted turns are returned unchanged.
+    """
+    mode = policy.get("mode", DEFAULT_HISTORY_POLICY["mode"])
+    if mode not in HISTORY_MODES:
+        raise ValueError(f"Unknown history mode '{mode}', expected one of {', '.join(HISTORY_MODES)}")
+    if mode == "full":
+        return [], list(chat_history)
+
+    max_entry_tokens = policy.get("max_entry_tokens", DEFAULT_HISTORY_POLICY["max_entry_tokens"])
+    max_turns = policy.get("max_turns")
+    recent = list(chat_history[-max_turns:]) if max_turns else list(chat_history)
+    evicted = list(chat_history[:len(chat_history) - len(recent)])
+    kept = [compact_entry(entry, max_entry_tokens) for entry in recent]
+    if mode == "last_n" or budget is None:
+        return evicted, kept
+
+    # newest turns first, until the token budget is used up; the newest turn is what a revision refers to
+    used = 0
+    for index in range(len(kept) - 1, -1, -1):
+        used += entry_tokens(kept[index])
+        if used > budget and index < len(kept) - 1:
+            return evicted + recent[:index + 1], kept[index + 1:]
+    return evicted, kept
+
+
+async def summarize_history(evicted, context, family, policy):
+    """Fold evicted turns one by one into a rolling summary and return it with its cost.
+
+    Each step summarizes the previous summary plus one turn. The steps go through the completion
+    cache, so on the next request only the newly evicted turn costs a model call.
+    """
+    summary_tokens = policy.get("summary_tokens", DEFAULT_HISTORY_POLICY["summary_tokens"])
+    max_entry_tokens = policy.get("max_entry_tokens", DEFAULT_HISTORY_POLICY["max_entry_tokens"])
+    summary, cost = "", 0.0
+    for entry in evicted:
+        entry = compact_entry(entry, max_entry_tokens)
+        conversation = f"Earlier summary:\n{summary}\n\n" if summary else ""
+        conversation += f"User:\n{entry['user']}\n\nAssistant:\n{entry['assistant']}"
+        step = {**context, "phase_instructions": SUMMARY_INSTRUCTIONS.format(summary_tokens=summary_tokens),
+                "user_prompt": conversation, "image_urls": None, "chat_history": [],
+                "max_tokens": min(context["max_tokens"], summary_tokens), "TOTAL_PRICE": 0}
+        result = await dispatch_completion(step, family)
+        cost += step["TOTAL_PRICE"]
+        summary = result
+    return summary, cost
+
+
+async def apply_history_policy(context, family, policy=None):
+    """Replace context["chat_history"] by the history the policy allows and return the context.
+
+    Records the number of kept and evicted turns in context["history"]; the cost of summaries
+    is added to context["TOTAL_PRICE"].
+    """
+    policy = {**DEFAULT_HISTORY_POLICY, **(policy or {})}
+    chat_history = context.get("chat_history") or []
+    budget = history_token_budget(context, policy) if policy["mode"] in ("token_budget", "summary") else None
+    evicted, kept = window_history(chat_history, policy, budget)
+
+    if evicted and policy["mode"] == "summary":
+        summary, cost = await summarize_history(evicted, context, family, policy)
+        context["TOTAL_PRICE"] = context.get("TOTAL_PRICE", 0) + cost
+        kept = [{"user": SUMMARY_USER_PROMPT, "assistant": summary}] + kept
+        # the summary counts against the same budget; the summary and the newest turn stay
+        while len(kept) > 2 and sum(entry_tokens(entry) for entry in kept) > budget:
+            kept.pop(1)
+
+    context["chat_history"] = kept
+    context["history"] = {"mode": policy["mode"], "kept": len(kept), "evicted": len(evicted)}
+    return context
@@ -4,6 +4,7 @@ LLM_CONFIG = {
         "family": "openai",
         "model": "gpt-5.1",
         "max_tokens": 8192,
+        "context_window": 400000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -16,6 +17,7 @@ LLM_CONFIG = {
         "family": "openai",
         "model": "gpt-4o-mini",
         "max_tokens": 1000,
+        "context_window": 128000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -28,6 +30,7 @@ LLM_CONFIG = {
         "family": "openai",
         "model": "gpt-4-turbo",
         "max_tokens": 1000,
+        "context_window": 128000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -40,6 +43,7 @@ LLM_CONFIG = {
         "family": "rag",
         "model": "gpt-4-turbo",
         "max_tokens": 1000,
+        "context_window": 128000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -52,6 +56,7 @@ LLM_CONFIG = {
         "family": "openai",
         "model": "gpt-4o",
         "max_tokens": 2000,
+        "context_window": 128000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -64,6 +69,7 @@ LLM_CONFIG = {
         "family": "openai",
         "model": "gpt-4o-2025-05-13",
         "max_tokens": 4096,
+        "context_window": 128000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -76,6 +82,7 @@ LLM_CONFIG = {
         "family": "openai",
         "model": "gpt-4-turbo-2024-04-09",
         "max_tokens": 4096,
+        "context_window": 128000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -88,6 +95,7 @@ LLM_CONFIG = {
         "family": "openai",
         "model": "gpt-4-turbo-preview",
         "max_tokens": 4096,
+        "context_window": 128000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -100,6 +108,7 @@ LLM_CONFIG = {
         "family": "openai",
         "model": "o1",
         "max_tokens": 128000,
+        "context_window": 200000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -111,7 +120,8 @@ LLM_CONFIG = {
     "o1-preview": {
         "family": "openai",
         "model": "o1-preview",
-        "max_tokens": 128000,
+        "max_tokens": 32768,
+        "context_window": 128000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -124,6 +134,7 @@ LLM_CONFIG = {
         "family": "openai",
         "model": "o1-mini",
         "max_tokens": 65536,
+        "context_window": 128000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -136,6 +147,7 @@ LLM_CONFIG = {
         "family": "openai",
         "model": "gpt-4-vision-preview",
         "max_tokens": 4096,
+        "context_window": 128000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -148,6 +160,7 @@ LLM_CONFIG = {
         "family": "gemini",
         "model": "gemini-1.5-flash",
         "max_tokens": 1000,
+        "context_window": 1048576,
         "temperature": 1.0,
         "top_p": 0.95,
         "frequency_penalty": 0,
@@ -160,6 +173,7 @@ LLM_CONFIG = {
         "family": "gemini",
         "model": "gemini-1.5-pro",
         "max_tokens": 1000,
+        "context_window": 2097152,
         "temperature": 1.0,
         "top_p": 0.95,
         "frequency_penalty": 0,
@@ -172,6 +186,7 @@ LLM_CONFIG = {
         "family": "claude",
         "model": "claude-3-5-sonnet-20240620",
         "max_tokens": 1000,
+        "context_window": 200000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -184,6 +199,7 @@ LLM_CONFIG = {
         "family": "claude",
         "model": "claude-3-opus-20240229",
         "max_tokens": 1000,
+        "context_window": 200000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -196,6 +212,7 @@ LLM_CONFIG = {
         "family": "claude",
         "model": "claude-3-sonnet-20240229",
         "max_tokens": 1000,
+        "context_window": 200000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -208,6 +225,7 @@ LLM_CONFIG = {
         "family": "claude",
         "model": "claude-3-haiku-20240307",
         "max_tokens": 1000,
+        "context_window": 200000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -220,6 +238,7 @@ LLM_CONFIG = {
         "family": "perplexity",
         "model": "llama-3.1-sonar-small-128k-chat",
         "max_tokens": 1000,
+        "context_window": 127072,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -232,6 +251,7 @@ LLM_CONFIG = {
         "family": "perplexity",
         "model": "llama-3.1-sonar-small-128k-online",
         "max_tokens": 1000,
+        "context_window": 127072,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -244,6 +264,7 @@ LLM_CONFIG = {
         "family": "perplexity",
         "model": "llama-3.1-sonar-large-128k-chat",
         "max_tokens": 1000,
+        "context_window": 127072,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -256,6 +277,7 @@ LLM_CONFIG = {
         "family": "perplexity",
         "model": "llama-3.1-sonar-large-128k-online",
         "max_tokens": 1000,
+        "context_window": 127072,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -268,6 +290,7 @@ LLM_CONFIG = {
         "family": "perplexity",
         "model": "llama-3.1-8b-instruct",
         "max_tokens": 1000,
+        "context_window": 131072,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -280,6 +303,7 @@ LLM_CONFIG = {
         "family": "perplexity",
         "model": "llama-3.1-70b-instruct",
         "max_tokens": 1000,
+        "context_window": 131072,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -292,6 +316,7 @@ LLM_CONFIG = {
         "family": "perplexity",
         "model": "sonar-pro",
         "max_tokens": 4096,
+        "context_window": 200000,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -304,6 +329,7 @@ LLM_CONFIG = {
         "family": "perplexity",
         "model": "sonar",
         "max_tokens": 4096,
+        "context_window": 127072,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -316,6 +342,7 @@ LLM_CONFIG = {
         "family": "perplexity",
         "model": "sonar-reasoning-pro",
         "max_tokens": 8192,
+        "context_window": 127072,
         "temperature": 1.0,
         "top_p": 1.0,
         "frequency_penalty": 0,
@@ -323,5 +350,21 @@ LLM_CONFIG = {
         "supports_image": False,
         "price_input_token_1M": 5.0,
         "price_output_token_1M": 15.0
+    },
+    # any OpenAI-compatible server (vLLM, llama.cpp, Ollama, LM Studio, ...); no API key needed.
+    # Set "base_url" per model, or OPENAI_COMPATIBLE_BASE_URL in the environment.
+    "local-llama-3.1-8b": {
+        "family": "openai_compatible",
+        "model": "meta-llama/Llama-3.1-8B-Instruct",
+        "base_url": "http://localhost:8000/v1",
+        "max_tokens": 2000,
+        "context_window": 8192,
+        "temperature": 1.0,
+        "top_p": 1.0,
+        "frequency_penalty": 0,
+        "presence_penalty": 0,
+        "supports_image": False,
+        "price_input_token_1M": 0,
+        "price_output_token_1M": 0
     }
 }
@@ -1,15 +1,30 @@
 import copy
-import re
 import base64
 import mimetypes
 import streamlit as st
 from streamlit_extras.stylable_container import stylable_container
 from streamlit_extras.let_it_rain import rain
-from core_logic.handlers import HANDLERS, fetch_vimeo_transcript
+from core_logic.handlers import fetch_vimeo_transcript, dispatch_completion, run_sync
+from core_logic.handlers import stream_completion, iter_sync, submit_sync, gather_sync
+from core_logic.map_reduce import map_reduce_questions, split_transcript, DEFAULT_CHUNK_TOKENS
 from core_logic.llm_config import LLM_CONFIG
-from core_logic.handlers import format_quiz_for_download, generate_download_filename
+from core_logic.tokens import estimate_tokens, preflight, trim_to_tokens, ContextWindowExceeded
+from core_logic.history import apply_history_policy, DEFAULT_HISTORY_POLICY
+from core_logic.prompt_templates import compile_phase_prompts, get_prompt_renderer
+from core_logic.quiz import parse_quiz, structured_request, QuizValidationError
+from core_logic.quiz_validation import check_quiz, repair_quiz
+from core_logic.per_question import generate_per_question
+from core_logic.scoring import score_response
+from core_logic.hedging import hedged_completion, hedged_stream
+from core_logic.resilience import ProviderError, CircuitOpenError
+from core_logic.telemetry import CostMeter
+from core_logic.handlers import format_quiz_for_download, generate_download_filename, build_llm_context
+from core_logic.handlers import configure_provider_calls
 from core_logic.styles import get_custom_styles
 
+# errors of an LLM request that are shown to the user instead of a response
+LLM_REQUEST_ERRORS = (ProviderError, ContextWindowExceeded)
+
 # Folder where config files are stored
 CONFIG_FOLDER = "config_files"
 
@@ -210,10 +225,12 @@ def build_field(phase_name, fields,user_input):
         ):
             user_input[field_key] = my_input_function(**kwargs)
 
-# Function to execute LLM completions
-def execute_llm_completions(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt, image_urls=None):
+# Function to build the handler context for the selected model from the session state
+def prepare_llm_request(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt, image_urls=None,
+                        response_format=None, on_queue=None):
     """
-    Executes LLM completions using the selected model.
+    Builds the handler context and model family for the selected model from the session state.
+    'on_queue' is the rate-limiter callback of queue_status_display.
     """
     if selected_llm not in LLM_CONFIG:
         raise ValueError(f"Selected model '{selected_llm}' not found in configuration.")
@@ -221,8 +238,9 @@ def execute_llm_completions(SYSTEM_PROMPT, selected_llm, phase_instructions, use
     base_model_config = LLM_CONFIG[selected_llm]
     chat_history = st.session_state["chat_history"]
 
-    # Merge base config with any user overrides from the sidebar
-    user_llm_config = st.session_state.get("llm_config", {})
+    # Merge base config with any user overrides from the sidebar; they belong to the model selected there
+    user_llm_config = st.session_state.get("llm_config", {}) \
+        if selected_llm == st.session_state.get("selected_llm", selected_llm) else {}
     model_config = {**base_model_config, **user_llm_config}
     family = model_config["family"]
 
@@ -230,35 +248,252 @@ def execute_llm_completions(SYSTEM_PROMPT, selected_llm, phase_instructions, use
         "openai": st.session_state.get("openai_api_key")
     }
 
-    context = {
-        "SYSTEM_PROMPT": SYSTEM_PROMPT,
-        "phase_instructions": phase_instructions,
-        "user_prompt": user_prompt,
-        "supports_image": model_config["supports_image"],
-        "image_urls": image_urls,
-        "model": model_config["model"],
-        "max_tokens": model_config["max_tokens"],
-        "temperature": model_config["temperature"],
-        "top_p": model_config["top_p"],
-        "frequency_penalty": model_config["frequency_penalty"],
-        "presence_penalty": model_config["presence_penalty"],
-        "price_input_token_1M": model_config["price_input_token_1M"],
-        "price_output_token_1M": model_config["price_output_token_1M"],
-        "TOTAL_PRICE": 0,
-        "chat_history": chat_history,
-        "api_keys": {k: v for k, v in api_keys.items() if v},
-    }
+    context = build_llm_context(SYSTEM_PROMPT, model_config, phase_instructions, user_prompt, image_urls,
+                                chat_history, api_keys, response_format)
+    context["on_queue"] = on_queue
+    # the session's cost meter is charged from the background loop as calls complete
+    context["cost_meter"] = st.session_state.setdefault("cost_meter", CostMeter())
+    return context, family
 
-    handler = HANDLERS.get(family)
-    if handler:
+# Function to estimate the token budget of an LLM request before it is sent
+def preflight_llm_request(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt, image_urls=None,
+                          response_format=None):
+    """
+    Returns the local token-budget report (prompt and output tokens, context window, projected cost)
+    of a request after the history policy is applied, without sending the request itself.
+    """
+    context, family = prepare_llm_request(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt, image_urls,
+                                          response_format)
+    run_sync(apply_history_policy(context, family, st.session_state.get("history_policy", DEFAULT_HISTORY_POLICY)))
+    return preflight(context)
+
+# Function to build the secondary request of a hedged completion
+def prepare_hedge_request(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt, image_urls=None,
+                          response_format=None, on_queue=None):
+    """
+    Returns the (context, family) of the secondary model configured in the session's hedge policy,
+    or None if hedging is off or the secondary model is the selected one.
+    """
+    secondary_llm = (st.session_state.get("hedge_policy") or {}).get("secondary")
+    if not secondary_llm or secondary_llm == selected_llm:
+        return None
+    return prepare_llm_request(SYSTEM_PROMPT, secondary_llm, phase_instructions, user_prompt, image_urls,
+                               response_format, on_queue)
+
+# Function to fit 'topic_content' into the context window of the selected model
+def fit_topic_content(report, user_input):
+    """
+    Returns the number of tokens of 'topic_content' that fit into the prompt budget of 'report',
+    or None if the request already fits.
+    """
+    if report["fits"]:
+        return None
+    content_tokens = estimate_tokens(user_input.get("topic_content") or "")
+    return max(0, report["available_prompt_tokens"] - (report["prompt_tokens"] - content_tokens))
+
+# Function to show the rate-limiter queue position while a request waits
+def queue_status_display():
+    """
+    Returns (on_queue, poll): a rate-limiter callback for the request context, called on the
+    background loop, and a function for the 'poll' argument of run_sync and iter_sync that shows
+    the queue position on the page from the script thread.
+    """
+    status = {}
+    placeholder = st.empty()
+
+    def on_queue(position, wait):
+        status.update(position=position, wait=wait)
+
+    def poll():
+        if status.get("position"):
+            wait_note = f" (about {status['wait']:.0f}s)" if status.get("wait") else ""
+            placeholder.info(f"Many requests are being sent right now; yours is number {status['position']} "
+                             f"in the queue{wait_note}.", icon="⏳")
+        elif status:
+            placeholder.empty()
+            status.clear()
+
+    return on_queue, poll
+
+# Function to execute LLM completions asynchronously
+def execute_llm_completions_async(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt, image_urls=None,
+                                  use_cache=True, response_format=None, on_queue=None):
+    """
+    Returns an awaitable LLM completion using the selected model.
+    The session state is read when this function is called (on the Streamlit script thread),
+    so the returned awaitable can be combined with asyncio.gather or gather_sync and run on any event loop.
+    Pass use_cache=False to bypass the completion cache and response_format="json" to request a JSON object.
+    With a secondary model in the session's hedge policy, the request is hedged (see core_logic.hedging).
+    'on_queue' is called with the queue position while the request waits for the rate limiter.
+    """
+    context, family = prepare_llm_request(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt, image_urls,
+                                          response_format, on_queue)
+    secondary = prepare_hedge_request(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt, image_urls,
+                                      response_format, on_queue)
+    history_policy = st.session_state.get("history_policy", DEFAULT_HISTORY_POLICY)
+    hedge_policy = st.session_state.get("hedge_policy")
+
+    async def _complete():
         try:
-            result = handler(context)
+            await apply_history_policy(context, family, history_policy)
+            if secondary is None:
+                return await dispatch_completion(context, family, use_cache=use_cache)
+            await apply_history_policy(*secondary, history_policy)
+            return await hedged_completion((context, family), secondary, hedge_policy, use_cache=use_cache)
+        except (NotImplementedError, *LLM_REQUEST_ERRORS):
+            raise
         except Exception as e:
             raise RuntimeError(f"Error in handling the LLM request: {e}")
+
+    return _complete()
+
+# Function to execute LLM completions
+def execute_llm_completions(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt, image_urls=None,
+                            use_cache=True, response_format=None):
+    """
+    Executes LLM completions using the selected model.
+    """
+    on_queue, poll = queue_status_display()
+    return run_sync(execute_llm_completions_async(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt,
+                                                  image_urls, use_cache, response_format, on_queue), poll)
+
+# Function to stream LLM completions
+def execute_llm_completions_stream(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt, image_urls=None,
+                                   use_cache=True, response_format=None):
+    """
+    Executes LLM completions using the selected model and yields the response chunk by chunk as it arrives.
+    Usage and cost are recorded once the stream is complete.
+    """
+    on_queue, poll = queue_status_display()
+    context, family = prepare_llm_request(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt, image_urls,
+                                          response_format, on_queue)
+    secondary = prepare_hedge_request(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt, image_urls,
+                                      response_format, on_queue)
+    history_policy = st.session_state.get("history_policy", DEFAULT_HISTORY_POLICY)
+    hedge_policy = st.session_state.get("hedge_policy")
+
+    async def _stream():
+        await apply_history_policy(context, family, history_policy)
+        if secondary is None:
+            chunks = stream_completion(context, family, use_cache=use_cache)
+        else:
+            await apply_history_policy(*secondary, history_policy)
+            chunks = hedged_stream((context, family), secondary, hedge_policy, use_cache=use_cache)
+        async for chunk in chunks:
+            yield chunk
+
+    try:
+        yield from iter_sync(_stream(), poll)
+    except LLM_REQUEST_ERRORS:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"Error in handling the LLM request: {e}")
+
+# Function to report a failed LLM request without treating the error as a response
+def report_llm_error(error):
+    """
+    Shows a failed LLM request as an error message; nothing is stored in the chat history.
+    """
+    if isinstance(error, CircuitOpenError):
+        st.error(str(error), icon="⏳")
+    elif isinstance(error, ContextWindowExceeded):
+        st.error(f"The request is too long for the selected model. {error}", icon="📏")
     else:
-        raise NotImplementedError(f"No handler implemented for model family '{family}'")
+        st.error(f"The model request failed: {error}", icon="🚨")
+
+# Function to render a streamed LLM response
+def render_llm_stream(chunks, res_box=None):
+    """
+    Renders streamed response chunks incrementally in an info box and returns the full response.
+    """
+    if res_box is None:
+        res_box = st.info(body="", icon="🤖")
+    result = ""
+    for chunk in chunks:
+        result += chunk
+        res_box.info(body=result, icon="🤖")
     return result
 
+# Function to execute LLM completions, streaming them into the page if enabled
+def generate_llm_response(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt, image_urls=None,
+                          use_cache=True, stream=False, response_format=None):
+    """
+    Returns the LLM response, rendering it token by token while it is generated when 'stream' is True.
+    """
+    if stream:
+        return render_llm_stream(execute_llm_completions_stream(SYSTEM_PROMPT, selected_llm, phase_instructions,
+                                                                user_prompt, image_urls, use_cache, response_format))
+    return execute_llm_completions(SYSTEM_PROMPT, selected_llm, phase_instructions, user_prompt, image_urls,
+                                   use_cache, response_format)
+
+# Function to generate questions for long content with map-reduce
+def execute_map_reduce_completions(SYSTEM_PROMPT, selected_llm, phase_instructions, user_input, phase_name, phases,
+                                   chunk_tokens=DEFAULT_CHUNK_TOKENS, use_cache=True, response_format=None):
+    """
+    Generates the phase response for a long 'topic_content' by generating candidate questions per
+    transcript segment in parallel and reducing them to 'questions_num' questions.
+    Returns the response and a report with the number of segments and the total cost.
+    """
+    on_queue, poll = queue_status_display()
+    base_context, family = prepare_llm_request(SYSTEM_PROMPT, selected_llm, phase_instructions, "",
+                                               response_format=response_format, on_queue=on_queue)
+    run_sync(apply_history_policy(base_context, family, st.session_state.get("history_policy",
+                                                                              DEFAULT_HISTORY_POLICY)), poll)
+
+    def render_prompt(values):
+        return format_user_prompt(phases[phase_name].get("user_prompt", ""), values, phase_name, phases)
+
+    return run_sync(map_reduce_questions(base_context, family, render_prompt, user_input, chunk_tokens, use_cache),
+                    poll)
+
+# Function to generate every question with its own concurrent request
+def execute_per_question_completions(SYSTEM_PROMPT, selected_llm, phase_instructions, user_input, phase_name, phases,
+                                     use_cache=True, response_format=None):
+    """
+    Generates the phase response with one concurrent request per question, each focused on a different
+    part of 'topic_content', and merges the questions into one quiz.
+    Returns the response and a report with the number of requests and the total cost.
+    """
+    on_queue, poll = queue_status_display()
+    base_context, family = prepare_llm_request(SYSTEM_PROMPT, selected_llm, phase_instructions, "",
+                                               response_format=response_format, on_queue=on_queue)
+    run_sync(apply_history_policy(base_context, family, st.session_state.get("history_policy",
+                                                                              DEFAULT_HISTORY_POLICY)), poll)
+
+    def render_prompt(values):
+        return format_user_prompt(phases[phase_name].get("user_prompt", ""), values, phase_name, phases)
+
+    return run_sync(generate_per_question(base_context, family, render_prompt, user_input, use_cache), poll)
+
+# Function to check a generated quiz and regenerate only its non-conforming questions
+def validate_quiz_response(SYSTEM_PROMPT, selected_llm, phase_instructions, quiz_text, user_input, phase_name, phases,
+                           response_format=None):
+    """
+    Checks the quiz against 'questions_num', 'correct_ans_num' and 'distractors_num' and re-requests only
+    the malformed, non-conforming or missing questions, splicing the replacements into the quiz.
+    Returns the quiz and a report, or the unchanged quiz and None if it already conforms.
+    A quiz that cannot be parsed into questions is returned unchanged with a warning.
+    """
+    check = check_quiz(quiz_text, user_input)
+    if not check["issues"] and not check["missing"]:
+        return quiz_text, None
+    if check["questions"] is None:
+        # there are no questions to regenerate one by one
+        st.warning(f"⚠️ The quiz could not be checked against the settings ({'; '.join(check['issues'][None])}); "
+                   f"it is shown unchanged.")
+        return quiz_text, {"format": check["format"], "regenerated": 0, "removed": 0,
+                           "remaining": check["issues"], "cost": 0.0}
+    on_queue, poll = queue_status_display()
+    base_context, family = prepare_llm_request(SYSTEM_PROMPT, selected_llm, phase_instructions, "",
+                                               response_format=response_format, on_queue=on_queue)
+
+    def render_prompt(values):
+        return format_user_prompt(phases[phase_name].get("user_prompt", ""), values, phase_name, phases)
+
+    with st.spinner(f"Regenerating {len(check['issues']) + check['missing']} question(s) that do not match "
+                    f"the settings..."):
+        return run_sync(repair_quiz(quiz_text, base_context, family, render_prompt, user_input), poll)
+
 # Function to apply conditional logic to prompts
 def prompt_conditionals(user_input, phase_name=None, phases=None):
     """
@@ -282,11 +517,11 @@ def prompt_conditionals(user_input, phase_name=None, phases=None):
 def format_user_prompt(prompt, user_input, phase_name=None, phases=None):
     """
     Formats the 'prompt' using the provided 'user_input' and applies any conditional logic.
-    'phases' is required to access phase-specific data.
+    'phases' is required to access phase-specific data; its prompts are rendered with the
+    precompiled renderers of core_logic.prompt_templates.
     """
     try:
-        prompt = prompt_conditionals(user_input, phase_name, phases)
-        formatted_user_prompt = prompt.format(**{k: user_input.get(k, '') for k in re.findall(r'{(\w+)}', prompt)})
+        formatted_user_prompt = get_prompt_renderer(phases[phase_name]["user_prompt"]).render(user_input)
         return formatted_user_prompt
     except Exception as e:
         print(f"Error occurred in format_user_prompt: {e}")
@@ -311,22 +546,22 @@ def build_scoring_instructions(rubric):
     Builds scoring instructions based on the provided rubric for AI scoring.
     """
     scoring_instructions = f"""
-        Please score the user's previous response based on the following rubric: \n{rubric}
-        \n\nPlease output your response as JSON, using this format: '{{{{ "[criteria 1]": "[score 1]", "[criteria 2]": "[score 2]", "total": "[total score]" }}}}'
+        Please score the user's response based on the following rubric: \n{rubric}
+        \n\nPlease output only a JSON object, using this format: {{ "criteria": {{ "[criteria 1]": [score 1], "[criteria 2]": [score 2] }}, "total": [total score] }}
         """
     return scoring_instructions
 
-# Function to extract score from AI response
-def extract_score(text):
+# Function to start scoring a response while the feedback is generated
+def start_scoring(SYSTEM_PROMPT, scoring_llm, rubric, user_response, use_cache=True):
     """
-    Extracts the total score from the AI response text.
+    Starts scoring 'user_response' against 'rubric' with 'scoring_llm' in JSON mode on the background loop
+    and returns a future of (score, raw reply), so the feedback can be streamed while scoring runs.
+    Scoring requests are sent without the chat history.
     """
-    pattern = r'"total":\s*"?(\d+)"?'
-    match = re.search(pattern, text)
-    if match:
-        return int(match.group(1))
-    else:
-        return 0
+    context, family = prepare_llm_request(SYSTEM_PROMPT, scoring_llm, build_scoring_instructions(rubric),
+                                          user_response, response_format="json")
+    context["chat_history"] = []
+    return submit_sync(score_response(context, family, use_cache))
 
 # Function to check if the score meets the minimum requirement
 def check_score(PHASES,PHASE_NAME):
@@ -416,6 +651,14 @@ def main(config):
     LLM_CONFIGURATIONS = LLM_CONFIG
     PREFERRED_LLM = config.get('PREFERRED_LLM', 'openai')
     SYSTEM_PROMPT = config.get('SYSTEM_PROMPT', '')
+    SCORING_LLM = config.get('SCORING_LLM', None)
+    STREAM_RESPONSES = config.get('STREAM_RESPONSES', True)
+    st.session_state["history_policy"] = config.get('HISTORY_POLICY', DEFAULT_HISTORY_POLICY)
+    st.session_state["hedge_policy"] = config.get('HEDGE_POLICY', None)
+    configure_provider_calls(config)
+
+    # Compile the phase prompts once; later reruns reuse the cached renderers
+    compile_phase_prompts(PHASES)
 
     # Apply the page configuration
     if PAGE_CONFIG:
@@ -462,6 +705,9 @@ def main(config):
     image_urls = []
     if 'TOTAL_PRICE' not in st.session_state:
         st.session_state['TOTAL_PRICE'] = 0
+    if 'cost_meter' not in st.session_state:
+        st.session_state['cost_meter'] = CostMeter()
+    st.session_state['TOTAL_PRICE'] = st.session_state['cost_meter'].total
 
     # Handle sidebar: API keys, model selection, and basic generation settings
     with st.sidebar:
@@ -526,6 +772,9 @@ def main(config):
             "price_output_token_1M": initial_config.get("price_output_token_1M", 0.0),
         }
 
+        if DISPLAY_COST:
+            st.caption(f"Session cost so far: ${st.session_state['TOTAL_PRICE']:.4f}")
+
         st.markdown("---")
 
         # Display chat history in the sidebar
@@ -545,6 +794,7 @@ def main(config):
         "gemini": "google",       # using GOOGLE_API_KEY for Gemini
         "perplexity": "perplexity",
         "rag": "openai",          # RAG pipeline uses OpenAI under the hood
+        "openai_compatible": None,  # self-hosted servers need no key
     }
 
     selected_family = LLM_CONFIGURATIONS[selected_llm]["family"]
@@ -636,7 +886,6 @@ def main(config):
 
         key = f"{PHASE_NAME}_ai_response"
         if key in st.session_state and st.session_state[key]:
-            st.info(st.session_state[key], icon="🤖")
             # Single download button: choose extension based on selected output format
             ai_response_content = st.session_state[key]
             # Determine selected output format for this phase (stored when submitting)
@@ -652,6 +901,15 @@ def main(config):
             file_ext_format = "olx" if is_olx else "txt"
 
             content = format_quiz_for_download(ai_response_content, download_format)
+            st.info(content, icon="🤖")
+            # the value stored on submit (st_store keys it as <phase>_<field>_user_input), else the form's
+            structured_output = st.session_state.get(f"{PHASE_NAME}_structured_output_user_input",
+                                                     user_input.get("structured_output"))
+            if structured_output:
+                try:
+                    parse_quiz(ai_response_content)
+                except QuizValidationError as e:
+                    st.warning(f"⚠️ The response is not a valid structured quiz ({e}); it is shown unchanged.")
             filename = generate_download_filename(file_ext_format)
             mime = "application/xml" if is_olx else "text/plain"
             label = "Download Quiz"
@@ -667,9 +925,6 @@ def main(config):
             while z <= PHASE_DICT.get("max_revisions", 10):
                 key = f"{PHASE_NAME}_ai_response_revision_{z}"
                 if key in st.session_state and st.session_state[key]:
-                    st.info(st.session_state[key], icon="🤖")
-                    # Single download button for each revision
-                    revision_content = st.session_state[key]
                     selected_format = st.session_state.get(f"{PHASE_NAME}_user_input_output_format", None)
                     if not selected_format:
                         selected_format = user_input.get("output_format", "Plain Text")
@@ -677,15 +932,34 @@ def main(config):
                     is_olx = "olx" in fmt or fmt == "xml"
                     download_format = "olx" if is_olx else "plain_text"
                     file_ext_format = "olx" if is_olx else "txt"
-                    content = format_quiz_for_download(revision_content, download_format)
-                    filename = generate_download_filename(file_ext_format)
-                    # append revision suffix
-                    if filename.endswith(".xml"):
-                        filename = filename.replace(".xml", f"_rev{z}.xml")
-                    else:
-                        filename = filename.replace(".txt", f"_rev{z}.txt")
                     mime = "application/xml" if is_olx else "text/plain"
-                    st.download_button(label=f"Download Revision {z}", data=content, file_name=filename, mime=mime, key=f"download_{PHASE_NAME}_rev{z}")
+                    candidates = st.session_state.get(f"{key}_candidates") or [st.session_state[key]]
+                    columns = st.columns(len(candidates)) if len(candidates) > 1 else [st.container()]
+                    for c, (column, revision_content) in enumerate(zip(columns, candidates), start=1):
+                        # append revision (and candidate) suffix
+                        rev_suffix = f"_rev{z}" if len(candidates) == 1 else f"_rev{z}_{c}"
+                        rev_label = f"Revision {z}" if len(candidates) == 1 else f"Revision {z}, candidate {c}"
+                        with column:
+                            # Single download button for each revision candidate
+                            content = format_quiz_for_download(revision_content, download_format)
+                            st.info(content, icon="🤖")
+                            filename = generate_download_filename(file_ext_format)
+                            if filename.endswith(".xml"):
+                                filename = filename.replace(".xml", f"{rev_suffix}.xml")
+                            else:
+                                filename = filename.replace(".txt", f"{rev_suffix}.txt")
+                            st.download_button(label=f"Download {rev_label}", data=content, file_name=filename,
+                                               mime=mime, key=f"download_{PHASE_NAME}{rev_suffix}")
+                            if len(candidates) > 1:
+                                kept = st.session_state[key] == revision_content
+                                if st.button("Kept" if kept else "Keep this one", key=f"keep_{PHASE_NAME}{rev_suffix}",
+                                             disabled=kept):
+                                    # the kept candidate becomes the revision in the chat history
+                                    st.session_state[key] = revision_content
+                                    history_index = st.session_state.get(f"{key}_history_index")
+                                    if history_index is not None:
+                                        st.session_state['chat_history'][history_index]["assistant"] = revision_content
+                                    st.rerun()
                 z += 1
 
         if submit_button:
@@ -694,12 +968,16 @@ def main(config):
             if vimeo_url:
                 try:
                     vimeo_token = st.session_state.get("vimeo_api_token", "").strip() or None
+                    transcript_stats = {}
                     with st.spinner("Fetching Vimeo transcript..."):
-                        transcript = fetch_vimeo_transcript(vimeo_url, vimeo_token=vimeo_token)
+                        transcript = fetch_vimeo_transcript(vimeo_url, vimeo_token=vimeo_token, parallel=True,
+                                                            stats=transcript_stats)
                     if transcript:
                         # populate the topic_content with the cleaned transcript
                         user_input["topic_content"] = transcript
-                        st.success(f"✅ Successfully fetched transcript ({len(transcript)} characters)")
+                        tokens_saved = transcript_stats.get("tokens_saved", 0)
+                        savings_note = f", ~{tokens_saved} tokens of repeated captions removed" if tokens_saved > 0 else ""
+                        st.success(f"✅ Successfully fetched transcript ({len(transcript)} characters{savings_note})")
                         # Re-format the user prompt now that we have the transcript
                         formatted_user_prompt = format_user_prompt(user_prompt_template, user_input, PHASE_NAME, PHASES)
                     else:
@@ -710,22 +988,68 @@ def main(config):
             for field_key, field in fields.items():
                 st_store(user_input.get(field_key, ""), PHASE_NAME, "user_input", field_key)
 
-            phase_instructions = PHASE_DICT.get("phase_instructions", "")
+            # structured quizzes are requested as JSON and rendered locally
+            phase_instructions, response_format = structured_request(PHASE_DICT.get("phase_instructions", ""),
+                                                                     user_input)
 
             image_urls = find_image_urls(user_input,PHASE_DICT.get('fields', {}))
 
+            chunked_generation = PHASE_DICT.get("chunked_generation", False) and not image_urls and \
+                not PHASE_DICT.get("scored_phase", False)
+            chunk_tokens = PHASE_DICT.get("chunk_tokens", DEFAULT_CHUNK_TOKENS)
             if PHASE_DICT.get("ai_response", True):
+                # measure the prompt locally and trim or chunk 'topic_content' before anything is sent
+                budget_report = preflight_llm_request(SYSTEM_PROMPT, selected_llm, phase_instructions,
+                                                      formatted_user_prompt, image_urls, response_format)
+                content_budget = fit_topic_content(budget_report, user_input)
+                if content_budget is not None and user_input.get("topic_content"):
+                    if content_budget <= 0:
+                        # the rest of the prompt already fills the window; no content can be sent
+                        report_llm_error(ContextWindowExceeded(budget_report))
+                        st.stop()
+                    if chunked_generation:
+                        chunk_tokens = min(chunk_tokens, content_budget)
+                        st.warning(f"⚠️ The content is too long for {selected_llm}; it will be processed "
+                                   f"in segments of ~{chunk_tokens} tokens.")
+                    else:
+                        user_input["topic_content"] = trim_to_tokens(user_input["topic_content"], content_budget)
+                        formatted_user_prompt = format_user_prompt(user_prompt_template, user_input, PHASE_NAME,
+                                                                   PHASES)
+                        budget_report = preflight_llm_request(SYSTEM_PROMPT, selected_llm, phase_instructions,
+                                                              formatted_user_prompt, image_urls, response_format)
+                        st.warning(f"⚠️ The content was trimmed to ~{content_budget} tokens to fit the "
+                                   f"{budget_report['context_window']} token context window of {selected_llm}.")
+                budget_note = f"Estimated prompt: ~{budget_report['prompt_tokens']} tokens, " \
+                              f"max output: {budget_report['max_output_tokens']} tokens"
+                if DISPLAY_COST:
+                    budget_note += f", projected cost: up to ${budget_report['projected_cost']:.4f}"
+                st.caption(budget_note)
+
                 if PHASE_DICT.get("scored_phase", False):
                     if "rubric" in PHASE_DICT:
-                        scoring_instructions = build_scoring_instructions(PHASE_DICT["rubric"])
-                        ai_feedback = execute_llm_completions(SYSTEM_PROMPT,selected_llm, phase_instructions, formatted_user_prompt,
-                                                              image_urls)
-                        st.info(body=ai_feedback, icon="🤖")
-                        ai_score = execute_llm_completions(SYSTEM_PROMPT,selected_llm, scoring_instructions, ai_feedback)
+                        # score the submission concurrently with the (streamed) feedback
+                        scoring_llm = SCORING_LLM if SCORING_LLM in LLM_CONFIGURATIONS else selected_llm
+                        score_future = start_scoring(SYSTEM_PROMPT, scoring_llm, PHASE_DICT["rubric"],
+                                                     formatted_user_prompt)
+                        try:
+                            ai_feedback = generate_llm_response(SYSTEM_PROMPT, selected_llm, phase_instructions,
+                                                                formatted_user_prompt, image_urls,
+                                                                stream=STREAM_RESPONSES)
+                        except LLM_REQUEST_ERRORS as e:
+                            score_future.cancel()
+                            report_llm_error(e)
+                            st.stop()
+                        if not STREAM_RESPONSES:
+                            st.info(body=ai_feedback, icon="🤖")
+                        try:
+                            score_result, ai_score = score_future.result()
+                            score = score_result["total"]
+                        except Exception as e:
+                            ai_score = f"Scoring failed: {e}"
+                            score = 0
                         st.info(ai_score, icon="🤖")
                         st_store(ai_feedback, PHASE_NAME, "ai_response")
                         st_store(ai_score, PHASE_NAME, "ai_score_debug")
-                        score = extract_score(ai_score)
                         st_store(score, PHASE_NAME, "ai_score")
                         chat_history_entry = {
                             "user": formatted_user_prompt,
@@ -747,8 +1071,34 @@ def main(config):
                     else:
                         st.error('You need to include a rubric for a scored phase', icon="🚨")
                 else:
-                    ai_feedback = execute_llm_completions(SYSTEM_PROMPT,selected_llm, phase_instructions, formatted_user_prompt,
-                                                          image_urls)
+                    questions_num = int(user_input.get("questions_num") or 1)
+                    segments = split_transcript(user_input.get("topic_content") or "", chunk_tokens) \
+                        if chunked_generation else []
+                    try:
+                        if PHASE_DICT.get("per_question_generation", False) and questions_num > 1 and not image_urls:
+                            with st.spinner(f"Generating {questions_num} questions in parallel..."):
+                                ai_feedback, _ = execute_per_question_completions(SYSTEM_PROMPT, selected_llm,
+                                                                                  phase_instructions, user_input,
+                                                                                  PHASE_NAME, PHASES,
+                                                                                  response_format=response_format)
+                        elif len(segments) > 1:
+                            with st.spinner(f"Generating questions from {len(segments)} transcript segments..."):
+                                ai_feedback, _ = execute_map_reduce_completions(SYSTEM_PROMPT, selected_llm,
+                                                                                phase_instructions, user_input,
+                                                                                PHASE_NAME, PHASES, chunk_tokens,
+                                                                                response_format=response_format)
+                        else:
+                            ai_feedback = generate_llm_response(SYSTEM_PROMPT, selected_llm, phase_instructions,
+                                                                formatted_user_prompt, image_urls,
+                                                                stream=STREAM_RESPONSES,
+                                                                response_format=response_format)
+                        if PHASE_DICT.get("validate_output", False):
+                            ai_feedback, _ = validate_quiz_response(SYSTEM_PROMPT, selected_llm, phase_instructions,
+                                                                    ai_feedback, user_input, PHASE_NAME, PHASES,
+                                                                    response_format)
+                    except LLM_REQUEST_ERRORS as e:
+                        report_llm_error(e)
+                        st.stop()
                     st_store(ai_feedback, PHASE_NAME, "ai_response")
                     chat_history_entry = {
                         "user": formatted_user_prompt,
@@ -799,20 +1149,57 @@ def main(config):
                         if st.session_state[f"{PHASE_NAME}_revision_count"] < max_revisions:
                             st.session_state['additional_prompt'] = st.text_input("Enter additional prompt", value="",
                                                                                   key=PHASE_NAME)
+                            max_candidates = PHASE_DICT.get("max_revision_candidates", 1)
+                            revision_candidates = 1
+                            if max_candidates > 1:
+                                revision_candidates = st.number_input("Candidates to generate", min_value=1,
+                                                                      max_value=max_candidates, value=1, step=1,
+                                                                      key=f"candidates_{i}")
                             if st.button("Revise", key=f"revise_{i}"):
                                 st.session_state[f"{PHASE_NAME}_revision_count"] += 1
 
-                                phase_instructions = PHASE_DICT.get("phase_instructions", "")
+                                phase_instructions, response_format = structured_request(
+                                    PHASE_DICT.get("phase_instructions", ""), user_input)
                                 user_prompt_template = PHASE_DICT.get("user_prompt", "")
                                 formatted_user_prompt = format_user_prompt(user_prompt_template, user_input, PHASE_NAME,PHASES)
 
                                 formatted_user_prompt += st.session_state['additional_prompt']
 
-                                ai_feedback = execute_llm_completions(SYSTEM_PROMPT,selected_llm, phase_instructions,
-                                                                      formatted_user_prompt)
-
-                                st_store(ai_feedback, PHASE_NAME, "ai_response_revision_" + str(
-                                    st.session_state[f"{PHASE_NAME}_revision_count"]))
+                                try:
+                                    # revisions ask for a different answer, so never serve them from the cache
+                                    if revision_candidates > 1:
+                                        on_queue, poll = queue_status_display()
+                                        with st.spinner(f"Generating {revision_candidates} candidate revisions..."):
+                                            candidates = gather_sync(*(
+                                                execute_llm_completions_async(SYSTEM_PROMPT, selected_llm,
+                                                                              phase_instructions, formatted_user_prompt,
+                                                                              use_cache=False,
+                                                                              response_format=response_format,
+                                                                              on_queue=on_queue)
+                                                for _ in range(revision_candidates)), poll=poll)
+                                    else:
+                                        candidates = [generate_llm_response(SYSTEM_PROMPT, selected_llm,
+                                                                            phase_instructions, formatted_user_prompt,
+                                                                            use_cache=False, stream=STREAM_RESPONSES,
+                                                                            response_format=response_format)]
+                                    if PHASE_DICT.get("validate_output", False):
+                                        candidates = [validate_quiz_response(SYSTEM_PROMPT, selected_llm,
+                                                                             phase_instructions, candidate, user_input,
+                                                                             PHASE_NAME, PHASES, response_format)[0]
+                                                      for candidate in candidates]
+                                except LLM_REQUEST_ERRORS as e:
+                                    st.session_state[f"{PHASE_NAME}_revision_count"] -= 1
+                                    report_llm_error(e)
+                                    st.stop()
+                                ai_feedback = candidates[0]
+
+                                revision_key = "ai_response_revision_" + str(
+                                    st.session_state[f"{PHASE_NAME}_revision_count"])
+                                st_store(ai_feedback, PHASE_NAME, revision_key)
+                                st_store(candidates if len(candidates) > 1 else None, PHASE_NAME,
+                                         revision_key + "_candidates")
+                                st_store(len(st.session_state['chat_history']), PHASE_NAME,
+                                         revision_key + "_history_index")
                                 chat_history_entry = {
                                     "user": formatted_user_prompt,
                                     "assistant": ai_feedback
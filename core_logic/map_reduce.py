@@ -0,0 +1,148 @@
+"""
+Map-reduce question generation for long transcripts.
+
+A transcript that does not fit comfortably into one prompt is split into segments on
+sentence boundaries. The map step asks the model for a few candidate questions per segment,
+all segments in parallel; the reduce step gives the model every candidate and asks it to
+select, deduplicate and polish exactly `questions_num` questions in the requested output
+format. Small-context models can then handle hour-long lectures, and the expensive part of
+the work runs concurrently.
+"""
+import asyncio
+import math
+import re
+
+from core_logic.handlers import dispatch_completion
+from core_logic.tokens import estimate_tokens, preflight, ContextWindowExceeded
+
+DEFAULT_CHUNK_TOKENS = 6000
+OVERLAP_SENTENCES = 1
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+
+REDUCE_INSTRUCTIONS = (
+    "The content below consists of candidate multiple-choice questions that were generated from "
+    "{segments} consecutive segments of one long transcript. Select the {questions_num} best candidate "
+    "question(s), drop duplicates and near-duplicates, prefer questions that cover different segments, "
+    "fix any question that does not follow the requirements below, and output exactly {questions_num} "
+    "question(s).\n\n"
+)
+
+
+def _split_long_sentence(sentence, chunk_tokens):
+    words = sentence.split()
+    words_per_piece = max(1, int(chunk_tokens / 0.75) - 1)
+    return [" ".join(words[i:i + words_per_piece]) for i in range(0, len(words), words_per_piece)]
+
+
+def split_transcript(text, chunk_tokens=DEFAULT_CHUNK_TOKENS, overlap_sentences=OVERLAP_SENTENCES):
+    """Split text into segments of at most about chunk_tokens tokens, on sentence boundaries.
+
+    The last `overlap_sentences` sentences of a segment are repeated at the start of the next
+    one so questions about a passage that crosses a boundary still have context.
+    """
+    if estimate_tokens(text) <= chunk_tokens:
+        return [text] if text else []
+
+    sentences = []
+    for sentence in _SENTENCE_SPLIT_RE.split(text):
+        if estimate_tokens(sentence) > chunk_tokens:
+            sentences.extend(_split_long_sentence(sentence, chunk_tokens))
+        elif sentence:
+            sentences.append(sentence)
+
+    chunks = []
+    current, current_tokens = [], 0
+    for sentence in sentences:
+        tokens = estimate_tokens(sentence)
+        if current and current_tokens + tokens > chunk_tokens:
+            chunks.append(" ".join(current))
+            current = current[-overlap_sentences:] if overlap_sentences else []
+            current_tokens = sum(estimate_tokens(s) for s in current)
+            if current_tokens + tokens > chunk_tokens:
+                current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def split_into_parts(text, parts):
+    """Split text on sentence boundaries into at most `parts` consecutive parts of about equal size."""
+    sentences = [sentence for sentence in _SENTENCE_SPLIT_RE.split(text or "") if sentence]
+    if parts <= 1 or len(sentences) <= 1:
+        return [text] if text else []
+    total = sum(estimate_tokens(sentence) for sentence in sentences)
+    result, current, used = [], [], 0
+    for sentence in sentences:
+        current.append(sentence)
+        used += estimate_tokens(sentence)
+        if len(result) < parts - 1 and used >= total * (len(result) + 1) / parts:
+            result.append(" ".join(current))
+            current = []
+    if current:
+        result.append(" ".join(current))
+    return result
+
+
+def candidates_per_chunk(questions_num, n_chunks):
+    """Number of candidate questions to request per segment: about twice the final count overall."""
+    return max(1, min(int(questions_num), math.ceil(2 * int(questions_num) / max(1, n_chunks))))
+
+
+async def map_reduce_questions(base_context, family, render_prompt, user_input, chunk_tokens=DEFAULT_CHUNK_TOKENS,
+                               use_cache=True):
+    """Generate questions for a long topic_content with a parallel map step and a reduce step.
+
+    Args:
+        base_context: Handler context from build_llm_context; its user_prompt is replaced per call
+        family: Model family of base_context
+        render_prompt: Callable turning a user_input dict into the formatted phase prompt
+        user_input: Phase field values, including topic_content and questions_num
+        chunk_tokens: Maximum estimated tokens of transcript per map prompt
+        use_cache: Whether the completion cache may be used
+
+    chunk_tokens is lowered if a segment plus the prompt around it would not fit into the
+    model's context window; ContextWindowExceeded is raised if the prompt alone leaves no room.
+
+    Returns (quiz, report) where report holds the number of segments, the candidates requested
+    per segment and the total cost of all calls. Raises ProviderError if a call fails.
+    """
+    empty_prompt = render_prompt({**user_input, "topic_content": ""})
+    budget = preflight({**base_context, "user_prompt": empty_prompt, "chat_history": []})
+    content_budget = budget["available_prompt_tokens"] - budget["prompt_tokens"]
+    if content_budget <= 0:
+        # the prompt leaves no room for any transcript; don't split it into one-word segments
+        raise ContextWindowExceeded(budget)
+    chunk_tokens = min(chunk_tokens, content_budget)
+    chunks = split_transcript(user_input.get("topic_content", ""), chunk_tokens)
+    report = {"segments": len(chunks), "candidates_per_segment": 0, "cost": 0.0}
+
+    async def complete(user_prompt, with_history):
+        context = {**base_context, "user_prompt": user_prompt, "TOTAL_PRICE": 0}
+        if not with_history:
+            context["chat_history"] = []
+        result = await dispatch_completion(context, family, use_cache=use_cache)
+        report["cost"] += context["TOTAL_PRICE"]
+        return result
+
+    if len(chunks) <= 1:
+        return await complete(render_prompt(user_input), True), report
+
+    questions_num = int(user_input.get("questions_num") or 1)
+    per_chunk = candidates_per_chunk(questions_num, len(chunks))
+    report["candidates_per_segment"] = per_chunk
+
+    # map: candidate questions for every segment, concurrently
+    map_prompts = [render_prompt({**user_input, "topic_content": chunk, "questions_num": per_chunk})
+                   for chunk in chunks]
+    candidates = await asyncio.gather(*(complete(prompt, False) for prompt in map_prompts))
+
+    # reduce: select and deduplicate down to questions_num
+    candidate_text = "\n\n".join(
+        f"--- Candidates from segment {index} of {len(chunks)} ---\n{candidate}"
+        for index, candidate in enumerate(candidates, start=1)
+    )
+    reduce_prompt = REDUCE_INSTRUCTIONS.format(segments=len(chunks), questions_num=questions_num) + \
+        render_prompt({**user_input, "topic_content": candidate_text})
+    return await complete(reduce_prompt, True), report
@@ -0,0 +1,86 @@
+"""
+Per-question parallel generation.
+
+One completion that writes `questions_num` questions with feedback, hints and OLX markup emits
+its output tokens serially. In this mode the phase prompt is rendered once per question with
+questions_num=1, every request gets its own sub-focus (a consecutive part of topic_content, or
+a distinct aspect of the topic when there is no content), and all requests are dispatched
+concurrently. The questions are merged into a single quiz in the requested format, so the
+wall-clock time is that of the slowest single question.
+"""
+import asyncio
+
+from core_logic.handlers import dispatch_completion
+from core_logic.map_reduce import split_into_parts
+from core_logic.quiz import QuizValidationError
+from core_logic.quiz_validation import quiz_format, split_quiz, join_quiz
+
+SUB_FOCUS_INSTRUCTIONS = (
+    "This request is question {index} of {total} of one quiz; the other questions are written separately. "
+    "Write exactly one question. {focus}\n\n"
+)
+PART_FOCUS = "Base it on the content below, which is part {index} of {total} of the full content."
+ASPECT_FOCUS = ("Focus on aspect {index} of {total} of the topic: pick a different concept than questions "
+                "about earlier aspects would, counting from the most fundamental to the most advanced.")
+
+
+def sub_focus_inputs(user_input):
+    """Return one (user_input, instructions) pair per question, each with its own sub-focus."""
+    total = max(1, int(user_input.get("questions_num") or 1))
+    parts = split_into_parts(user_input.get("topic_content") or "", total)
+    inputs = []
+    for index in range(1, total + 1):
+        values = {**user_input, "questions_num": 1}
+        if len(parts) == total:
+            values["topic_content"] = parts[index - 1]
+            focus = PART_FOCUS.format(index=index, total=total)
+        else:
+            # too little content to give every question its own part
+            focus = ASPECT_FOCUS.format(index=index, total=total)
+        inputs.append((values, SUB_FOCUS_INSTRUCTIONS.format(index=index, total=total, focus=focus)))
+    return inputs
+
+
+def merge_questions(responses, fmt):
+    """Merge single-question responses into one quiz in the given format.
+
+    Responses without a recognizable question are kept as they are so nothing is lost.
+    """
+    questions = []
+    for response in responses:
+        try:
+            segments, indexes = split_quiz(response, fmt)
+        except QuizValidationError:
+            segments, indexes = [response], [0]
+        if not indexes:
+            segments, indexes = [response], [0]
+        questions.extend(segments[index] if fmt == "json" else segments[index].strip() for index in indexes)
+    if fmt == "json":
+        return join_quiz(questions, fmt)
+    return "\n\n".join(questions) + "\n"
+
+
+async def generate_per_question(base_context, family, render_prompt, user_input, use_cache=True):
+    """Generate each question of the quiz with its own concurrent request and merge the results.
+
+    Args:
+        base_context: Handler context from build_llm_context; its user_prompt is replaced per call
+        family: Model family of base_context
+        render_prompt: Callable turning a user_input dict into the formatted phase prompt
+        user_input: Phase field values, including topic_content and questions_num
+        use_cache: Whether the completion cache may be used
+
+    Returns (quiz, report) where report holds the number of requests and their total cost.
+    Raises ProviderError if a call fails.
+    """
+    requests = sub_focus_inputs(user_input)
+    report = {"requests": len(requests), "cost": 0.0}
+
+    async def complete(values, instructions):
+        context = {**base_context, "user_prompt": instructions + render_prompt(values), "TOTAL_PRICE": 0}
+        result = await dispatch_completion(context, family, use_cache=use_cache)
+        report["cost"] += context["TOTAL_PRICE"]
+        return result
+
+    responses = await asyncio.gather(*(complete(values, instructions) for values, instructions in requests))
+    return merge_questions(responses, quiz_format(user_input)), report
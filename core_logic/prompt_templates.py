@@ -0,0 +1,185 @@
+"""
+Precompiled renderers for the `user_prompt` of PHASES.
+
+A phase's user_prompt is either a format string or a list of {"condition", "prompt"} items.
+Interpreting it walks every item, evaluates the condition dict recursively, joins the active
+prompts and scans the result for placeholders, on every Streamlit rerun.
+
+compile_prompt() does that analysis once: conditions become predicate closures, items without
+a condition (or with {}) are merged with their unconditional neighbours, and every part is
+parsed up front into literal text and placeholder names. Renderers are cached by the content
+of the user_prompt, so the dicts rebuilt by each rerun of the app script reuse the renderer
+compiled on the first run.
+"""
+import json
+import operator
+import re
+import string
+import threading
+
+_PLACEHOLDER_RE = re.compile(r"{(\w+)}")
+_FIELD_NAME_RE = re.compile(r"[A-Za-z_]\w*")
+
+# comparison operators of condition dicts; the predicate fails if the comparison is False
+_COMPARISONS = {
+    "$gt": operator.gt,
+    "$lt": operator.lt,
+    "$gte": operator.ge,
+    "$lte": operator.le,
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$in": lambda user_value, condition_value: user_value in condition_value,
+    "$nin": lambda user_value, condition_value: user_value not in condition_value,
+}
+
+
+def _always(user_input):
+    return True
+
+
+def compile_condition(condition):
+    """Compile a condition dict into a predicate user_input -> bool.
+
+    Behaves exactly like evaluate_conditions() in core_logic.main: $and, $or and $not take
+    precedence over field comparisons, a field dict is compared with its first operator only,
+    lists mean membership and anything else means equality.
+    """
+    if "$and" in condition:
+        predicates = [compile_condition(sub_condition) for sub_condition in condition["$and"]]
+        return lambda user_input: all(predicate(user_input) for predicate in predicates)
+    if "$or" in condition:
+        predicates = [compile_condition(sub_condition) for sub_condition in condition["$or"]]
+        return lambda user_input: any(predicate(user_input) for predicate in predicates)
+    if "$not" in condition:
+        negated = compile_condition(condition["$not"])
+        return lambda user_input: not negated(user_input)
+
+    checks = []
+    for key, value in condition.items():
+        if isinstance(value, dict):
+            op, condition_value = next(iter(value.items()))
+            compare = _COMPARISONS.get(op)
+            if compare is not None:
+                checks.append(lambda user_input, key=key, compare=compare, condition_value=condition_value:
+                              compare(user_input.get(key), condition_value))
+        elif isinstance(value, list):
+            checks.append(lambda user_input, key=key, value=value: user_input.get(key) in value)
+        else:
+            checks.append(lambda user_input, key=key, value=value: user_input.get(key) == value)
+
+    if not checks:
+        return _always
+    if len(checks) == 1:
+        return checks[0]
+    return lambda user_input: all(check(user_input) for check in checks)
+
+
+def _parse_segments(text):
+    """Split a format string into (literal, field_name) pairs, or None if it uses more than plain {name} fields."""
+    try:
+        parsed = list(string.Formatter().parse(text))
+    except ValueError:
+        return None
+    segments = []
+    for literal, field_name, format_spec, conversion in parsed:
+        if field_name is not None and (not _FIELD_NAME_RE.fullmatch(field_name) or format_spec or conversion):
+            return None
+        segments.append((literal, field_name))
+    return segments
+
+
+class CompiledPrompt:
+    """Renderer of one phase's user_prompt: render(user_input) returns the formatted prompt."""
+
+    def __init__(self, user_prompt):
+        if isinstance(user_prompt, str):
+            items = [(_always, user_prompt)]
+        else:
+            items = [(compile_condition(item["condition"]), item["prompt"]) for item in user_prompt]
+
+        # merge runs of unconditional items, which are always joined the same way
+        parts = []
+        for predicate, text in items:
+            if predicate is _always and parts and parts[-1][0] is _always:
+                parts[-1] = (_always, parts[-1][1] + "\n" + text)
+            else:
+                parts.append((predicate, text))
+        self.parts = [(predicate, text, frozenset(_PLACEHOLDER_RE.findall(text))) for predicate, text in parts]
+        self.placeholders = frozenset().union(*(keys for _, _, keys in self.parts))
+        self.static = all(predicate is _always for predicate, _, _ in self.parts)
+        self._static_text = "\n".join(text for _, text, _ in self.parts) if self.static else None
+        self._segments = [(predicate, _parse_segments(text)) for predicate, text, _ in self.parts]
+
+    def select(self, user_input):
+        """Return the joined prompt of the parts whose condition holds, and their placeholders."""
+        if self.static:
+            return self._static_text, self.placeholders
+        texts = []
+        keys = set()
+        for predicate, text, part_keys in self.parts:
+            if predicate(user_input):
+                texts.append(text)
+                keys.update(part_keys)
+        return "\n".join(texts), keys
+
+    def render(self, user_input):
+        """Return the prompt formatted with user_input; missing placeholders become ''."""
+        if any(segments is None for _, segments in self._segments):
+            prompt, keys = self.select(user_input)
+            return prompt.format(**{key: user_input.get(key, '') for key in keys})
+        pieces = []
+        for predicate, segments in self._segments:
+            if not predicate(user_input):
+                continue
+            if pieces:
+                pieces.append("\n")
+            for literal, field_name in segments:
+                pieces.append(literal)
+                if field_name is not None:
+                    pieces.append(format(user_input.get(field_name, '')))
+        return "".join(pieces)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+# the user_prompt objects of the last compiled PHASES, by id, for lookups without fingerprinting
+_by_id = {}
+
+
+def _fingerprint(user_prompt):
+    return json.dumps(user_prompt, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def compile_prompt(user_prompt):
+    """Return the cached CompiledPrompt for a user_prompt, compiling it on first use."""
+    fingerprint = _fingerprint(user_prompt)
+    with _cache_lock:
+        compiled = _cache.get(fingerprint)
+        if compiled is None:
+            compiled = _cache[fingerprint] = CompiledPrompt(user_prompt)
+    return compiled
+
+
+def compile_phase_prompts(phases):
+    """Compile the user_prompt of every phase and return {phase_name: CompiledPrompt}.
+
+    The phases' user_prompt objects are remembered, so get_prompt_renderer() finds their
+    renderers by identity until the next call.
+    """
+    global _by_id
+    renderers = {}
+    by_id = {}
+    for phase_name, phase in phases.items():
+        user_prompt = phase.get("user_prompt", "")
+        renderers[phase_name] = compile_prompt(user_prompt)
+        by_id[id(user_prompt)] = (user_prompt, renderers[phase_name])
+    _by_id = by_id
+    return renderers
+
+
+def get_prompt_renderer(user_prompt):
+    """Return the CompiledPrompt of a user_prompt, by identity if its phases were compiled."""
+    entry = _by_id.get(id(user_prompt))
+    if entry is not None and entry[0] is user_prompt:
+        return entry[1]
+    return compile_prompt(user_prompt)
@@ -0,0 +1,196 @@
+"""
+Structured quizzes: a compact JSON quiz format, its validation and local OLX / plain-text renderers.
+
+In structured mode the model returns
+
+    {"questions": [{"stem": "...",
+                    "options": [{"text": "...", "correct": true, "feedback": "..."}, ...],
+                    "explanation": "...",
+                    "hints": ["..."]}]}
+
+instead of the final markup. "feedback", "explanation" and "hints" are optional. The quiz is
+validated locally and rendered to every download format, so the OLX example template does not
+have to be sent and the model does not spend output tokens on markup.
+"""
+import json
+import re
+from xml.sax.saxutils import escape, quoteattr
+
+STRUCTURED_QUIZ_INSTRUCTIONS = (
+    "Output the questions only as one JSON object, without markdown fences or any other text, "
+    "using exactly this schema:\n"
+    '{"questions": [{"stem": "question text", '
+    '"options": [{"text": "answer text", "correct": true or false, "feedback": "why it is right or wrong"}], '
+    '"explanation": "why the correct answer(s) are best", "hints": ["hint"]}]}\n'
+    'Include "feedback" and "explanation" only if feedback is requested and "hints" only if hints are requested.'
+)
+
+OPTION_LABELS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+class QuizValidationError(ValueError):
+    """Raised when a model response is not a valid structured quiz."""
+
+
+def _require_text(value, where):
+    if not isinstance(value, str) or not value.strip():
+        raise QuizValidationError(f"{where} must be a non-empty string")
+    return value.strip()
+
+
+def validate_question(question, index=1):
+    """Validate one question dict and return it normalized (stripped strings, defaults filled in)."""
+    where = f"question {index}"
+    if not isinstance(question, dict):
+        raise QuizValidationError(f"{where} must be an object")
+    stem = _require_text(question.get("stem"), f"{where}: stem")
+
+    options = question.get("options")
+    if not isinstance(options, list) or len(options) < 2:
+        raise QuizValidationError(f"{where}: options must be a list of at least 2 options")
+    if len(options) > len(OPTION_LABELS):
+        raise QuizValidationError(f"{where}: at most {len(OPTION_LABELS)} options are supported")
+    normalized_options = []
+    for option_index, option in enumerate(options, start=1):
+        option_where = f"{where}, option {option_index}"
+        if not isinstance(option, dict):
+            raise QuizValidationError(f"{option_where} must be an object")
+        if not isinstance(option.get("correct"), bool):
+            raise QuizValidationError(f"{option_where}: correct must be true or false")
+        normalized_option = {"text": _require_text(option.get("text"), f"{option_where}: text"),
+                             "correct": option["correct"]}
+        if option.get("feedback"):
+            normalized_option["feedback"] = _require_text(option["feedback"], f"{option_where}: feedback")
+        normalized_options.append(normalized_option)
+    if not any(option["correct"] for option in normalized_options):
+        raise QuizValidationError(f"{where}: at least one option must be correct")
+
+    hints = question.get("hints") or []
+    if isinstance(hints, str):
+        hints = [hints]
+    if not isinstance(hints, list):
+        raise QuizValidationError(f"{where}: hints must be a list of strings")
+
+    normalized = {"stem": stem, "options": normalized_options,
+                  "hints": [_require_text(hint, f"{where}: hint") for hint in hints]}
+    if question.get("explanation"):
+        normalized["explanation"] = _require_text(question["explanation"], f"{where}: explanation")
+    return normalized
+
+
+def validate_quiz(data):
+    """Validate a decoded quiz and return it normalized; raises QuizValidationError."""
+    if isinstance(data, list):
+        data = {"questions": data}
+    if not isinstance(data, dict) or not isinstance(data.get("questions"), list) or not data["questions"]:
+        raise QuizValidationError('the quiz must be an object with a non-empty "questions" list')
+    return {"questions": [validate_question(question, index)
+                          for index, question in enumerate(data["questions"], start=1)]}
+
+
+def load_quiz_json(text):
+    """Decode the JSON object of a model response, tolerating fences and text around it."""
+    if not isinstance(text, str):
+        raise QuizValidationError("the response is not text")
+    cleaned = _FENCE_RE.sub("", text.strip())
+    try:
+        data = json.loads(cleaned)
+    except ValueError:
+        # tolerate text around the object
+        start, end = cleaned.find("{"), cleaned.rfind("}")
+        if start < 0 or end <= start:
+            raise QuizValidationError("the response does not contain a JSON object")
+        try:
+            data = json.loads(cleaned[start:end + 1])
+        except ValueError as e:
+            raise QuizValidationError(f"the response is not valid JSON: {e}")
+    return data
+
+
+def parse_quiz(text):
+    """Decode and validate a structured quiz from a model response; raises QuizValidationError."""
+    return validate_quiz(load_quiz_json(text))
+
+
+def try_parse_quiz(text):
+    """Return the validated structured quiz in text, or None if text is not one."""
+    try:
+        return parse_quiz(text)
+    except QuizValidationError:
+        return None
+
+
+def structured_request(phase_instructions, user_input):
+    """Return (phase_instructions, response_format) for a phase submission.
+
+    With the "structured_output" field set, the JSON quiz instructions are appended and a JSON
+    response is requested; otherwise the phase instructions are returned unchanged.
+    """
+    if not user_input.get("structured_output"):
+        return phase_instructions, None
+    return "\n\n".join(part for part in (phase_instructions, STRUCTURED_QUIZ_INSTRUCTIONS) if part), "json"
+
+
+def render_plain_text(quiz):
+    """Render a structured quiz in the plain-text layout of the MCQ app."""
+    blocks = []
+    for question in quiz["questions"]:
+        lines = [f"Question: {question['stem']}", ""]
+        for label, option in zip(OPTION_LABELS, question["options"]):
+            lines.append(f"{label}) {option['text']}")
+        lines.append("")
+        solution = ", ".join(label for label, option in zip(OPTION_LABELS, question["options"]) if option["correct"])
+        lines.append(f"Solution: {solution}")
+        feedback = [f"{label}) {option['feedback']}"
+                    for label, option in zip(OPTION_LABELS, question["options"]) if option.get("feedback")]
+        if question.get("explanation") or feedback:
+            lines.append("")
+            lines.append("Feedback:" + (f" {question['explanation']}" if question.get("explanation") else ""))
+            lines.extend(feedback)
+        for hint in question["hints"]:
+            lines.append(f"Hint: {hint}")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks) + "\n"
+
+
+def render_olx_problem(question):
+    """Render one structured question as an Open edX <problem>.
+
+    Questions with one correct option become multiple choice problems, the others checkbox problems.
+    """
+    single = sum(option["correct"] for option in question["options"]) == 1
+    response_tag, group_tag = ("multiplechoiceresponse", "choicegroup") if single else \
+        ("choiceresponse", "checkboxgroup")
+    group_attrs = ' type="MultipleChoice"' if single else ""
+    hint_tag = "choicehint" if single else 'choicehint selected="true"'
+
+    lines = ["<problem>", f"<{response_tag}>", f"<label>{escape(question['stem'])}</label>",
+             f"<{group_tag}{group_attrs}>"]
+    for option in question["options"]:
+        correct = "true" if option["correct"] else "false"
+        feedback = f"<{hint_tag}>{escape(option['feedback'])}</choicehint>" if option.get("feedback") else ""
+        lines.append(f"<choice correct={quoteattr(correct)}>{escape(option['text'])}{feedback}</choice>")
+    lines.append(f"</{group_tag}>")
+    if question.get("explanation"):
+        lines.append(f"<solution><div class=\"detailed-solution\"><p>{escape(question['explanation'])}</p>"
+                     f"</div></solution>")
+    lines.append(f"</{response_tag}>")
+    if question["hints"]:
+        lines.append("<demandhint>")
+        lines.extend(f"<hint>{escape(hint)}</hint>" for hint in question["hints"])
+        lines.append("</demandhint>")
+    lines.append("</problem>")
+    return "\n".join(lines)
+
+
+def render_olx(quiz):
+    """Render a structured quiz as Open edX OLX, one <problem> per question."""
+    return "\n\n".join(render_olx_problem(question) for question in quiz["questions"]) + "\n"
+
+
+def render_quiz(quiz, format_type="plain_text"):
+    """Render a structured quiz as "olx" or "plain_text"."""
+    if (format_type or "").lower() in ("olx", "xml"):
+        return render_olx(quiz)
+    return render_plain_text(quiz)
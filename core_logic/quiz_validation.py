@@ -0,0 +1,339 @@
+"""
+Local validation of generated quizzes with targeted per-question regeneration.
+
+A quiz response (plain text, OLX or structured JSON) is split into its questions, each question
+is parsed and checked against the phase settings: `correct_ans_num` correct options and
+`distractors_num` distractors. Malformed or non-conforming questions, and missing ones if the
+response has fewer than `questions_num`, are re-requested one question per call, all calls in
+parallel, and the replacements are spliced back into the original text in place. Surplus
+questions are dropped. Text around the questions is kept unchanged.
+"""
+import asyncio
+import json
+import re
+import xml.etree.ElementTree as ET
+
+from core_logic.handlers import dispatch_completion
+from core_logic.resilience import ProviderError
+from core_logic.quiz import QuizValidationError, load_quiz_json, validate_question
+
+DEFAULT_MAX_ROUNDS = 2
+
+REPAIR_INSTRUCTIONS = (
+    "A previously generated question was rejected for these reasons: {issues}.\n"
+    "Write exactly one replacement question that follows every requirement below and does not "
+    "repeat any of these existing questions:\n{existing}\n\n"
+)
+
+_QUESTION_START_RE = re.compile(r"^[ \t]*(?:\*\*)?[ \t]*Question\b[^\n]*$", re.IGNORECASE | re.MULTILINE)
+_PROBLEM_RE = re.compile(r"<problem\b.*?</problem>", re.DOTALL | re.IGNORECASE)
+_OPTION_RE = re.compile(r"^\s*(?:\*\*)?\s*([A-Z])\s*[).:]\s*(?:\*\*)?\s*(.*)$")
+_STEM_RE = re.compile(r"^\s*(?:\*\*)?\s*Question\b[^:]*:\s*(?:\*\*)?\s*(.*)$", re.IGNORECASE)
+_SOLUTION_RE = re.compile(r"^\s*(?:\*\*)?\s*(?:Solutions?|Answers?|Correct answers?)\s*(?:\*\*)?\s*[:\-]\s*(?:\*\*)?"
+                          r"\s*(.*)$", re.IGNORECASE)
+_FEEDBACK_RE = re.compile(r"^\s*(?:\*\*)?\s*(?:Feedback|Explanation)\s*(?:\*\*)?\s*:\s*(?:\*\*)?\s*(.*)$",
+                          re.IGNORECASE)
+_HINT_RE = re.compile(r"^\s*(?:\*\*)?\s*Hint\s*(?:\d+)?\s*(?:\*\*)?\s*:\s*(?:\*\*)?\s*(.*)$", re.IGNORECASE)
+
+
+def quiz_format(user_input):
+    """Return the format of the phase response: "json", "olx" or "plain_text"."""
+    if user_input.get("structured_output"):
+        return "json"
+    return "olx" if "olx" in str(user_input.get("output_format", "")).lower() else "plain_text"
+
+
+# --- parsing ---
+def parse_plain_text_question(text):
+    """Parse one plain-text question block into a question dict; raises QuizValidationError."""
+    stem_lines, options, hints, explanation = [], [], [], []
+    solution = None
+    section = "stem"
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        stem_match = _STEM_RE.match(line)
+        if section == "stem" and stem_match and not stem_lines:
+            stem_lines.append(stem_match.group(1))
+            continue
+        solution_match = _SOLUTION_RE.match(line)
+        if solution_match:
+            solution = re.findall(r"\b([A-Z])\b", solution_match.group(1))
+            section = "solution"
+            continue
+        feedback_match = _FEEDBACK_RE.match(line)
+        if feedback_match:
+            if feedback_match.group(1):
+                explanation.append(feedback_match.group(1))
+            section = "feedback"
+            continue
+        hint_match = _HINT_RE.match(line)
+        if hint_match:
+            hints.append(hint_match.group(1))
+            continue
+        option_match = _OPTION_RE.match(line)
+        if option_match and section in ("stem", "options"):
+            options.append({"label": option_match.group(1), "text": option_match.group(2)})
+            section = "options"
+        elif option_match and section in ("solution", "feedback"):
+            for option in options:
+                if option["label"] == option_match.group(1):
+                    option["feedback"] = option_match.group(2)
+        elif section == "stem":
+            stem_lines.append(line.strip())
+        elif section == "feedback":
+            explanation.append(line.strip())
+
+    if solution is None:
+        raise QuizValidationError("no solution line")
+    labels = {option["label"] for option in options}
+    unknown = [label for label in solution if label not in labels]
+    if unknown:
+        raise QuizValidationError(f"the solution names options that do not exist: {', '.join(unknown)}")
+    question = {
+        "stem": " ".join(part for part in stem_lines if part),
+        "options": [{"text": option["text"], "correct": option["label"] in solution,
+                     **({"feedback": option["feedback"]} if option.get("feedback") else {})} for option in options],
+        "hints": hints,
+    }
+    if explanation:
+        question["explanation"] = " ".join(explanation)
+    return question
+
+
+def _text_of(element, skip=("choicehint",)):
+    parts = [element.text or ""]
+    for child in element:
+        if child.tag not in skip:
+            parts.append(_text_of(child, skip))
+        parts.append(child.tail or "")
+    return " ".join("".join(parts).split())
+
+
+def parse_olx_problem(text):
+    """Parse one OLX <problem> into a question dict; raises QuizValidationError."""
+    try:
+        root = ET.fromstring(text)
+    except ET.ParseError as e:
+        raise QuizValidationError(f"malformed OLX: {e}")
+    choices = root.findall(".//choice")
+    label = root.find(".//label")
+    question = {
+        "stem": _text_of(label) if label is not None else "",
+        "options": [],
+        "hints": [_text_of(hint) for hint in root.findall(".//demandhint/hint")],
+    }
+    for choice in choices:
+        option = {"text": _text_of(choice), "correct": (choice.get("correct") or "").lower() == "true"}
+        feedback = [_text_of(hint) for hint in choice.findall("choicehint")
+                    if (hint.get("selected") or "true").lower() == "true"]
+        if feedback:
+            option["feedback"] = " ".join(feedback)
+        question["options"].append(option)
+    solution = root.find(".//solution")
+    if solution is not None and _text_of(solution):
+        question["explanation"] = _text_of(solution)
+    return question
+
+
+def split_quiz(text, fmt):
+    """Split a quiz response into segments and return (segments, question_indexes).
+
+    Joining the segments gives back the original text; question_indexes lists the segments that
+    hold one question each. For "json", the segments are the question dicts of the parsed quiz.
+    """
+    if fmt == "json":
+        questions = load_quiz_json(text)
+        if isinstance(questions, dict):
+            questions = questions.get("questions")
+        if not isinstance(questions, list):
+            raise QuizValidationError('the quiz has no "questions" list')
+        return list(questions), list(range(len(questions)))
+
+    if fmt == "olx":
+        matches = list(_PROBLEM_RE.finditer(text))
+        segments, indexes, position = [], [], 0
+        for match in matches:
+            segments.append(text[position:match.start()])
+            indexes.append(len(segments))
+            segments.append(match.group(0))
+            position = match.end()
+        segments.append(text[position:])
+        return segments, indexes
+
+    starts = [match.start() for match in _QUESTION_START_RE.finditer(text)]
+    if not starts:
+        return [text], []
+    segments = [text[:starts[0]]]
+    bounds = starts + [len(text)]
+    for start, end in zip(bounds, bounds[1:]):
+        segments.append(text[start:end])
+    return segments, list(range(1, len(segments)))
+
+
+def parse_question(segment, fmt):
+    """Parse one question segment of split_quiz() into a question dict; raises QuizValidationError."""
+    if fmt == "json":
+        return validate_question(segment)
+    if fmt == "olx":
+        return parse_olx_problem(segment)
+    return parse_plain_text_question(segment)
+
+
+def join_quiz(segments, fmt):
+    """Inverse of split_quiz()."""
+    if fmt == "json":
+        return json.dumps({"questions": segments}, ensure_ascii=False, indent=2)
+    return "".join(segments)
+
+
+# --- checking ---
+def question_issues(question, correct_ans_num=None, distractors_num=None):
+    """Return the list of reasons why a parsed question does not conform (empty if it does)."""
+    issues = []
+    try:
+        question = validate_question(question)
+    except QuizValidationError as e:
+        return [str(e).replace("question 1: ", "")]
+    correct = sum(option["correct"] for option in question["options"])
+    distractors = len(question["options"]) - correct
+    if correct_ans_num and correct != int(correct_ans_num):
+        issues.append(f"it has {correct} correct option(s) instead of {int(correct_ans_num)}")
+    if distractors_num and distractors != int(distractors_num):
+        issues.append(f"it has {distractors} distractor(s) instead of {int(distractors_num)}")
+    return issues
+
+
+def check_quiz(text, user_input):
+    """Check a quiz response against the phase settings.
+
+    Returns a report dict with "format", "questions" (parsed questions or None), "issues"
+    ({question position: [reasons]}) and "missing" (number of questions short of questions_num).
+    """
+    fmt = quiz_format(user_input)
+    try:
+        segments, indexes = split_quiz(text, fmt)
+    except QuizValidationError as e:
+        return {"format": fmt, "questions": None, "issues": {None: [f"the quiz could not be parsed: {e}"]},
+                "missing": 0}
+    questions, issues = [], {}
+    for position, index in enumerate(indexes):
+        try:
+            question = parse_question(segments[index], fmt)
+            reasons = question_issues(question, user_input.get("correct_ans_num"), user_input.get("distractors_num"))
+        except QuizValidationError as e:
+            question, reasons = None, [str(e)]
+        questions.append(question)
+        if reasons:
+            issues[position] = reasons
+    questions_num = int(user_input.get("questions_num") or len(indexes) or 1)
+    return {"format": fmt, "questions": questions, "issues": issues,
+            "missing": max(0, questions_num - len(indexes))}
+
+
+# --- targeted regeneration ---
+def _first_question(text, fmt):
+    """Return the first question segment of a model response, or None."""
+    try:
+        segments, indexes = split_quiz(text, fmt)
+    except QuizValidationError:
+        return None
+    return segments[indexes[0]] if indexes else None
+
+
+async def repair_quiz(text, base_context, family, render_prompt, user_input, max_rounds=DEFAULT_MAX_ROUNDS):
+    """Regenerate only the non-conforming or missing questions of a quiz and splice them back in.
+
+    Args:
+        text: Quiz response of the phase
+        base_context: Handler context from build_llm_context; its user_prompt is replaced per call
+        family: Model family of base_context
+        render_prompt: Callable turning a user_input dict into the formatted phase prompt
+        user_input: Phase field values, including questions_num, correct_ans_num and distractors_num
+        max_rounds: How often a replacement that is still invalid is re-requested
+
+    Returns (text, report) where report holds the number of questions regenerated, the issues
+    that remain and the total cost of the calls.
+    """
+    fmt = quiz_format(user_input)
+    report = {"format": fmt, "regenerated": 0, "removed": 0, "remaining": {}, "cost": 0.0}
+    check = check_quiz(text, user_input)
+    if check["questions"] is None:
+        report["remaining"] = check["issues"]
+        return text, report
+
+    segments, indexes = split_quiz(text, fmt)
+    questions_num = int(user_input.get("questions_num") or len(indexes) or 1)
+    if len(indexes) > questions_num:
+        # drop surplus questions, the invalid ones first
+        ranked = sorted(range(len(indexes)), key=lambda position: (position not in check["issues"], -position))
+        surplus = set(ranked[:len(indexes) - questions_num])
+        for position in sorted(surplus, reverse=True):
+            segments[indexes[position]] = None
+        report["removed"] = len(surplus)
+        kept = [position for position in range(len(indexes)) if position not in surplus]
+        check["issues"] = {kept.index(position): reasons for position, reasons in check["issues"].items()
+                           if position in kept}
+        check["questions"] = [check["questions"][position] for position in kept]
+        indexes = [indexes[position] for position in kept]
+
+    # missing questions become empty slots after the last question
+    pending = dict(check["issues"])
+    for _ in range(check["missing"]):
+        insert_at = (indexes[-1] + 1) if indexes else len(segments)
+        segments.insert(insert_at, "" if fmt != "json" else {})
+        indexes = [index + 1 if index >= insert_at else index for index in indexes] + [insert_at]
+        check["questions"].append(None)
+        pending[len(indexes) - 1] = ["it is missing"]
+
+    single_input = {**user_input, "questions_num": 1}
+    base_prompt = render_prompt(single_input)
+
+    async def regenerate(position, reasons):
+        existing = "\n".join(f"- {question['stem']}" for other, question in enumerate(check["questions"])
+                             if other != position and question and question.get("stem")) or "- (none)"
+        context = {**base_context, "TOTAL_PRICE": 0, "chat_history": [],
+                   "user_prompt": REPAIR_INSTRUCTIONS.format(issues="; ".join(reasons), existing=existing) +
+                   base_prompt}
+        try:
+            result = await dispatch_completion(context, family, use_cache=False)
+        except ProviderError as e:
+            return position, None, [str(e)]
+        finally:
+            report["cost"] += context["TOTAL_PRICE"]
+        replacement = _first_question(result, fmt)
+        if replacement is None:
+            return position, None, ["the replacement could not be parsed"]
+        try:
+            question = parse_question(replacement, fmt)
+        except QuizValidationError as e:
+            return position, None, [str(e)]
+        issues = question_issues(question, user_input.get("correct_ans_num"), user_input.get("distractors_num"))
+        return position, (replacement, question), issues
+
+    for _ in range(max(1, max_rounds)):
+        if not pending:
+            break
+        results = await asyncio.gather(*(regenerate(position, reasons) for position, reasons in pending.items()))
+        pending = {}
+        for position, replacement, issues in results:
+            if replacement is not None and not issues:
+                segment, question = replacement
+                if fmt == "json":
+                    segments[indexes[position]] = segment
+                else:
+                    # keep the whitespace that separated the old question from the next one
+                    old = segments[indexes[position]] or ""
+                    trailing = old[len(old.rstrip()):] or "\n"
+                    previous = "".join(part for part in segments[:indexes[position]] if isinstance(part, str))
+                    leading = "\n\n" if not old and previous and not previous.endswith("\n\n") else ""
+                    segments[indexes[position]] = leading + segment.strip() + trailing
+                check["questions"][position] = question
+                report["regenerated"] += 1
+            else:
+                pending[position] = issues or ["the replacement did not conform"]
+
+    # slots that could not be filled are left out, invalid questions stay as they were
+    report["remaining"] = {position: reasons for position, reasons in pending.items()}
+    segments = [segment for segment in segments if segment not in (None, "", {})]
+    return join_quiz(segments, fmt), report
@@ -0,0 +1,167 @@
+"""
+Token-bucket rate limiting of provider calls, shared by all sessions of the server.
+
+Every Streamlit session calls the providers on its own, so a class pressing "Submit" at the same
+moment exceeds the requests-per-minute (rpm) and tokens-per-minute (tpm) limits of an API key
+and everybody gets 429s. RATE_LIMITER smooths such bursts instead: each call (and each retry
+of it) first takes one request and its estimated tokens (prompt estimate + max_tokens) from
+the buckets of its provider + API key, and waits when they are empty. Waiting calls of the same key are served in
+FIFO order and can report their queue position, which the app shows while it waits.
+
+Buckets live in memory, or in a SQLite file when several server processes share one key
+(RATE_LIMIT_DB in the app config); FIFO order is kept per process in either case. Providers
+without configured limits are not limited.
+"""
+import asyncio
+import itertools
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+
+from core_logic.client_pool import hash_api_key
+
+DEFAULT_RATE_LIMITS = {}  # provider -> {"rpm": requests per minute, "tpm": tokens per minute}
+POLL_INTERVAL = 0.5
+
+
+def _refill_and_take(state, limits, tokens, now):
+    """Refill a bucket state (requests, tokens, updated) and try to take one request and `tokens`.
+
+    Returns (new_state, wait) where wait is 0 if the request was taken and otherwise the seconds
+    until the buckets will hold enough.
+    """
+    rpm, tpm = limits.get("rpm"), limits.get("tpm")
+    requests_left, tokens_left, updated = state if state else (rpm or 0, tpm or 0, now)
+    elapsed = max(0.0, now - updated)
+    waits = []
+    if rpm:
+        requests_left = min(rpm, requests_left + elapsed * rpm / 60)
+        waits.append(max(0.0, (1 - requests_left) * 60 / rpm))
+    if tpm:
+        tokens = min(tokens, tpm)  # a request larger than the bucket can still go once it is full
+        tokens_left = min(tpm, tokens_left + elapsed * tpm / 60)
+        waits.append(max(0.0, (tokens - tokens_left) * 60 / tpm))
+    wait = max(waits, default=0.0)
+    if wait == 0:
+        requests_left -= 1 if rpm else 0
+        tokens_left -= tokens if tpm else 0
+    return (requests_left, tokens_left, now), wait
+
+
+class MemoryBucketStore:
+    """Bucket states of one process."""
+    blocking = False
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, limits, tokens):
+        with self._lock:
+            self._states[key], wait = _refill_and_take(self._states.get(key), limits, tokens, time.time())
+        return wait
+
+
+class SQLiteBucketStore:
+    """Bucket states in a SQLite file, shared by all processes using the same file.
+
+    take() blocks on the file lock, so RateLimiter runs it in a worker thread.
+    """
+    blocking = True
+
+    def __init__(self, path):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets "
+                         "(key TEXT PRIMARY KEY, requests REAL, tokens REAL, updated REAL)")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def take(self, key, limits, tokens):
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock, so the read-modify-write is atomic across processes
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT requests, tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            state, wait = _refill_and_take(row, limits, tokens, time.time())
+            conn.execute("INSERT OR REPLACE INTO buckets (key, requests, tokens, updated) VALUES (?, ?, ?, ?)",
+                         (key, *state))
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return wait
+
+
+class RateLimiter:
+    """FIFO token-bucket limiter keyed by provider and API key."""
+
+    def __init__(self, limits=None, store=None):
+        self.limits = dict(limits or DEFAULT_RATE_LIMITS)
+        self.store = store or MemoryBucketStore()
+        self._queues = defaultdict(deque)
+        self._tickets = itertools.count()
+        self._lock = threading.Lock()
+
+    def configure(self, limits=None, shared_path=None):
+        """Replace the limits and optionally keep the buckets in a SQLite file shared between processes."""
+        if limits is not None:
+            self.limits = dict(limits)
+        if shared_path and getattr(self.store, "path", None) != shared_path:
+            self.store = SQLiteBucketStore(shared_path)
+
+    def queue_length(self, provider, api_key):
+        """Number of calls of a provider + API key currently waiting."""
+        with self._lock:
+            return len(self._queues.get(f"{provider}:{hash_api_key(api_key)}", ()))
+
+    async def _take(self, key, limits, tokens):
+        # a contended SQLite lock must not stall the shared background loop
+        if self.store.blocking:
+            return await asyncio.to_thread(self.store.take, key, limits, tokens)
+        return self.store.take(key, limits, tokens)
+
+    async def acquire(self, provider, api_key, tokens, on_queue=None):
+        """Wait until a call of `tokens` estimated tokens may be sent.
+
+        on_queue, if given, is called with (position, estimated_wait_seconds) whenever the
+        position changes while waiting (position 1 is next) and with (0, 0) once admitted.
+        """
+        limits = self.limits.get(provider)
+        if not limits:
+            return
+        key = f"{provider}:{hash_api_key(api_key)}"
+        ticket = next(self._tickets)
+        with self._lock:
+            queue = self._queues[key]
+            queue.append(ticket)
+        reported = None
+        try:
+            while True:
+                with self._lock:
+                    position = queue.index(ticket) + 1
+                wait = await self._take(key, limits, tokens) if position == 1 else None
+                if wait == 0:
+                    break
+                if on_queue is not None and position != reported:
+                    on_queue(position, wait or 0)
+                    reported = position
+                await asyncio.sleep(min(wait, POLL_INTERVAL) if wait else POLL_INTERVAL / 5)
+        finally:
+            with self._lock:
+                queue.remove(ticket)
+                if not queue:
+                    self._queues.pop(key, None)
+        if reported is not None:
+            on_queue(0, 0)
+
+
+RATE_LIMITER = RateLimiter()
@@ -0,0 +1,288 @@
+"""
+Retries, backoff and circuit breaking for provider calls.
+
+The handlers raise instead of returning error text, and every call goes through
+call_with_resilience(), which
+
+- turns SDK and HTTP exceptions into the typed errors below (classify_error),
+- retries rate limits, timeouts, overloads and 5xx responses with bounded exponential backoff
+  and full jitter, waiting at least as long as the provider's Retry-After header asks,
+- keeps one circuit breaker per provider: after `failure_threshold` consecutive outages the
+  breaker opens and calls fail fast with CircuitOpenError for `reset_timeout` seconds, after
+  which a single trial call decides whether it closes again.
+
+Policies are process-wide, like the provider limits they protect; configure_resilience()
+overrides the defaults (RETRY_POLICY and CIRCUIT_BREAKER in the app config).
+"""
+import asyncio
+import email.utils
+import random
+import threading
+import time
+
+DEFAULT_RETRY_POLICY = {
+    "max_attempts": 4,
+    "base_delay": 0.5,       # seconds; the n-th retry waits up to base_delay * 2**n
+    "max_delay": 20.0,
+    "max_retry_after": 60.0,  # a longer Retry-After is not waited for
+}
+DEFAULT_CIRCUIT_BREAKER = {
+    "failure_threshold": 5,
+    "reset_timeout": 30.0,
+}
+RETRYABLE_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+
+class ProviderError(RuntimeError):
+    """A failed provider call.
+
+    Attributes:
+        provider: Model family of the call
+        status: HTTP status of the response, if any
+        retry_after: Seconds the provider asked to wait, if any
+    """
+    retryable = False
+    outage = False  # counts towards opening the circuit breaker
+
+    def __init__(self, message, provider=None, status=None, retry_after=None):
+        super().__init__(message)
+        self.provider = provider
+        self.status = status
+        self.retry_after = retry_after
+
+
+class RateLimitError(ProviderError):
+    """The provider rejected the call because of a rate limit (429)."""
+    retryable = True
+
+
+class ProviderTimeout(ProviderError):
+    """The call timed out."""
+    retryable = True
+    outage = True
+
+
+class ProviderUnavailable(ProviderError):
+    """The provider could not be reached or answered with a server error or overload."""
+    retryable = True
+    outage = True
+
+
+class AuthenticationError(ProviderError):
+    """The API key is missing, invalid or not allowed to use the model."""
+
+
+class InvalidRequestError(ProviderError):
+    """The provider rejected the request itself; retrying it cannot help."""
+
+
+class CircuitOpenError(ProviderError):
+    """The circuit breaker of the provider is open, so the call was not made."""
+
+
+def parse_retry_after(headers):
+    """Return the seconds a Retry-After (or retry-after-ms) header asks to wait, or None."""
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after-ms")
+        if value is not None:
+            return max(0.0, float(value) / 1000)
+        value = headers.get("retry-after")
+    except AttributeError:
+        return None
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def _status(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is None and isinstance(getattr(exc, "code", None), int):
+        # google.api_core exceptions carry the HTTP status as .code
+        status = exc.code
+    return status if isinstance(status, int) else None
+
+
+def classify_error(exc, provider):
+    """Return the typed ProviderError for an exception raised by a provider call."""
+    if isinstance(exc, ProviderError):
+        if exc.provider is None:
+            exc.provider = provider
+        return exc
+    message = f"{provider} request failed: {exc}"
+    status = _status(exc)
+    retry_after = parse_retry_after(getattr(getattr(exc, "response", None), "headers", None))
+    name = type(exc).__name__
+    if status == 429:
+        return RateLimitError(message, provider, status, retry_after)
+    if status in (401, 403):
+        return AuthenticationError(message, provider, status)
+    if status in RETRYABLE_STATUSES:
+        return ProviderUnavailable(message, provider, status, retry_after)
+    if status is not None and 400 <= status < 500:
+        return InvalidRequestError(message, provider, status)
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)) or "Timeout" in name or "DeadlineExceeded" in name:
+        return ProviderTimeout(message, provider, status)
+    if isinstance(exc, ConnectionError) or "Connection" in name or name in ("ConnectError", "ReadError",
+                                                                             "RemoteProtocolError"):
+        return ProviderUnavailable(message, provider, status)
+    return ProviderError(message, provider, status)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one provider."""
+
+    def __init__(self, provider, failure_threshold, reset_timeout):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may be made now."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half_open" and not self.trial_running:
+                self.trial_running = True
+                return
+            wait = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            raise CircuitOpenError(f"{self.provider} is temporarily unavailable after repeated failures; "
+                                   f"try again in {wait:.0f}s or select another model.",
+                                   self.provider, retry_after=wait)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self, error):
+        with self._lock:
+            was_trial, self.trial_running = self.trial_running, False
+            if not error.outage:
+                return
+            self.failures += 1
+            if was_trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+_retry_policy = dict(DEFAULT_RETRY_POLICY)
+_breaker_policy = dict(DEFAULT_CIRCUIT_BREAKER)
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def configure_resilience(retry_policy=None, circuit_breaker=None):
+    """Override the process-wide retry and circuit breaker policies."""
+    _retry_policy.update(retry_policy or {})
+    if circuit_breaker:
+        _breaker_policy.update(circuit_breaker)
+        with _breakers_lock:
+            for breaker in _breakers.values():
+                breaker.failure_threshold = _breaker_policy["failure_threshold"]
+                breaker.reset_timeout = _breaker_policy["reset_timeout"]
+
+
+def get_breaker(provider):
+    """Return the circuit breaker of a provider, creating it on first use."""
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider, _breaker_policy["failure_threshold"],
+                                                 _breaker_policy["reset_timeout"])
+        return _breakers[provider]
+
+
+def backoff_delay(attempt, error, policy=None):
+    """Seconds to wait before retry number `attempt` (0-based) after `error`, or None to give up."""
+    policy = policy or _retry_policy
+    delay = random.uniform(0, min(policy["max_delay"], policy["base_delay"] * 2 ** attempt))
+    if error.retry_after is not None:
+        if error.retry_after > policy["max_retry_after"]:
+            return None
+        delay = max(delay, error.retry_after)
+    return delay
+
+
+async def call_with_resilience(provider, call):
+    """Await call() with retries and the provider's circuit breaker; raises a ProviderError.
+
+    call must return a new awaitable on every invocation.
+    """
+    breaker = get_breaker(provider)
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            result = await call()
+        except Exception as e:
+            error = classify_error(e, provider)
+            breaker.record_failure(error)
+            delay = backoff_delay(attempt, error) if error.retryable else None
+            attempt += 1
+            if delay is None or attempt >= _retry_policy["max_attempts"]:
+                raise error from e
+            await asyncio.sleep(delay)
+        except BaseException:
+            # cancelled, e.g. by a hedged request: free a half-open trial without judging the provider
+            with breaker._lock:
+                breaker.trial_running = False
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+
+async def stream_with_resilience(provider, open_stream):
+    """Async generator passing through open_stream() with retries and the circuit breaker.
+
+    A failed stream is retried only while nothing has been yielded; once output has reached
+    the caller an error is raised as the typed ProviderError.
+    """
+    breaker = get_breaker(provider)
+    attempt = 0
+    while True:
+        breaker.before_call()
+        started = False
+        try:
+            async for chunk in open_stream():
+                started = True
+                yield chunk
+        except Exception as e:
+            error = classify_error(e, provider)
+            breaker.record_failure(error)
+            delay = backoff_delay(attempt, error) if error.retryable and not started else None
+            attempt += 1
+            if delay is None or attempt >= _retry_policy["max_attempts"]:
+                raise error from e
+            await asyncio.sleep(delay)
+        except BaseException:
+            with breaker._lock:
+                breaker.trial_running = False
+            raise
+        else:
+            breaker.record_success()
+            return
@@ -0,0 +1,86 @@
+"""
+Scoring engine for scored phases.
+
+The score is requested as a JSON object ({"criteria": {...}, "total": n}) with the provider's
+JSON mode where available, and parsed without regular expressions. If the reply cannot be
+parsed, the model is asked once more to return only the JSON object; a total that is missing
+is computed from the criterion scores. Scoring can use a cheaper model than the feedback
+(SCORING_LLM in the app config) and runs concurrently with the streamed feedback, since both
+only depend on the user's submission.
+"""
+import json
+import re
+
+from core_logic.handlers import dispatch_completion
+
+SCORING_RETRY_PROMPT = "Your previous reply could not be parsed. Reply only with the JSON object, nothing else."
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+class ScoreParseError(ValueError):
+    """Raised when a scoring reply does not contain a usable score."""
+
+
+def _number(value):
+    if isinstance(value, bool):
+        raise ScoreParseError(f"not a score: {value!r}")
+    if isinstance(value, (int, float)):
+        return value
+    match = _NUMBER_RE.search(str(value))
+    if not match:
+        raise ScoreParseError(f"not a score: {value!r}")
+    number = float(match.group(0))
+    return int(number) if number.is_integer() else number
+
+
+def parse_score(text):
+    """Parse a scoring reply into {"total": number, "criteria": {name: number}}; raises ScoreParseError."""
+    cleaned = re.sub(r"^\s*```(?:json)?\s*|\s*```\s*$", "", (text or "").strip())
+    start, end = cleaned.find("{"), cleaned.rfind("}")
+    if start < 0 or end <= start:
+        raise ScoreParseError("the reply does not contain a JSON object")
+    try:
+        data = json.loads(cleaned[start:end + 1])
+    except ValueError as e:
+        raise ScoreParseError(f"the reply is not valid JSON: {e}")
+    if not isinstance(data, dict):
+        raise ScoreParseError("the reply is not a JSON object")
+
+    criteria = data.get("criteria")
+    if not isinstance(criteria, dict):
+        # flat format: {"criterion": score, ..., "total": score}
+        criteria = {key: value for key, value in data.items() if key.lower() != "total"}
+    parsed_criteria = {}
+    for name, value in criteria.items():
+        try:
+            parsed_criteria[name] = _number(value)
+        except ScoreParseError:
+            continue
+
+    total = next((value for key, value in data.items() if key.lower() == "total"), None)
+    if total is not None:
+        total = _number(total)
+    elif parsed_criteria:
+        total = sum(parsed_criteria.values())
+    else:
+        raise ScoreParseError("the reply has neither a total nor criterion scores")
+    return {"total": total, "criteria": parsed_criteria}
+
+
+async def score_response(context, family, use_cache=True):
+    """Request and parse a score for a prepared scoring context.
+
+    The cost of all calls is added to context["TOTAL_PRICE"].
+    Returns (score, raw_reply) where score is the parse_score() dict. Raises ProviderError if the
+    request fails and ScoreParseError if the retried reply still cannot be parsed.
+    """
+    context["response_format"] = "json"
+    raw = await dispatch_completion(context, family, use_cache=use_cache)
+    try:
+        return parse_score(raw), raw
+    except ScoreParseError:
+        history = (context.get("chat_history") or []) + [{"user": context["user_prompt"], "assistant": raw}]
+        retry = {**context, "TOTAL_PRICE": 0, "chat_history": history, "user_prompt": SCORING_RETRY_PROMPT}
+        raw = await dispatch_completion(retry, family, use_cache=use_cache)
+        context["TOTAL_PRICE"] += retry["TOTAL_PRICE"]
+        return parse_score(raw), raw
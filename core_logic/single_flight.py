@@ -0,0 +1,132 @@
+"""
+Single-flight coalescing of identical in-flight completions.
+
+When a workshop submits the same video with the same settings, identical requests arrive
+while the first one is still running, before the completion cache has anything to return.
+SINGLE_FLIGHT lets them share that one provider call: requests with the same completion cache
+key join the running flight instead of starting their own. Non-streaming waiters get the final
+response; streaming waiters first get every chunk produced so far and then follow the stream.
+
+The cost of the shared call is split evenly over the requests still waiting when it finishes,
+so the TOTAL_PRICE of all of them adds up to what was spent. Each waiter's context gets the
+call's "usage" and "coalesced" (the number of requests that shared it). The call is cancelled
+only when every waiter has gone.
+"""
+import asyncio
+import threading
+
+from core_logic.telemetry import charge
+
+# context keys the shared call reports back to every waiter
+SHARED_CONTEXT_FIELDS = ("usage", "error")
+
+
+class _Flight:
+    def __init__(self, key, context):
+        self.key = key
+        # the cost is charged to the waiters, not to the context it was recorded in
+        self.context = {**context, "TOTAL_PRICE": 0, "cost_meter": None}
+        for field in SHARED_CONTEXT_FIELDS:
+            self.context.pop(field, None)
+        # by id(): coalesced requests have equal contexts, so they must not be compared by value
+        self.waiters = {}
+        self.chunks = []
+        self.changed = asyncio.Event()
+        self.task = None
+
+    def publish(self, chunk):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def _notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlight:
+    """Registry of in-flight completions keyed by completion cache key and event loop."""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self):
+        """Number of shared calls currently running."""
+        with self._lock:
+            return len(self._flights)
+
+    def _join(self, key, context, start):
+        loop = asyncio.get_running_loop()
+        registry_key = (id(loop), key)
+        with self._lock:
+            flight = self._flights.get(registry_key) if key is not None else None
+            if flight is None:
+                flight = _Flight(key, context)
+                flight.task = loop.create_task(self._run(registry_key, flight, start))
+                if key is not None:
+                    self._flights[registry_key] = flight
+            flight.waiters[id(context)] = context
+        return flight
+
+    async def _run(self, registry_key, flight, start):
+        try:
+            return await start(flight.context, flight.publish)
+        finally:
+            with self._lock:
+                if self._flights.get(registry_key) is flight:
+                    del self._flights[registry_key]
+                waiters = list(flight.waiters.values())
+            share = flight.context.get("TOTAL_PRICE", 0) / max(1, len(waiters))
+            for context in waiters:
+                charge(context, share)
+                context["coalesced"] = len(waiters)
+                for field in SHARED_CONTEXT_FIELDS:
+                    if field in flight.context:
+                        context[field] = flight.context[field]
+            flight._notify()
+
+    def _leave(self, flight, context):
+        with self._lock:
+            flight.waiters.pop(id(context), None)
+            abandoned = not flight.waiters
+        if abandoned and not flight.task.done():
+            flight.task.cancel()
+
+    async def run(self, key, context, start):
+        """Return the result of start(flight_context, publish), shared with identical running requests.
+
+        start is only called if no flight for key is running; it gets a private copy of the
+        context to record usage in and a publish(chunk) callback for streamed output. A key of
+        None never shares.
+        """
+        flight = self._join(key, context, start)
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            self._leave(flight, context)
+            raise
+
+    async def stream(self, key, context, start):
+        """Async generator of the chunks of a shared flight; arguments as in run()."""
+        flight = self._join(key, context, start)
+        index = 0
+        finished = False
+        try:
+            while True:
+                while index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                if flight.task.done():
+                    result = flight.task.result()
+                    if index == 0 and result:
+                        # the flight was not streamed
+                        yield result
+                    finished = True
+                    return
+                await flight.changed.wait()
+        finally:
+            if not finished:
+                self._leave(flight, context)
+
+
+SINGLE_FLIGHT = SingleFlight()
@@ -0,0 +1,206 @@
+"""
+Telemetry of provider calls.
+
+Every handler call is recorded in TELEMETRY with its wall time, time to the first byte (the
+first streamed chunk; the full response for non-streaming calls), input and output tokens,
+cost, model, family and outcome ("ok", "cancelled" or the class of the classified ProviderError).
+Each attempt is a call of its own: retries are recorded separately, and time spent in the rate
+limiter queue or in backoff sleeps between attempts is not part of any call. Calls are aggregated
+in-process into Prometheus counters and histograms, served as text on /metrics by
+start_metrics_server() (METRICS_PORT in the app config), and optionally appended to a JSONL
+log (TELEMETRY_LOG), one object per call.
+
+Cost is charged to the requests that caused it with charge(), which also adds it to the
+session's CostMeter so the app can keep st.session_state["TOTAL_PRICE"] up to date.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core_logic.resilience import classify_error
+
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+
+class CostMeter:
+    """Running total of the cost charged to one session."""
+
+    def __init__(self):
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, cost):
+        with self._lock:
+            self.total += cost
+
+
+def charge(context, cost):
+    """Add the cost of a call to context["TOTAL_PRICE"] and to the context's cost meter, if any."""
+    context["TOTAL_PRICE"] = context.get("TOTAL_PRICE", 0) + cost
+    meter = context.get("cost_meter")
+    if meter is not None and cost:
+        meter.add(cost)
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_label_value(value)}"' for name, value in labels.items()) + "}"
+
+
+class Telemetry:
+    """In-process aggregation of provider calls, with an optional JSONL log."""
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = defaultdict(int)        # (family, model, outcome) -> calls
+            self.tokens = defaultdict(int)          # (family, model, direction) -> tokens
+            self.cost = defaultdict(float)          # (family, model) -> USD
+            self.duration = defaultdict(_Histogram)  # (family, model) -> wall time
+            self.ttfb = defaultdict(_Histogram)      # (family, model) -> time to first byte
+
+    def configure(self, log_path=None):
+        self.log_path = log_path
+
+    def record(self, family, model, outcome, wall_time, ttfb=None, input_tokens=0, output_tokens=0, cost=0.0,
+               stream=False):
+        """Record one handler call."""
+        event = {"ts": time.time(), "family": family, "model": model, "outcome": outcome, "stream": stream,
+                 "wall_time": round(wall_time, 4), "ttfb": round(ttfb, 4) if ttfb is not None else None,
+                 "input_tokens": int(input_tokens), "output_tokens": int(output_tokens), "cost": cost}
+        with self._lock:
+            self.requests[(family, model, outcome)] += 1
+            self.tokens[(family, model, "input")] += int(input_tokens)
+            self.tokens[(family, model, "output")] += int(output_tokens)
+            self.cost[(family, model)] += cost
+            self.duration[(family, model)].observe(wall_time)
+            if ttfb is not None:
+                self.ttfb[(family, model)].observe(ttfb)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(event) + "\n")
+        return event
+
+    def call(self, context, family, stream=False):
+        """Return a _CallTimer recording one handler call made with `context`."""
+        return _CallTimer(self, context, family, stream)
+
+    def prometheus_text(self):
+        """Return the aggregates in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines += ["# HELP llm_requests_total Provider calls by outcome.", "# TYPE llm_requests_total counter"]
+            lines += [f"llm_requests_total{_labels(family=f, model=m, outcome=o)} {n}"
+                      for (f, m, o), n in sorted(self.requests.items())]
+            lines += ["# HELP llm_tokens_total Tokens sent and received.", "# TYPE llm_tokens_total counter"]
+            lines += [f"llm_tokens_total{_labels(family=f, model=m, direction=d)} {n}"
+                      for (f, m, d), n in sorted(self.tokens.items())]
+            lines += ["# HELP llm_cost_usd_total Cost of provider calls in USD.", "# TYPE llm_cost_usd_total counter"]
+            lines += [f"llm_cost_usd_total{_labels(family=f, model=m)} {cost:.6f}"
+                      for (f, m), cost in sorted(self.cost.items())]
+            for name, help_text, histograms in (
+                    ("llm_request_duration_seconds", "Wall time of provider calls.", self.duration),
+                    ("llm_time_to_first_byte_seconds", "Time to the first response byte.", self.ttfb)):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (f, m), histogram in sorted(histograms.items()):
+                    for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                        lines.append(f"{name}_bucket{_labels(family=f, model=m, le=bound)} {count}")
+                    lines.append(f"{name}_bucket{_labels(family=f, model=m, le='+Inf')} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(family=f, model=m)} {histogram.total:.4f}")
+                    lines.append(f"{name}_count{_labels(family=f, model=m)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class _CallTimer:
+    """Async context manager timing one handler call; call first_byte() when output starts."""
+
+    def __init__(self, telemetry, context, family, stream):
+        self.telemetry = telemetry
+        self.context = context
+        self.family = family
+        self.stream = stream
+        self.started = None
+        self.ttfb = None
+
+    def first_byte(self):
+        if self.ttfb is None:
+            self.ttfb = time.monotonic() - self.started
+
+    async def __aenter__(self):
+        self.started = time.monotonic()
+        self.price_before = self.context.get("TOTAL_PRICE", 0)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        wall_time = time.monotonic() - self.started
+        if exc_type is None:
+            outcome = "ok"
+            self.first_byte()
+        elif exc_type.__name__ in ("CancelledError", "GeneratorExit"):
+            # GeneratorExit: the consumer of a stream stopped reading
+            outcome = "cancelled"
+        elif isinstance(exc, Exception):
+            outcome = type(classify_error(exc, self.family)).__name__
+        else:
+            outcome = exc_type.__name__
+        usage = self.context.get("usage") or {}
+        self.telemetry.record(self.family, self.context.get("model"), outcome, wall_time, self.ttfb,
+                              usage.get("input_tokens", 0), usage.get("output_tokens", 0),
+                              self.context.get("TOTAL_PRICE", 0) - self.price_before, self.stream)
+        return False
+
+
+TELEMETRY = Telemetry()
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="127.0.0.1", telemetry=TELEMETRY):
+    """Serve telemetry.prometheus_text() on http://host:port/metrics from a daemon thread (once per process)."""
+    global _metrics_server
+    with _metrics_server_lock:
+        if _metrics_server is not None:
+            return _metrics_server
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        _metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=_metrics_server.serve_forever, name="llm-metrics", daemon=True).start()
+        return _metrics_server
@@ -0,0 +1,85 @@
+"""
+Fast local token estimates and the token-budget preflight.
+
+Provider tokenizers are not available offline for every model family, so prompts are
+measured with a cheap heuristic that is close to the BPE tokenizers used by OpenAI,
+Anthropic and Google for English prose: roughly four characters per token, but never
+fewer tokens than about three quarters of the word count.
+
+preflight() uses the estimate and the "context_window" of LLM_CONFIG to check a request
+before it is sent, so oversize prompts fail locally instead of after a network round trip.
+"""
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+IMAGE_TOKENS = 800
+DEFAULT_CONTEXT_WINDOW = 8192
+# safety margin for the error of the estimate
+PREFLIGHT_MARGIN = 0.05
+
+
+class ContextWindowExceeded(ValueError):
+    """Raised when a prompt plus max_tokens cannot fit into the model's context window."""
+
+    def __init__(self, report):
+        self.report = report
+        super().__init__(
+            f"Prompt of ~{report['prompt_tokens']} tokens plus {report['max_output_tokens']} output tokens "
+            f"does not fit the {report['context_window']} token context window of {report['model']}."
+        )
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens of a string."""
+    if not text:
+        return 0
+    by_chars = len(text) / CHARS_PER_TOKEN
+    by_words = len(text.split()) * 0.75
+    return int(max(by_chars, by_words)) + 1
+
+
+def estimate_prompt_tokens(context):
+    """Estimate the input tokens of a handler context: prompts, chat history and images."""
+    texts = [context.get("SYSTEM_PROMPT"), context.get("phase_instructions"), context.get("user_prompt")]
+    for entry in context.get("chat_history") or []:
+        texts.extend([entry.get("user"), entry.get("assistant")])
+    tokens = sum(estimate_tokens(text) + MESSAGE_OVERHEAD_TOKENS for text in texts)
+    return tokens + IMAGE_TOKENS * len(context.get("image_urls") or [])
+
+
+def preflight(context):
+    """Estimate the token budget and projected cost of a handler context.
+
+    Returns a dict with "model", "prompt_tokens", "max_output_tokens", "context_window",
+    "available_prompt_tokens", "fits" and "projected_cost" (the cost if all max_tokens are used).
+    """
+    prompt_tokens = estimate_prompt_tokens(context)
+    max_output_tokens = int(context.get("max_tokens") or 0)
+    context_window = int(context.get("context_window") or DEFAULT_CONTEXT_WINDOW)
+    available = int(context_window * (1 - PREFLIGHT_MARGIN)) - max_output_tokens
+    projected_cost = (prompt_tokens * context.get("price_input_token_1M", 0)
+                      + max_output_tokens * context.get("price_output_token_1M", 0)) / 1000000
+    return {
+        "model": context.get("model"),
+        "prompt_tokens": prompt_tokens,
+        "max_output_tokens": max_output_tokens,
+        "context_window": context_window,
+        "available_prompt_tokens": available,
+        "fits": prompt_tokens <= available,
+        "projected_cost": projected_cost,
+    }
+
+
+def trim_to_tokens(text, max_tokens):
+    """Cut text to at most about max_tokens estimated tokens, preferring a sentence boundary."""
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max_tokens * CHARS_PER_TOKEN]
+    while cut and estimate_tokens(cut) > max_tokens:
+        cut = cut[:int(len(cut) * 0.9)]
+    sentence_end = max(cut.rfind(". "), cut.rfind("? "), cut.rfind("! "))
+    if sentence_end > len(cut) // 2:
+        return cut[:sentence_end + 1]
+    word_end = cut.rfind(" ")
+    return cut[:word_end] if word_end > 0 else cut
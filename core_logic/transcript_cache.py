@@ -0,0 +1,158 @@
+"""
+Persistent on-disk cache for Vimeo transcripts.
+
+Each entry is keyed by Vimeo video id + preferred track language and stores the raw
+VTT/SRT file, the cleaned transcript text and its normalized form, plus the ETag/Last-Modified validators of the
+Vimeo API response so stale entries can be revalidated with a conditional request.
+
+Entries are fresh for `ttl` seconds after they were stored or revalidated. Expired entries
+without validators are deleted when the cache is pruned, and the least recently used
+entries are deleted once the cache grows beyond `max_bytes`.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.getenv(
+    "TRANSCRIPT_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "llm-microapps", "transcripts"),
+)
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+class TranscriptCache:
+    """File-per-entry transcript cache, safe to share between processes."""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, video_id, language):
+        safe_language = re.sub(r"[^A-Za-z0-9_-]+", "_", language or "any")
+        return os.path.join(self.directory, f"{video_id}_{safe_language}.json")
+
+    def get(self, video_id, language):
+        """Return the cached entry dict for video_id + language, or None.
+
+        The entry has the keys "raw", "cleaned", "normalized", "normalization_report",
+        "track_language", "source", "etag", "last_modified" and "stored_at".
+        Stale entries are returned too; check is_fresh().
+        """
+        path = self._path(video_id, language)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # the file's mtime marks the last access for size-based eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry.get("stored_at", 0) < self.ttl
+
+    def put(self, video_id, language, raw, cleaned, source, track_language=None, etag=None, last_modified=None,
+            normalized=None, normalization_report=None):
+        """Store a transcript and prune the cache if necessary."""
+        entry = {
+            "video_id": video_id,
+            "language": language,
+            "track_language": track_language,
+            "source": source,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": time.time(),
+            "raw": raw,
+            "cleaned": cleaned,
+            "normalized": normalized,
+            "normalization_report": normalization_report,
+        }
+        self._write(self._path(video_id, language), entry)
+        self.prune()
+
+    def touch(self, video_id, language, entry):
+        """Mark an entry as fresh again after a successful revalidation (HTTP 304)."""
+        entry = {**entry, "stored_at": time.time()}
+        self._write(self._path(video_id, language), entry)
+        return entry
+
+    def _write(self, path, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        # write to a temp file and rename, so readers in other processes never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def prune(self):
+        """Delete expired entries that cannot be revalidated, then the least recently used ones over max_bytes."""
+        with self._lock:
+            try:
+                names = [name for name in os.listdir(self.directory) if name.endswith(".json")]
+            except OSError:
+                return
+            files = []
+            now = time.time()
+            for name in names:
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                    if now - stat.st_mtime > self.ttl and not self._has_validators(path):
+                        os.remove(path)
+                        continue
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _has_validators(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return bool(entry.get("etag") or entry.get("last_modified"))
+
+    def clear(self):
+        """Delete every cached transcript."""
+        with self._lock:
+            try:
+                names = os.listdir(self.directory)
+            except OSError:
+                return
+            for name in names:
+                if name.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+
+
+# Process-wide cache used by fetch_vimeo_transcript
+TRANSCRIPT_CACHE = TranscriptCache()
@@ -96,6 +96,11 @@ PHASES = {
                 "type": "selectbox",
                 "options": ['Plain Text', 'OLX']
             },
+            "structured_output": {
+                "type": "checkbox",
+                "label": "Generate a structured quiz (rendered to OLX and plain text locally)",
+                "value": True,
+            },
 
         },
         "phase_instructions": "",
@@ -136,7 +141,7 @@ PHASES = {
                 "prompt": "Also, include a hint for each question.\n\n"
             },
                         {
-                                "condition": {"output_format": "OLX"},
+                                "condition": {"output_format": "OLX", "structured_output": False},
                                 "prompt": "Please write your MCQs in Open edX OLX format"
                                           "Here's an example template to follow:\n\n""""
                                           "<problem>"
@@ -166,7 +171,7 @@ PHASES = {
                                           "</problem>"\n\n"""
                         },
             {
-                "condition": {"output_format": "Plain Text"},
+                "condition": {"output_format": "Plain Text", "structured_output": False},
                 "prompt": """Format each question like the following:
             Question: [Question Text] \n
             A) [Answer A] \n
@@ -184,8 +189,13 @@ PHASES = {
             }
         ],
         "ai_response": True,
+        "chunked_generation": True,  # map-reduce over transcript segments when topic_content is long
+        "chunk_tokens": 6000,
+        "validate_output": True,  # regenerate only the questions that do not match the settings
+        "per_question_generation": False,  # one concurrent request per question, each on its own part of the content
         "allow_revisions": True,
         "max_revisions": 2,
+        "max_revision_candidates": 3,  # revisions may request up to this many candidates at once
         "allow_skip": False,
         "show_prompt": True,
         "read_only_prompt": False
@@ -203,7 +213,23 @@ PREFERRED_LLM = "gpt-4o"
 
 
 #SCORING_DEBUG_MODE = True
+#SCORING_LLM = "gpt-4o-mini"  # cheaper model for scored phases; defaults to the selected model
 DISPLAY_COST = False
+STREAM_RESPONSES = True  # render model output token by token while it is generated
+# chat history resent with each request: "full", "last_n", "token_budget" or "summary"
+HISTORY_POLICY = {"mode": "token_budget", "max_turns": 6, "max_tokens": 6000, "max_entry_tokens": 2000}
+# send the request to a second model too if the first has not answered by its p95 latency; first answer wins
+#HEDGE_POLICY = {"secondary": "gpt-4o-mini", "percentile": 95, "min_delay": 2, "max_delay": 120}
+# retries of rate-limited or failed model calls, and how long a failing provider is skipped
+#RETRY_POLICY = {"max_attempts": 4, "base_delay": 0.5, "max_delay": 20, "max_retry_after": 60}
+#CIRCUIT_BREAKER = {"failure_threshold": 5, "reset_timeout": 30}
+# requests and tokens per minute per provider and API key, shared by all sessions; match your provider tier.
+# Each call reserves its prompt tokens plus the model's max_tokens, so a low tpm admits few long requests.
+#RATE_LIMITS = {"openai": {"rpm": 500, "tpm": 30000}}
+#RATE_LIMIT_DB = "rate_limits.sqlite3"  # share the limits between several server processes
+# per-call latency, token and cost telemetry: Prometheus text on http://127.0.0.1:<port>/metrics and a JSONL log
+#METRICS_PORT = 9464
+#TELEMETRY_LOG = "llm_calls.jsonl"
 
 COMPLETION_MESSAGE = "Hope you enjoyed using the tool"
 COMPLETION_CELEBRATION = False
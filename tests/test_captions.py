@@ -0,0 +1,59 @@
+from core_logic.captions import Cue, iter_cues, cues_to_text, normalize_transcript, clean_caption_text
+
+
+def test_vtt_cues_with_timings():
+    vtt = ("WEBVTT\n\n"
+           "00:00:01.000 --> 00:00:02.500\nfirst <c>cue</c>\n\n"
+           "1:00:02.000 --> 1:00:03.000 align:start\nsecond\ncue\n")
+    assert list(iter_cues(vtt)) == [Cue(1.0, 2.5, "first cue"), Cue(3602.0, 3603.0, "second cue")]
+
+
+def test_vtt_header_without_blank_line_keeps_first_cue():
+    vtt = "WEBVTT\n00:00:01.000 --> 00:00:02.000\nfirst cue\n\n00:00:02.000 --> 00:00:03.000\nsecond cue"
+    assert [cue.text for cue in iter_cues(vtt)] == ["first cue", "second cue"]
+
+
+def test_vtt_skips_note_blocks_and_cue_identifiers():
+    vtt = ("WEBVTT - lecture\nKind: captions\n\n"
+           "NOTE this is not spoken\nneither is this\n\n"
+           "intro\n00:00:01.000 --> 00:00:02.000\nspoken\n")
+    assert [cue.text for cue in iter_cues(vtt)] == ["spoken"]
+
+
+def test_note_block_without_blank_line_ends_at_timing_line():
+    vtt = "WEBVTT\n\nNOTE comment\n00:00:01.000 --> 00:00:02.000\nspoken\n"
+    assert [cue.text for cue in iter_cues(vtt)] == ["spoken"]
+
+
+def test_srt_sequence_numbers_and_comma_fractions():
+    srt = "﻿1\n00:00:01,000 --> 00:00:02,000\nhello\n\n2\n00:00:02,500 --> 00:00:04,000\nworld\n"
+    assert list(iter_cues(srt)) == [Cue(1.0, 2.0, "hello"), Cue(2.5, 4.0, "world")]
+
+
+def test_untimed_text_is_kept_without_times():
+    cues = list(iter_cues("just a plain transcript\nover two lines\n\nand a second paragraph"))
+    assert cues == [Cue(None, None, "just a plain transcript over two lines"),
+                    Cue(None, None, "and a second paragraph")]
+
+
+def test_byte_line_streams_are_parsed():
+    lines = [b"\xef\xbb\xbfWEBVTT\n", b"\n", b"00:00:01.000 --> 00:00:02.000\r\n", "café\n".encode("utf-8")]
+    assert [cue.text for cue in iter_cues(lines)] == ["café"]
+
+
+def test_clean_caption_text_strips_tags_and_inline_timestamps():
+    assert clean_caption_text("<v Speaker>hello</v> [00:01] <00:00:01.000>there  ") == "hello there"
+
+
+def test_cues_to_text_joins_cue_texts():
+    assert cues_to_text([Cue(0, 1, "a"), Cue(1, 2, ""), Cue(2, 3, "b")]) == "a b"
+
+
+def test_normalize_transcript_collapses_rolling_captions():
+    cues = [Cue(0, 3, "the model learns"), Cue(3, 6, "the model learns\nfrom the data."),
+            Cue(6, 9, "from the data.\nThen it stops.")]
+    transcript, report = normalize_transcript(cues)
+    assert [cue.text for cue in transcript] == ["the model learns from the data.", "Then it stops."]
+    assert [(cue.start, cue.end) for cue in transcript] == [(0, 6), (6, 9)]
+    assert report["cues_before"] == 3
+    assert report["chars_after"] < report["chars_before"]
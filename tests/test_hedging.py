@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+# hedging imports the provider handlers; skip where the provider SDKs are not installed
+hedging = pytest.importorskip("core_logic.hedging")
+
+FAST_HEDGE = {"secondary": "backup", "default_delay": 0.01, "min_delay": 0.0}
+
+
+def primary_and_secondary():
+    return ({"model": "slow", "TOTAL_PRICE": 0}, "openai"), ({"model": "fast", "TOTAL_PRICE": 0}, "claude")
+
+
+def test_secondary_wins_after_the_deadline(monkeypatch):
+    cancelled = []
+
+    async def dispatch_completion(context, family, use_cache=True):
+        context["TOTAL_PRICE"] += 0.1
+        try:
+            await asyncio.sleep(10 if context["model"] == "slow" else 0)
+        except asyncio.CancelledError:
+            cancelled.append(context["model"])
+            raise
+        return context["model"]
+
+    monkeypatch.setattr(hedging, "dispatch_completion", dispatch_completion)
+    primary, secondary = primary_and_secondary()
+    assert asyncio.run(hedging.hedged_completion(primary, secondary, FAST_HEDGE)) == "fast"
+    assert cancelled == ["slow"]
+    assert primary[0]["hedge"]["winner"] == "secondary"
+    assert primary[0]["TOTAL_PRICE"] == pytest.approx(0.2)
+
+
+def test_cancelling_a_hedged_request_cancels_the_primary(monkeypatch):
+    cancelled = []
+
+    async def dispatch_completion(context, family, use_cache=True):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(context["model"])
+            raise
+
+    monkeypatch.setattr(hedging, "dispatch_completion", dispatch_completion)
+
+    async def main():
+        primary, secondary = primary_and_secondary()
+        task = asyncio.ensure_future(hedging.hedged_completion(primary, secondary, {**FAST_HEDGE,
+                                                                                    "default_delay": 5}))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert cancelled == ["slow"]
+
+
+def test_winning_stream_is_closed_when_the_consumer_stops(monkeypatch):
+    closed = []
+
+    async def stream_completion(context, family, use_cache=True):
+        try:
+            if context["model"] == "slow":
+                await asyncio.sleep(10)
+            for chunk in ("a", "b", "c"):
+                yield chunk
+        finally:
+            closed.append(context["model"])
+
+    monkeypatch.setattr(hedging, "stream_completion", stream_completion)
+
+    async def main():
+        primary, secondary = primary_and_secondary()
+        stream = hedging.hedged_stream(primary, secondary, FAST_HEDGE)
+        first = await stream.__anext__()
+        await stream.aclose()
+        # closed right away, not when the event loop shuts its generators down
+        return first, primary[0]["hedge"]["winner"], sorted(closed)
+
+    assert asyncio.run(main()) == ("a", "secondary", ["fast", "slow"])
@@ -0,0 +1,50 @@
+import pytest
+
+# history imports the provider handlers; skip where the provider SDKs are not installed
+history = pytest.importorskip("core_logic.history")
+
+
+def turns(count, user_words=10, answer_words=10):
+    return [{"user": f"prompt {index} " + "word " * user_words, "assistant": f"answer {index} " + "quiz " * answer_words}
+            for index in range(count)]
+
+
+def test_full_mode_keeps_everything():
+    chat_history = turns(3, user_words=5000)
+    assert history.window_history(chat_history, {"mode": "full"}, budget=10) == ([], chat_history)
+
+
+def test_last_n_keeps_the_newest_turns():
+    chat_history = turns(5)
+    evicted, kept = history.window_history(chat_history, {"mode": "last_n", "max_turns": 2})
+    assert evicted == chat_history[:3]
+    assert [entry["assistant"] for entry in kept] == [entry["assistant"] for entry in chat_history[3:]]
+
+
+def test_only_the_user_side_is_trimmed():
+    chat_history = turns(1, user_words=5000, answer_words=5000)
+    _, kept = history.window_history(chat_history, {"mode": "last_n", "max_turns": 6, "max_entry_tokens": 100})
+    assert history.estimate_tokens(kept[0]["user"]) <= 100
+    assert kept[0]["assistant"] == chat_history[0]["assistant"]
+    assert chat_history[0]["user"].endswith("word ")  # the original entry is left alone
+
+
+def test_token_budget_keeps_the_newest_turns_that_fit():
+    chat_history = turns(5)
+    per_turn = history.entry_tokens(chat_history[0])
+    evicted, kept = history.window_history(chat_history, {"mode": "token_budget", "max_turns": None},
+                                           budget=2 * per_turn + 1)
+    assert evicted == chat_history[:3]
+    assert kept == chat_history[3:]
+
+
+def test_newest_turn_is_kept_even_over_budget():
+    chat_history = turns(3, answer_words=3000)
+    evicted, kept = history.window_history(chat_history, {"mode": "token_budget", "max_turns": None}, budget=0)
+    assert kept == chat_history[-1:]
+    assert evicted == chat_history[:-1]
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        history.window_history([], {"mode": "everything"})
@@ -0,0 +1,124 @@
+import asyncio
+import json
+
+import pytest
+
+# quiz_validation imports the provider handlers; skip where the provider SDKs are not installed
+quiz_validation = pytest.importorskip("core_logic.quiz_validation")
+
+SETTINGS = {"questions_num": 2, "correct_ans_num": 1, "distractors_num": 2, "output_format": "plain text"}
+
+GOOD_1 = ("Question 1: What does a gradient point to?\n"
+          "A) The steepest ascent\nB) The minimum\nC) The origin\n"
+          "Solution: A\nFeedback: The gradient points uphill.\n")
+GOOD_2 = ("Question 2: What does the learning rate scale?\n"
+          "A) The batch size\nB) The step size\nC) The loss\n"
+          "Solution: B\n")
+BAD_1 = ("Question 1: What is a layer?\n"
+         "A) A matrix\nB) A function\n"
+         "Solution: A, B\n")
+BAD_2 = ("Question 2: What is a layer?\n"
+         "A) A matrix\nB) A function\n"
+         "Solution: A, B\n")
+
+
+def quiz(*questions, intro="Here is your quiz.\n\n", outro="\nGood luck!"):
+    return intro + "\n".join(questions) + outro
+
+
+def test_split_quiz_round_trips_the_text():
+    text = quiz(GOOD_1, GOOD_2)
+    segments, indexes = quiz_validation.split_quiz(text, "plain_text")
+    assert "".join(segments) == text
+    assert [segments[index].splitlines()[0] for index in indexes] == [GOOD_1.splitlines()[0], GOOD_2.splitlines()[0]]
+    assert segments[0] == "Here is your quiz.\n\n"
+
+
+def test_split_olx_quiz():
+    problem = ('<problem><multiplechoiceresponse><label>Q?</label><choicegroup>'
+               '<choice correct="true">yes</choice><choice correct="false">no</choice>'
+               '</choicegroup></multiplechoiceresponse></problem>')
+    text = f"OLX:\n{problem}\n{problem}\n"
+    segments, indexes = quiz_validation.split_quiz(text, "olx")
+    assert "".join(segments) == text and len(indexes) == 2
+    question = quiz_validation.parse_question(segments[indexes[0]], "olx")
+    assert question["stem"] == "Q?"
+    assert [option["correct"] for option in question["options"]] == [True, False]
+
+
+def test_check_quiz_reports_non_conforming_and_missing_questions():
+    report = quiz_validation.check_quiz(quiz(GOOD_1, BAD_2), {**SETTINGS, "questions_num": 3})
+    assert report["format"] == "plain_text"
+    assert report["questions"][0]["options"][0]["correct"] is True
+    assert report["questions"][0]["explanation"] == "The gradient points uphill."
+    assert set(report["issues"]) == {1}
+    assert any("2 correct option(s) instead of 1" in issue for issue in report["issues"][1])
+    assert report["missing"] == 1
+
+
+def test_check_quiz_of_an_unparseable_json_quiz():
+    report = quiz_validation.check_quiz("not json at all", {**SETTINGS, "structured_output": True})
+    assert report["format"] == "json"
+    assert report["questions"] is None and None in report["issues"]
+
+
+def fake_dispatch(replies, calls):
+    async def dispatch_completion(context, family, use_cache=True):
+        calls.append(context["user_prompt"])
+        context["TOTAL_PRICE"] += 0.01
+        return replies.pop(0)
+    return dispatch_completion
+
+
+def test_repair_quiz_replaces_only_the_bad_question(monkeypatch):
+    calls = []
+    monkeypatch.setattr(quiz_validation, "dispatch_completion", fake_dispatch(["Sure:\n\n" + GOOD_1], calls))
+    text = quiz(BAD_1, GOOD_2)
+    repaired, report = asyncio.run(quiz_validation.repair_quiz(text, {"TOTAL_PRICE": 0}, "openai",
+                                                               lambda user_input: "PROMPT", SETTINGS))
+    assert len(calls) == 1
+    assert "What does the learning rate scale?" in calls[0] and calls[0].endswith("PROMPT")
+    assert repaired == quiz(GOOD_1, GOOD_2)
+    assert report["regenerated"] == 1 and report["remaining"] == {}
+    assert report["cost"] == pytest.approx(0.01)
+
+
+def test_repair_quiz_fills_missing_and_drops_surplus_questions(monkeypatch):
+    calls = []
+    monkeypatch.setattr(quiz_validation, "dispatch_completion", fake_dispatch([GOOD_2], calls))
+    repaired, report = asyncio.run(quiz_validation.repair_quiz(quiz(GOOD_1, outro=""), {"TOTAL_PRICE": 0}, "openai",
+                                                               lambda user_input: "PROMPT", SETTINGS))
+    assert quiz_validation.check_quiz(repaired, SETTINGS)["issues"] == {}
+    assert "What does the learning rate scale?" in repaired
+
+    calls = []
+    monkeypatch.setattr(quiz_validation, "dispatch_completion", fake_dispatch([], calls))
+    repaired, report = asyncio.run(quiz_validation.repair_quiz(quiz(GOOD_1, BAD_2, GOOD_2), {"TOTAL_PRICE": 0},
+                                                               "openai", lambda user_input: "PROMPT", SETTINGS))
+    assert calls == [] and report["removed"] == 1
+    assert "What is a layer?" not in repaired
+
+
+def test_repair_quiz_keeps_a_still_invalid_question(monkeypatch):
+    calls = []
+    monkeypatch.setattr(quiz_validation, "dispatch_completion", fake_dispatch([BAD_2, BAD_2], calls))
+    text = quiz(GOOD_1, BAD_2)
+    repaired, report = asyncio.run(quiz_validation.repair_quiz(text, {"TOTAL_PRICE": 0}, "openai",
+                                                               lambda user_input: "PROMPT", SETTINGS, max_rounds=2))
+    assert len(calls) == 2
+    assert repaired == text
+    assert set(report["remaining"]) == {1}
+
+
+def test_repair_json_quiz(monkeypatch):
+    good = {"stem": "Pick one", "options": [{"text": "a", "correct": True}, {"text": "b", "correct": False},
+                                            {"text": "c", "correct": False}]}
+    bad = {"stem": "Pick none", "options": [{"text": "a", "correct": False}, {"text": "b", "correct": False}]}
+    calls = []
+    monkeypatch.setattr(quiz_validation, "dispatch_completion",
+                        fake_dispatch([json.dumps({"questions": [good]})], calls))
+    repaired, report = asyncio.run(quiz_validation.repair_quiz(
+        json.dumps({"questions": [good, bad]}), {"TOTAL_PRICE": 0}, "openai", lambda user_input: "PROMPT",
+        {**SETTINGS, "structured_output": True}))
+    assert json.loads(repaired)["questions"] == [good, good]
+    assert report["regenerated"] == 1
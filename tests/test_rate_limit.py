@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from core_logic import rate_limit
+from core_logic.rate_limit import RateLimiter, MemoryBucketStore, SQLiteBucketStore, _refill_and_take
+
+
+def test_full_bucket_admits_and_takes():
+    state, wait = _refill_and_take(None, {"rpm": 60, "tpm": 1000}, 100, now=0.0)
+    assert wait == 0
+    assert state == (59, 900, 0.0)
+
+
+def test_empty_bucket_waits_for_refill():
+    limits = {"rpm": 60, "tpm": 1000}
+    state, wait = _refill_and_take((0, 1000, 0.0), limits, 100, now=0.0)
+    assert wait == pytest.approx(1.0)
+    assert state[:2] == (0, 1000)  # nothing taken
+    state, wait = _refill_and_take(state, limits, 100, now=1.0)
+    assert wait == 0
+    assert state[0] == pytest.approx(0)
+
+
+def test_token_bucket_wait_and_oversize_request():
+    limits = {"tpm": 600}
+    _, wait = _refill_and_take((0, 100, 0.0), limits, 300, now=0.0)
+    assert wait == pytest.approx(20.0)
+    # a request larger than the bucket goes once the bucket is full
+    state, wait = _refill_and_take((0, 600, 0.0), limits, 5000, now=0.0)
+    assert wait == 0
+    assert state[1] == 0
+
+
+def test_provider_without_limits_is_not_limited():
+    limiter = RateLimiter({"openai": {"rpm": 1}})
+    calls = []
+
+    async def main():
+        for _ in range(5):
+            await limiter.acquire("claude", "key", 10, on_queue=lambda *args: calls.append(args))
+
+    asyncio.run(asyncio.wait_for(main(), 1))
+    assert calls == []
+
+
+def test_waiting_calls_are_admitted_in_fifo_order(monkeypatch):
+    monkeypatch.setattr(rate_limit, "POLL_INTERVAL", 0.01)
+    # one request up front, then one every 0.05s
+    limiter = RateLimiter({"openai": {"rpm": 1200}})
+    limiter.store._states["openai:" + rate_limit.hash_api_key("key")] = (1, 0, rate_limit.time.time())
+    admitted, positions = [], {}
+
+    async def call(name):
+        await limiter.acquire("openai", "key", 10,
+                              on_queue=lambda position, wait: positions.setdefault(name, []).append(position))
+        admitted.append(name)
+
+    async def main():
+        tasks = []
+        for name in "abcd":
+            tasks.append(asyncio.ensure_future(call(name)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(asyncio.wait_for(main(), 5))
+    assert admitted == list("abcd")
+    assert "a" not in positions
+    assert positions["d"][0] == 3 and positions["d"][-1] == 0
+    assert limiter.queue_length("openai", "key") == 0
+
+
+def test_keys_have_separate_buckets():
+    store = MemoryBucketStore()
+    limits = {"rpm": 1}
+    assert store.take("openai:a", limits, 0) == 0
+    assert store.take("openai:a", limits, 0) > 0
+    assert store.take("openai:b", limits, 0) == 0
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "buckets.db")
+    limits = {"rpm": 2}
+    first, second = SQLiteBucketStore(path), SQLiteBucketStore(path)
+    assert first.take("openai:k", limits, 0) == 0
+    assert second.take("openai:k", limits, 0) == 0
+    assert first.take("openai:k", limits, 0) > 0
+
+
+def test_configure_switches_to_the_shared_store(tmp_path):
+    limiter = RateLimiter()
+    limiter.configure({"openai": {"rpm": 10}}, shared_path=str(tmp_path / "buckets.db"))
+    assert limiter.limits == {"openai": {"rpm": 10}}
+    assert isinstance(limiter.store, SQLiteBucketStore) and limiter.store.blocking
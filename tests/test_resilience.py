@@ -0,0 +1,182 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from core_logic import resilience
+from core_logic.resilience import (
+    AuthenticationError, CircuitBreaker, CircuitOpenError, InvalidRequestError, ProviderError, ProviderTimeout,
+    ProviderUnavailable, RateLimitError, call_with_resilience, classify_error, parse_retry_after,
+    stream_with_resilience,
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_policies(monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(resilience, "_retry_policy", {**resilience.DEFAULT_RETRY_POLICY, "base_delay": 0.001})
+    monkeypatch.setattr(resilience, "_breaker_policy", dict(resilience.DEFAULT_CIRCUIT_BREAKER))
+
+
+class HTTPError(Exception):
+    def __init__(self, status, headers=None):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+        self.response = SimpleNamespace(status_code=status, headers=headers or {})
+
+
+@pytest.mark.parametrize("status, error_type", [
+    (429, RateLimitError), (401, AuthenticationError), (403, AuthenticationError), (503, ProviderUnavailable),
+    (529, ProviderUnavailable), (400, InvalidRequestError), (404, InvalidRequestError),
+])
+def test_classify_error_by_status(status, error_type):
+    error = classify_error(HTTPError(status), "openai")
+    assert type(error) is error_type
+    assert error.status == status and error.provider == "openai"
+
+
+def test_classify_error_without_status():
+    assert type(classify_error(asyncio.TimeoutError(), "claude")) is ProviderTimeout
+    assert type(classify_error(ConnectionResetError(), "claude")) is ProviderUnavailable
+    assert type(classify_error(KeyError("x"), "claude")) is ProviderError
+    typed = InvalidRequestError("bad")
+    assert classify_error(typed, "gemini") is typed and typed.provider == "gemini"
+
+
+def test_retry_after_headers():
+    assert parse_retry_after({"retry-after": "7"}) == 7.0
+    assert parse_retry_after({"retry-after-ms": "1500", "retry-after": "7"}) == 1.5
+    assert parse_retry_after({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0.0
+    assert parse_retry_after({"retry-after": "soon"}) is None
+    assert parse_retry_after(None) is None
+    assert classify_error(HTTPError(429, {"retry-after": "3"}), "openai").retry_after == 3.0
+
+
+def test_breaker_opens_after_threshold_and_allows_a_single_trial(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: clock[0])
+    breaker = CircuitBreaker("openai", failure_threshold=2, reset_timeout=10)
+    outage = ProviderUnavailable("down")
+
+    breaker.record_failure(InvalidRequestError("bad"))  # not an outage
+    breaker.record_failure(outage)
+    assert breaker.state == "closed"
+    breaker.record_failure(outage)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock[0] += 10
+    assert breaker.state == "half_open"
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one trial at a time
+
+    # a failed trial reopens the breaker at once
+    breaker.record_failure(outage)
+    assert breaker.state == "open"
+    clock[0] += 10
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+    breaker.before_call()
+
+
+def test_cancelled_trial_frees_the_half_open_slot(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: clock[0])
+    breaker = resilience.get_breaker("openai")
+    breaker.failure_threshold = 1
+    breaker.record_failure(ProviderUnavailable("down"))
+    clock[0] += breaker.reset_timeout
+
+    async def main():
+        task = asyncio.ensure_future(call_with_resilience("openai", lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert breaker.state == "half_open" and not breaker.trial_running
+
+
+def test_call_is_retried_until_it_succeeds():
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise HTTPError(503)
+        return "ok"
+
+    assert asyncio.run(call_with_resilience("openai", call)) == "ok"
+    assert len(attempts) == 3
+    assert resilience.get_breaker("openai").failures == 0
+
+
+def test_invalid_request_is_not_retried():
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise HTTPError(400)
+
+    with pytest.raises(InvalidRequestError):
+        asyncio.run(call_with_resilience("openai", call))
+    assert len(attempts) == 1
+
+
+def test_retries_stop_at_max_attempts():
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise HTTPError(429)
+
+    with pytest.raises(RateLimitError):
+        asyncio.run(call_with_resilience("openai", call))
+    assert len(attempts) == resilience.DEFAULT_RETRY_POLICY["max_attempts"]
+
+
+def test_retry_after_beyond_the_limit_is_not_waited_for():
+    error = RateLimitError("slow down", retry_after=3600)
+    assert resilience.backoff_delay(0, error) is None
+    assert resilience.backoff_delay(0, RateLimitError("slow down", retry_after=0.5)) >= 0.5
+
+
+def collect(stream):
+    async def main():
+        return [chunk async for chunk in stream]
+    return asyncio.run(main())
+
+
+def test_stream_is_retried_before_the_first_chunk():
+    opened = []
+
+    async def open_stream():
+        opened.append(1)
+        if len(opened) == 1:
+            raise HTTPError(502)
+        yield "a"
+        yield "b"
+
+    assert collect(stream_with_resilience("claude", open_stream)) == ["a", "b"]
+    assert len(opened) == 2
+
+
+def test_stream_is_not_retried_after_output():
+    opened, received = [], []
+
+    async def open_stream():
+        opened.append(1)
+        yield "a"
+        raise HTTPError(502)
+
+    async def main():
+        async for chunk in stream_with_resilience("claude", open_stream):
+            received.append(chunk)
+
+    with pytest.raises(ProviderUnavailable):
+        asyncio.run(main())
+    assert received == ["a"] and len(opened) == 1
@@ -0,0 +1,27 @@
+import pytest
+
+# scoring imports the provider handlers; skip where the provider SDKs are not installed
+scoring = pytest.importorskip("core_logic.scoring")
+
+
+def test_nested_criteria():
+    assert scoring.parse_score('{"criteria": {"clarity": 3, "accuracy": "4/5"}, "total": 7}') == \
+        {"total": 7, "criteria": {"clarity": 3, "accuracy": 4}}
+
+
+def test_fenced_reply_with_text_around_it():
+    reply = 'Here you go:\n```json\n{"criteria": {"clarity": 2.5}, "Total": "2.5 points"}\n```'
+    assert scoring.parse_score(reply) == {"total": 2.5, "criteria": {"clarity": 2.5}}
+
+
+def test_flat_format_and_missing_total():
+    assert scoring.parse_score('{"clarity": 2, "accuracy": 3, "comment": "fine"}') == \
+        {"total": 5, "criteria": {"clarity": 2, "accuracy": 3}}
+
+
+@pytest.mark.parametrize("reply", [
+    "", "Score: 7", '{"criteria": {}}', '{"total": true}', "{not json}", "[1, 2]",
+])
+def test_unusable_replies(reply):
+    with pytest.raises(scoring.ScoreParseError):
+        scoring.parse_score(reply)
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from core_logic.single_flight import SingleFlight
+
+
+def shared_call(started, release, result="quiz", cost=0.3, chunks=()):
+    """A start() that counts its calls, publishes chunks and waits for `release`."""
+    async def start(context, publish):
+        started.append(context)
+        for chunk in chunks:
+            publish(chunk)
+        await release.wait()
+        context["TOTAL_PRICE"] += cost
+        context["usage"] = {"output_tokens": 10}
+        return result
+    return start
+
+
+def test_identical_requests_share_one_call_and_split_its_cost():
+    flights = SingleFlight()
+    started = []
+
+    async def main():
+        release = asyncio.Event()
+        contexts = [{"model": "m", "TOTAL_PRICE": 0} for _ in range(3)]
+        tasks = [asyncio.ensure_future(flights.run("key", context, shared_call(started, release)))
+                 for context in contexts]
+        await asyncio.sleep(0)
+        assert flights.in_flight() == 1
+        release.set()
+        return await asyncio.gather(*tasks), contexts
+
+    results, contexts = asyncio.run(main())
+    assert results == ["quiz"] * 3
+    assert len(started) == 1
+    assert [context["TOTAL_PRICE"] for context in contexts] == pytest.approx([0.1] * 3)
+    assert all(context["coalesced"] == 3 and context["usage"] == {"output_tokens": 10} for context in contexts)
+    assert flights.in_flight() == 0
+
+
+def test_key_none_never_shares():
+    flights = SingleFlight()
+    started = []
+
+    async def main():
+        release = asyncio.Event()
+        release.set()
+        start = shared_call(started, release)
+        return await asyncio.gather(flights.run(None, {"TOTAL_PRICE": 0}, start),
+                                    flights.run(None, {"TOTAL_PRICE": 0}, start))
+
+    assert asyncio.run(main()) == ["quiz", "quiz"]
+    assert len(started) == 2
+
+
+def test_leaving_waiter_is_not_charged_and_equal_contexts_stay_apart():
+    flights = SingleFlight()
+    started = []
+
+    async def main():
+        release = asyncio.Event()
+        # coalesced requests have equal contexts; only the one that left may be dropped
+        staying, leaving = {"model": "m", "TOTAL_PRICE": 0}, {"model": "m", "TOTAL_PRICE": 0}
+        start = shared_call(started, release)
+        stay = asyncio.ensure_future(flights.run("key", staying, start))
+        leave = asyncio.ensure_future(flights.run("key", leaving, start))
+        await asyncio.sleep(0)
+        leave.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await stay == "quiz"
+        assert leave.cancelled()
+        return staying, leaving
+
+    staying, leaving = asyncio.run(main())
+    assert staying["TOTAL_PRICE"] == pytest.approx(0.3) and staying["coalesced"] == 1
+    assert leaving["TOTAL_PRICE"] == 0 and "coalesced" not in leaving
+
+
+def test_flight_is_cancelled_only_when_every_waiter_left():
+    flights = SingleFlight()
+    started = []
+
+    async def main():
+        release = asyncio.Event()
+        start = shared_call(started, release)
+        first = asyncio.ensure_future(flights.run("key", {"TOTAL_PRICE": 0}, start))
+        second = asyncio.ensure_future(flights.run("key", {"TOTAL_PRICE": 0}, start))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        assert flights.in_flight() == 1
+        second.cancel()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return flights.in_flight()
+
+    assert asyncio.run(main()) == 0
+
+
+def test_late_stream_waiter_replays_earlier_chunks():
+    flights = SingleFlight()
+    started = []
+
+    async def read(context, start):
+        return [chunk async for chunk in flights.stream("key", context, start)]
+
+    async def main():
+        release = asyncio.Event()
+        start = shared_call(started, release, result="ab", chunks=("a", "b"))
+        early = asyncio.ensure_future(read({"TOTAL_PRICE": 0}, start))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        late = asyncio.ensure_future(read({"TOTAL_PRICE": 0}, start))
+        await asyncio.sleep(0)
+        release.set()
+        return await early, await late
+
+    assert asyncio.run(main()) == (["a", "b"], ["a", "b"])
+    assert len(started) == 1
+
+
+def test_stream_of_a_flight_that_did_not_stream_yields_the_result():
+    flights = SingleFlight()
+
+    async def main():
+        release = asyncio.Event()
+        release.set()
+        return [chunk async for chunk in flights.stream("key", {"TOTAL_PRICE": 0}, shared_call([], release))]
+
+    assert asyncio.run(main()) == ["quiz"]
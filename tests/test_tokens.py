@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from core_logic.llm_config import LLM_CONFIG
+from core_logic.tokens import ContextWindowExceeded, estimate_tokens, preflight, trim_to_tokens
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("a" * 400) == 101
+    # short words: never fewer tokens than about three quarters of the word count
+    assert estimate_tokens("a " * 100) == 76
+
+
+def test_preflight_budget():
+    report = preflight({"model": "m", "user_prompt": "x" * 4000, "max_tokens": 1000, "context_window": 2000,
+                        "price_input_token_1M": 1, "price_output_token_1M": 2})
+    assert report["available_prompt_tokens"] == 900
+    assert report["prompt_tokens"] > 1000 and not report["fits"]
+    assert report["projected_cost"] == pytest.approx((report["prompt_tokens"] + 2000) / 1e6)
+
+
+@pytest.mark.parametrize("name", sorted(LLM_CONFIG))
+def test_every_model_leaves_room_for_a_prompt(name):
+    report = preflight({**LLM_CONFIG[name], "user_prompt": "word " * 1000})
+    assert report["fits"], f"{name}: max_tokens leaves no room for a prompt"
+
+
+def test_trim_to_tokens_prefers_a_sentence_boundary():
+    text = "First sentence here. " * 50
+    trimmed = trim_to_tokens(text, 40)
+    assert estimate_tokens(trimmed) <= 40
+    assert trimmed.endswith(".")
+    assert trim_to_tokens("short", 40) == "short"
+    assert trim_to_tokens("anything", 0) == ""
+
+
+def test_map_reduce_refuses_a_prompt_without_room_for_content():
+    map_reduce = pytest.importorskip("core_logic.map_reduce")
+    context = {"model": "m", "max_tokens": 1000, "context_window": 2000, "chat_history": []}
+
+    with pytest.raises(ContextWindowExceeded):
+        asyncio.run(map_reduce.map_reduce_questions(context, "openai", lambda user_input: "x" * 8000,
+                                                    {"topic_content": "some transcript. " * 100}))